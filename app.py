@@ -0,0 +1,42 @@
+from kivy.app import App
+from kivy.uix.screenmanager import ScreenManager
+from register import RegistrationScreen
+from verify import VerificationScreen
+from welcome import WelcomeScreen
+from dashboard import DashboardScreen
+from utils.device_manager import DeviceManager
+from utils.camera import CameraHandler
+from utils.face_pool import FaceEncodingPool
+from others.election import ElectionScreen  # ✅ Add this
+
+
+class VoteLinkApp(App):
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.verified_user = None
+        self.verified_user_name = None
+
+    def build(self):
+        # The face encoding pool starts on the first capture
+        self.sm = ScreenManager()
+        # self.sm.add_widget(DashboardScreen(name='dashboard'))
+        # self.sm.add_widget(ElectionScreen(name='election'))
+        self.sm.add_widget(WelcomeScreen(name='welcome'))
+        self.sm.add_widget(DashboardScreen(name='dashboard'))
+        self.sm.add_widget(VerificationScreen(name='verify'))
+        self.sm.add_widget(RegistrationScreen(name='register'))
+        self.sm.add_widget(ElectionScreen(name='election'))
+
+        return self.sm
+
+    def on_stop(self):
+        # Close the shared serial devices
+        DeviceManager().shutdown()
+        if CameraHandler._instance is not None:
+            CameraHandler._instance.shutdown()
+        FaceEncodingPool().shutdown()
+
+    def go_to_election_screen(self):
+        self.sm.current = 'election'
+
@@ -0,0 +1,192 @@
+import os
+import logging
+import argparse
+import statistics
+from typing import Dict, List, Optional
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+# FacePipeline imports Kivy (for its worker's Clock); keep Kivy from
+# parsing this script's arguments
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+
+from utils.face_profiles import (
+    PROFILES, FaceEngineProfile, load_face_profile, save_face_profile)
+from utils.face_pipeline import FacePipeline, FACE_RECOGNITION_AVAILABLE
+from utils.face_pool import FaceEncodingPool
+from utils.face_tracker import FaceTracker
+from utils.frame_quality import FrameQualityGate
+
+# Configure logging
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BenchmarkConfig:
+    """Configuration for the face profile benchmark"""
+    samples_dir: str = 'data/face_samples'  # <person>/<image>.jpg
+    max_far: float = 0.001  # Highest acceptable false accept rate
+    min_tar: float = 0.95   # Lowest acceptable true accept rate
+
+
+class BenchmarkError(Exception):
+    """Custom exception for benchmark errors"""
+    pass
+
+
+def load_samples(samples_dir: str) -> Dict[str, List[np.ndarray]]:
+    """{person: [BGR image, ...]} from a directory per person"""
+    if not os.path.isdir(samples_dir):
+        raise BenchmarkError(f"Sample set not found: {samples_dir}")
+    samples = {}
+    for person in sorted(os.listdir(samples_dir)):
+        person_dir = os.path.join(samples_dir, person)
+        if not os.path.isdir(person_dir):
+            continue
+        images = [cv2.imread(os.path.join(person_dir, name))
+                  for name in sorted(os.listdir(person_dir))
+                  if name.lower().endswith(('.jpg', '.jpeg', '.png'))]
+        images = [image for image in images if image is not None]
+        if len(images) >= 2:
+            samples[person] = images
+    if len(samples) < 2:
+        raise BenchmarkError("Need at least 2 people with 2+ images each")
+    return samples
+
+
+def encode_sample(pipeline: FacePipeline, image: np.ndarray):
+    """(encoding or None, passed quality gate, timings) for one image.
+
+    Runs what a capture runs: the preview tracker and quality gate supply
+    the face region, then FacePipeline.process() detects and encodes
+    (in the FaceEncodingPool when it is running).
+    """
+    tracker = FaceTracker()
+    gate = FrameQualityGate(tracker=tracker, every=1)
+    tracker.update(image, 1)
+    quality = gate.assess(image)
+    result = pipeline.process(image, face_box=quality['face_box'])
+    return result['encoding'], quality['ok'], result['timings']
+
+
+def benchmark_profile(profile: FaceEngineProfile,
+                      samples: Dict[str, List[np.ndarray]]) -> Dict:
+    """Enroll each person's first image, probe with the rest.
+
+    True accepts: a probe within tolerance of its own enrollment. False
+    accepts: a probe within tolerance of anyone else's enrollment.
+    """
+    pipeline = FacePipeline(profile)
+    detect_ms, encode_ms, total_ms, misses, gated = [], [], [], 0, 0
+    encodings = {}
+    for person, images in samples.items():
+        encodings[person] = []
+        for image in images:
+            encoding, passed, timings = encode_sample(pipeline, image)
+            gated += not passed
+            detect_ms.append(timings.get('detect', 0.0))
+            total_ms.append(timings['total'])
+            if encoding is None:
+                misses += 1
+                continue
+            encode_ms.append(timings.get('encode', 0.0))
+            encodings[person].append(encoding)
+
+    enrolled = {p: e[0] for p, e in encodings.items() if e}
+    if len(enrolled) < 2:
+        raise BenchmarkError(
+            f"Profile {profile.name} found a face for {len(enrolled)} of "
+            f"{len(samples)} people; check the sample images")
+    people = list(enrolled)
+    gallery = np.array([enrolled[p] for p in people])
+    genuine = accepted = impostor = false_accepts = 0
+    for person, person_encodings in encodings.items():
+        for probe in person_encodings[1:]:
+            distances = np.linalg.norm(gallery - probe, axis=1)
+            for other, distance in zip(people, distances):
+                if other == person:
+                    genuine += 1
+                    accepted += distance <= profile.tolerance
+                else:
+                    impostor += 1
+                    false_accepts += distance <= profile.tolerance
+
+    images = sum(len(v) for v in samples.values())
+    return {
+        'profile': profile.name,
+        'detect_ms': statistics.mean(detect_ms),
+        'encode_ms': statistics.mean(encode_ms) if encode_ms else 0.0,
+        'total_ms': statistics.mean(total_ms),
+        'gate_rate': 1 - gated / images,
+        'detection_rate': 1 - misses / images,
+        'tar': accepted / genuine if genuine else 0.0,
+        'far': false_accepts / impostor if impostor else 0.0,
+    }
+
+
+def pick_profile(results: List[Dict], config: BenchmarkConfig) -> Optional[str]:
+    """Fastest profile meeting the accuracy targets"""
+    acceptable = [r for r in results
+                  if r['tar'] >= config.min_tar and r['far'] <= config.max_far]
+    if not acceptable:
+        return None
+    return min(acceptable, key=lambda r: r['total_ms'])['profile']
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure face profile latency and accuracy on a sample set")
+    parser.add_argument('--samples', default='data/face_samples',
+                        help="Directory with one sub-directory of images per person")
+    parser.add_argument('--profiles', nargs='+', default=list(PROFILES),
+                        choices=list(PROFILES))
+    parser.add_argument('--min-tar', type=float, default=0.95)
+    parser.add_argument('--max-far', type=float, default=0.001)
+    parser.add_argument('--save', action='store_true',
+                        help="Save the fastest acceptable profile as the default")
+    args = parser.parse_args()
+
+    config = BenchmarkConfig(samples_dir=args.samples, min_tar=args.min_tar,
+                             max_far=args.max_far)
+    try:
+        if not FACE_RECOGNITION_AVAILABLE:
+            raise BenchmarkError("face_recognition is not installed")
+        samples = load_samples(config.samples_dir)
+        logger.info(f"Sample set: {len(samples)} people, "
+                    f"{sum(len(v) for v in samples.values())} images")
+        logger.info(f"Current profile: {load_face_profile().name}")
+        # Encode in worker processes, as captures in the app do
+        FaceEncodingPool().start()
+
+        results = []
+        for name in args.profiles:
+            result = benchmark_profile(PROFILES[name], samples)
+            results.append(result)
+            logger.info(
+                f"{name:<9} detect {result['detect_ms']:7.1f} ms  "
+                f"encode {result['encode_ms']:7.1f} ms  "
+                f"total {result['total_ms']:7.1f} ms  "
+                f"gate {result['gate_rate']:.3f}  "
+                f"found {result['detection_rate']:.3f}  "
+                f"TAR {result['tar']:.3f}  FAR {result['far']:.4f}")
+
+        best = pick_profile(results, config)
+        if best is None:
+            logger.warning("No profile meets the accuracy targets")
+        else:
+            logger.info(f"Fastest acceptable profile: {best}")
+            if args.save:
+                save_face_profile(PROFILES[best])
+                logger.info("Saved as the deployment profile")
+    except BenchmarkError as e:
+        logger.error(f"Benchmark error: {str(e)}")
+    finally:
+        FaceEncodingPool().shutdown()
+
+
+if __name__ == "__main__":
+    main()
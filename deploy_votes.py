@@ -9,6 +9,8 @@ from typing import Dict, List, Optional
 from dataclasses import dataclass
 import time
 
+from utils.voter_index import VoterIndex
+
 # Configure logging
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
@@ -25,6 +27,7 @@ class VotingConfig:
     contract_address: str
     contract_abi_path: str = "Contract.abi.json"
     commit_file: str = "votes/commit.json"
+    voter_index_file: str = "data/voter_index.json"
     secrets_file: str = "votes/secrets.json"
     chain_id: int = 80002  # Polygon Mumbai Testnet
     gas_limit: int = 500_000
@@ -136,6 +139,36 @@ class BlockchainVotingSystem:
                     raise VotingSystemError(
                         f"Transaction failed after {self.config.max_retries} attempts: {str(e)}")
 
+    def _load_commits(self) -> Dict:
+        """Export the commit file from the voter index, then load it.
+
+        Without a local voter index (e.g. a commit file copied off the
+        machine) the commit file is used as is.
+        """
+        if os.path.exists(self.config.voter_index_file):
+            try:
+                VoterIndex(index_file=self.config.voter_index_file,
+                           migrate_legacy=False).export_commits(
+                               self.config.commit_file)
+            except Exception as e:
+                raise VotingSystemError(f"Error exporting commits: {str(e)}")
+        return self._load_json_file(self.config.commit_file)
+
+    def _load_secrets(self) -> Dict:
+        """Export the secrets file from the voter index, then load it.
+
+        The index journals each secret with its commit; secrets already in
+        the file are kept.
+        """
+        if os.path.exists(self.config.voter_index_file):
+            try:
+                VoterIndex(index_file=self.config.voter_index_file,
+                           migrate_legacy=False).export_secrets(
+                               self.config.secrets_file)
+            except Exception as e:
+                raise VotingSystemError(f"Error exporting secrets: {str(e)}")
+        return self._load_json_file(self.config.secrets_file)
+
     def _load_json_file(self, filepath: str) -> Dict:
         """Safely load JSON file with validation"""
         try:
@@ -172,7 +205,7 @@ class BlockchainVotingSystem:
 
     def commit_votes(self) -> List[str]:
         """Commit all votes from the commit file"""
-        commit_data = self._load_json_file(self.config.commit_file)
+        commit_data = self._load_commits()
 
         if not commit_data:
             raise VotingSystemError("No votes to commit")
@@ -234,8 +267,8 @@ class BlockchainVotingSystem:
         # self.start_reveal_phase()
 
         # Load data files
-        commit_data = self._load_json_file(self.config.commit_file)
-        secrets_data = self._load_json_file(self.config.secrets_file)
+        commit_data = self._load_commits()
+        secrets_data = self._load_secrets()
 
         if not secrets_data:
             raise VotingSystemError("No secrets to reveal")
@@ -28,17 +28,17 @@ import requests
 import json as json_lib
 import secrets
 
-# Import the fingerprint reader
+# Import the shared device manager (owns the fingerprint reader)
 try:
-    from utils.fingerprint import FingerprintReader
+    from utils.device_manager import DeviceManager
 except ImportError:
     print("Warning: Fingerprint reader not available")
-    FingerprintReader = None
+    DeviceManager = None
+
+from utils.voter_index import VoterIndex
 
 # Paths - ensure directory exists
 VOTES_DIR = 'votes'
-COMMIT_FILE = os.path.join(VOTES_DIR, 'commit.json')
-SECRETS_FILE = os.path.join(VOTES_DIR, 'secrets.json')
 
 # Create votes directory if it doesn't exist
 os.makedirs(VOTES_DIR, exist_ok=True)
@@ -194,21 +194,23 @@ class VoteConfirmationPopup(Popup):
 class FingerprintVerificationPopup(Popup):
     """Popup for fingerprint verification before vote submission"""
 
-    def __init__(self, candidate_id, on_verify_success, on_verify_fail, **kwargs):
+    def __init__(self, candidate_id, on_verify_success, on_verify_fail,
+                 voter=None, **kwargs):
         super().__init__(**kwargs)
         self.candidate_id = candidate_id
+        self.voter = voter  # Verified voter record for 1:1 matching
         self.on_verify_success = on_verify_success
         self.on_verify_fail = on_verify_fail
         self.title = 'Fingerprint Verification Required'
         self.size_hint = (0.8, 0.6)
         self.auto_dismiss = False
 
-        # Initialize fingerprint reader
-        self.fingerprint_reader = None
+        # Lease on the shared fingerprint reader
+        self.fingerprint = None
         self.verification_in_progress = False
 
         self.setup_ui()
-        if FingerprintReader:
+        if DeviceManager:
             self.start_fingerprint_verification()
         else:
             self.update_status(
@@ -300,7 +302,7 @@ class FingerprintVerificationPopup(Popup):
 
     def start_fingerprint_verification(self):
         """Start fingerprint verification in background thread"""
-        if self.verification_in_progress or not FingerprintReader:
+        if self.verification_in_progress or not DeviceManager:
             return
 
         self.verification_in_progress = True
@@ -317,9 +319,8 @@ class FingerprintVerificationPopup(Popup):
             Clock.schedule_once(lambda dt: self.update_status(
                 "Connecting to fingerprint sensor..."), 0)
 
-            self.fingerprint_reader = FingerprintReader(
-                port='/dev/serial0',  # Adjust port as needed
-                baudrate=57600,
+            self.fingerprint = DeviceManager().lease(
+                'fingerprint', self,
                 logger=lambda msg: Clock.schedule_once(
                     lambda dt: self.update_status(msg), 0)
             )
@@ -327,8 +328,13 @@ class FingerprintVerificationPopup(Popup):
             Clock.schedule_once(lambda dt: self.update_status(
                 "Place your finger on the sensor..."), 0)
 
-            # Attempt fingerprint verification
-            finger_id, confidence = self.fingerprint_reader.search_finger()
+            # Attempt fingerprint verification, 1:1 when the slot is known
+            if self.voter:
+                matched, confidence = self.fingerprint.call(
+                    'verify_voter', self.voter)
+                finger_id = self.voter.get('fingerprint_id') if matched else None
+            else:
+                finger_id, confidence = self.fingerprint.call('search_finger')
 
             if finger_id is not None:
                 Clock.schedule_once(
@@ -342,8 +348,6 @@ class FingerprintVerificationPopup(Popup):
                 f"Fingerprint reader error: {str(e)}"), 0)
         finally:
             self.verification_in_progress = False
-            if self.fingerprint_reader:
-                self.fingerprint_reader.cleanup()
 
     def update_status(self, message):
         """Update status label on main thread"""
@@ -376,8 +380,8 @@ class FingerprintVerificationPopup(Popup):
     def cancel_verification(self, instance):
         """Cancel fingerprint verification"""
         self.verification_in_progress = False
-        if self.fingerprint_reader:
-            self.fingerprint_reader.cleanup()
+        if self.fingerprint:
+            self.fingerprint.release()
         self.dismiss()
         self.on_verify_fail("Verification cancelled by user")
 
@@ -1053,7 +1057,8 @@ class ElectionScreen(Screen):
         fingerprint_popup = FingerprintVerificationPopup(
             candidate_id=candidate_id,
             on_verify_success=self.submit_vote,
-            on_verify_fail=self.verification_failed
+            on_verify_fail=self.verification_failed,
+            voter=self.verified_user
         )
         fingerprint_popup.open()
 
@@ -1082,8 +1087,8 @@ class ElectionScreen(Screen):
                     f"Submitting vote for {name} (UID: {uid}) for candidate {candidate_id}")
 
                 # Check if user has already voted
-                commits = load_json(COMMIT_FILE)
-                if uid in commits:
+                voter_index = VoterIndex()
+                if voter_index.has_voted(uid):
                     Clock.schedule_once(lambda dt: self.vote_error(
                         loading_popup, "You have already voted!"), 0)
                     return
@@ -1140,33 +1145,37 @@ class ElectionScreen(Screen):
                 # Only proceed with local storage if IPFS upload succeeded
                 print("IPFS upload successful, proceeding with local storage...")
 
-                # Save commit locally (only after IPFS success)
-                commits[uid] = {
+                # Save commit and secret locally (only after IPFS success).
+                # The commit, the reveal secret and the has_voted flag land
+                # in the same journal append; deploy_votes.py exports
+                # votes/commit.json and votes/secrets.json from the index.
+                commit = {
                     "vote_hash": vote_hash,
                     "timestamp": datetime.now().isoformat(),
                     "candidate_id": candidate_id,
                     "ipfs_cid": ipfs_cid  # Store the CID with the commit
                 }
-
-                if not save_json(COMMIT_FILE, commits):
-                    Clock.schedule_once(lambda dt: self.vote_error(
-                        loading_popup, "Failed to save vote commit locally"), 0)
-                    return
-
-                # Save secret separately for reveal phase (only after IPFS success)
-                secrets_data = load_json(SECRETS_FILE)
-                secrets_data[uid] = {
+                secret = {
                     "secret": salt,
                     "candidate_id": candidate_id,
-                    "timestamp": datetime.now().isoformat(),
+                    "timestamp": commit["timestamp"],
                     "ipfs_cid": ipfs_cid  # Store the CID with the secret too
                 }
 
-                if not save_json(SECRETS_FILE, secrets_data):
+                try:
+                    if not voter_index.record_vote(uid, commit, secret):
+                        Clock.schedule_once(lambda dt: self.vote_error(
+                            loading_popup, "You have already voted!"), 0)
+                        return
+                except (IOError, OSError) as e:
+                    print(f"Error saving vote commit: {e}")
                     Clock.schedule_once(lambda dt: self.vote_error(
-                        loading_popup, "Failed to save vote secret locally"), 0)
+                        loading_popup, "Failed to save vote commit locally"), 0)
                     return
 
+                if self.verified_user:
+                    self.verified_user['has_voted'] = True
+
                 # Vote is only successful if IPFS upload succeeded
                 candidate_name = self.candidates.get(
                     candidate_id, f"Candidate {candidate_id}")
@@ -1264,8 +1273,9 @@ def verify_vote(uid, candidate_id, secret, stored_hash):
 
 def get_vote_statistics():
     """Get voting statistics from stored commits"""
-    commits = load_json(COMMIT_FILE)
-    secrets = load_json(SECRETS_FILE)
+    voter_index = VoterIndex()
+    commits = voter_index.get_commits()
+    secrets = voter_index.get_secrets()
 
     stats = {
         "total_votes": len(commits),
@@ -1273,7 +1283,7 @@ def get_vote_statistics():
         "verified_votes": 0
     }
 
-    # Count votes per candidate (from secrets file for actual counts)
+    # Count votes per candidate (from the secrets for actual counts)
     for uid, secret_data in secrets.items():
         candidate_id = secret_data.get("candidate_id")
         if candidate_id:
@@ -0,0 +1,179 @@
+import time
+import logging
+import argparse
+from typing import Dict, List, Optional
+from dataclasses import dataclass
+
+import numpy as np
+
+from utils.face_ann import IVFFaceIndex
+from utils.face_index import FaceIndex, ENCODING_SIZE, DUPLICATE_TOLERANCE
+from utils.face_store import FaceEmbeddingStore, load_face_precision
+
+# Configure logging
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RegistryConfig:
+    """Configuration for the offline face registry index"""
+    index_dir: str = 'data/face_ann'
+    nlist: Optional[int] = None  # None sizes the index to about 4 * sqrt(N)
+    nprobe: int = 8
+    precision: Optional[str] = None  # Index codes; None uses the store's
+    store_precision: Optional[str] = None  # None uses the deployment's
+    tolerance: float = DUPLICATE_TOLERANCE
+
+
+class RegistryError(Exception):
+    """Custom exception for face registry errors"""
+    pass
+
+
+def open_store(config: RegistryConfig) -> FaceEmbeddingStore:
+    """The face store the app writes to (the deployment's precision)"""
+    store = FaceEmbeddingStore(
+        precision=config.store_precision or load_face_precision())
+    store.migrate()  # A quantized store starts as a copy of float32
+    return store
+
+
+def build_index(config: RegistryConfig) -> IVFFaceIndex:
+    """Build the ANN index over every enrolled face and save it"""
+    store = open_store(config)
+    if store.row_count() == 0:
+        raise RegistryError(
+            f"No enrolled faces in the {store.precision} face store")
+    start = time.perf_counter()
+    try:
+        index = IVFFaceIndex.from_store(
+            store, nlist=config.nlist,
+            precision=config.precision or store.precision,
+            nprobe=config.nprobe)
+    except ValueError as e:
+        source = ('the float32 store' if store.precision != 'float32'
+                  else 'data/face_encodings.json, if kept')
+        raise RegistryError(
+            f"Face store is inconsistent: {str(e)}. Restore the index file, "
+            f"or move {store.matrix_file} aside so the store is rebuilt "
+            f"from {source}, then run 'build' again")
+    index.save(config.index_dir)
+    logger.info(f"Indexed {len(index)} faces in {index.nlist} cells "
+                f"({time.perf_counter() - start:.1f} s) -> {config.index_dir}")
+    return index
+
+
+def find_duplicates(config: RegistryConfig) -> List[Dict]:
+    """Audit: every pair of enrolled people whose faces are within the
+    duplicate tolerance, using the saved index. Each pair is reported once.
+    """
+    try:
+        index = IVFFaceIndex.load(config.index_dir, nprobe=config.nprobe)
+    except FileNotFoundError:
+        raise RegistryError(f"No index in {config.index_dir}, run 'build' first")
+    rows, entries = open_store(config).load()
+
+    flagged = []
+    seen = set()
+    for person_id, entry in entries.items():
+        for other, distance in index.search(rows[entry['row']], k=3):
+            if other == person_id or distance > config.tolerance:
+                continue
+            # The search is approximate, so B may find A even when A did
+            # not find B; key pairs by both ids instead of their order
+            pair = frozenset((person_id, other))
+            if pair in seen:
+                continue
+            seen.add(pair)
+            flagged.append({'id': person_id, 'match': other,
+                            'distance': round(distance, 3)})
+    return flagged
+
+
+def synthetic_faces(count, groups=256, seed=0):
+    """Encodings with group structure (people cluster by appearance)"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0, 0.05, (groups, ENCODING_SIZE))
+    members = rng.integers(0, groups, count)
+    return (centers[members]
+            + rng.normal(0, 0.035, (count, ENCODING_SIZE))).astype(np.float32)
+
+
+def benchmark(count: int, queries: int, config: RegistryConfig,
+              nprobes: List[int]) -> None:
+    """Compare IVF search with exact FaceIndex search on synthetic data"""
+    faces = synthetic_faces(count)
+    keys = list(range(count))
+    rng = np.random.default_rng(1)
+    probes = faces[rng.choice(count, queries)] + rng.normal(
+        0, 0.02, (queries, ENCODING_SIZE)).astype(np.float32)
+
+    precision = config.precision or 'float32'
+    exact = FaceIndex(capacity=count, precision=precision)
+    for key, face in zip(keys, faces):
+        exact.add(key, face)
+    start = time.perf_counter()
+    truth = [[key for key, _ in exact.search(q, k=10)] for q in probes]
+    exact_ms = (time.perf_counter() - start) * 1000 / queries
+    logger.info(f"Exact search over {count} faces: {exact_ms:.2f} ms/query")
+
+    start = time.perf_counter()
+    ann = IVFFaceIndex.build(keys, faces, nlist=config.nlist,
+                             precision=precision)
+    logger.info(f"IVF build: {ann.nlist} cells in "
+                f"{time.perf_counter() - start:.1f} s")
+
+    for nprobe in nprobes:
+        start = time.perf_counter()
+        found = [[key for key, _ in ann.search(q, k=10, nprobe=nprobe)]
+                 for q in probes]
+        ann_ms = (time.perf_counter() - start) * 1000 / queries
+        recall1 = np.mean([f[:1] == t[:1] for f, t in zip(found, truth)])
+        recall10 = np.mean([len(set(f) & set(t)) / len(t)
+                            for f, t in zip(found, truth)])
+        logger.info(f"nprobe {nprobe:>4}: {ann_ms:.2f} ms/query "
+                    f"({exact_ms / ann_ms:.1f}x), recall@1 {recall1:.3f}, "
+                    f"recall@10 {recall10:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Offline approximate-nearest-neighbour face registry")
+    parser.add_argument('action', choices=['build', 'duplicates', 'benchmark'])
+    parser.add_argument('--index-dir', default='data/face_ann')
+    parser.add_argument('--nlist', type=int, default=None)
+    parser.add_argument('--nprobe', type=int, default=8)
+    parser.add_argument('--precision', default=None,
+                        choices=['float32', 'float16', 'int8'],
+                        help="Index precision (default: the face store's)")
+    parser.add_argument('--store-precision', default=None,
+                        choices=['float32', 'float16', 'int8'],
+                        help="Face store to read (default: the deployment's, "
+                             "data/face_store.json)")
+    parser.add_argument('--faces', type=int, default=100000,
+                        help="Synthetic registry size for benchmark")
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    config = RegistryConfig(index_dir=args.index_dir, nlist=args.nlist,
+                            nprobe=args.nprobe, precision=args.precision,
+                            store_precision=args.store_precision)
+    try:
+        if args.action == 'build':
+            build_index(config)
+        elif args.action == 'duplicates':
+            flagged = find_duplicates(config)
+            for item in flagged:
+                print(f"{item['id']} ~ {item['match']} ({item['distance']})")
+            logger.info(f"{len(flagged)} possible duplicate registrations")
+        else:
+            benchmark(args.faces, args.queries, config,
+                      nprobes=[1, 4, args.nprobe, 32, 64])
+    except RegistryError as e:
+        logger.error(f"Registry error: {str(e)}")
+
+
+if __name__ == "__main__":
+    main()
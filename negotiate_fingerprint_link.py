@@ -0,0 +1,80 @@
+import json
+import logging
+import argparse
+from typing import List, Optional
+from dataclasses import dataclass, field
+
+from utils.fingerprint import (FingerprintReader, SUPPORTED_BAUDRATES,
+                               PACKET_SIZES, LINK_FILE)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LinkConfig:
+    """Configuration for fingerprint link negotiation"""
+    port: str = '/dev/serial0'
+    baudrate: Optional[int] = None  # None starts from the saved link
+    baudrates: List[int] = field(
+        default_factory=lambda: list(SUPPORTED_BAUDRATES))
+    packet_codes: List[int] = field(
+        default_factory=lambda: sorted(PACKET_SIZES, reverse=True))
+    benchmark: bool = True
+
+
+class LinkNegotiationError(Exception):
+    """Custom exception for link negotiation errors"""
+    pass
+
+
+def negotiate(config: LinkConfig) -> dict:
+    """Negotiate the fastest stable link and return the saved settings"""
+    try:
+        reader = FingerprintReader(port=config.port,
+                                   baudrate=config.baudrate,
+                                   logger=logger.info)
+    except Exception as e:
+        raise LinkNegotiationError(
+            f"Fingerprint reader not available on {config.port}: {str(e)}")
+
+    try:
+        return reader.negotiate_link(baudrates=config.baudrates,
+                                     packet_codes=config.packet_codes,
+                                     benchmark=config.benchmark)
+    except Exception as e:
+        raise LinkNegotiationError(f"Link negotiation failed: {str(e)}")
+    finally:
+        reader.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Negotiate the fingerprint sensor's baud rate and "
+                    f"packet size and save them to {LINK_FILE}")
+    parser.add_argument('--port', default='/dev/serial0')
+    parser.add_argument('--baudrate', type=int, default=None,
+                        help="Rate the sensor currently uses (default: saved link)")
+    parser.add_argument('--max-baudrate', type=int,
+                        default=max(SUPPORTED_BAUDRATES),
+                        help="Fastest baud rate to try")
+    parser.add_argument('--no-benchmark', action='store_true',
+                        help="Skip the transfer benchmark of each setting")
+    args = parser.parse_args()
+
+    config = LinkConfig(
+        port=args.port, baudrate=args.baudrate,
+        baudrates=[rate for rate in SUPPORTED_BAUDRATES
+                   if rate <= args.max_baudrate],
+        benchmark=not args.no_benchmark)
+    try:
+        settings = negotiate(config)
+        print(json.dumps(settings, indent=2))
+    except LinkNegotiationError as e:
+        logger.error(f"Link negotiation error: {str(e)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -22,10 +22,12 @@ import io
 from PIL import Image as PILImage
 from kivy.core.image import Image as CoreImage
 import time
+from datetime import datetime
 # import os
 
-# Import the fingerprint reader
-from utils.fingerprint import FingerprintReader
+# Shared fingerprint reader
+from utils.device_manager import DeviceManager
+from utils.voter_index import VoterIndex
 
 # Polygon Amoy RPC URL
 POLYGON_AMOY_RPC = "https://polygon-amoy.g.alchemy.com/v2/3avVRcwPpT8B1A_hZW6gBTKZgwI5Sull"
@@ -195,8 +197,8 @@ class FingerprintVerificationPopup(Popup):
         self.size_hint = (0.8, 0.6)
         self.auto_dismiss = False
 
-        # Initialize fingerprint reader
-        self.fingerprint_reader = None
+        # Lease on the shared fingerprint reader
+        self.fingerprint = None
         self.verification_in_progress = False
 
         self.setup_ui()
@@ -304,9 +306,9 @@ class FingerprintVerificationPopup(Popup):
             Clock.schedule_once(lambda dt: self.update_status(
                 "Connecting to fingerprint sensor..."), 0)
 
-            self.fingerprint_reader = FingerprintReader(
-                port='/dev/serial0',  # Adjust port as needed
-                baudrate=57600,
+            # The DeviceManager owns the port and the negotiated baud rate
+            self.fingerprint = DeviceManager().lease(
+                'fingerprint', self,
                 logger=lambda msg: Clock.schedule_once(
                     lambda dt: self.update_status(msg), 0)
             )
@@ -315,7 +317,7 @@ class FingerprintVerificationPopup(Popup):
                 "Place your finger on the sensor..."), 0)
 
             # Attempt fingerprint verification
-            finger_id, confidence = self.fingerprint_reader.search_finger()
+            finger_id, confidence = self.fingerprint.call('search_finger')
 
             if finger_id is not None:
                 Clock.schedule_once(
@@ -329,8 +331,6 @@ class FingerprintVerificationPopup(Popup):
                 f"Fingerprint reader error: {str(e)}"), 0)
         finally:
             self.verification_in_progress = False
-            if self.fingerprint_reader:
-                self.fingerprint_reader.cleanup()
 
     def update_status(self, message):
         """Update status label on main thread"""
@@ -363,8 +363,8 @@ class FingerprintVerificationPopup(Popup):
     def cancel_verification(self, instance):
         """Cancel fingerprint verification"""
         self.verification_in_progress = False
-        if self.fingerprint_reader:
-            self.fingerprint_reader.cleanup()
+        if self.fingerprint:
+            self.fingerprint.release()
         self.dismiss()
         self.on_verify_fail("Verification cancelled by user")
 
@@ -683,6 +683,12 @@ class ElectionScreen(Screen):
             Clock.schedule_once(lambda dt: self.vote_error(
                 loading_popup, "Invalid UID format."), 0)
             return
+
+        voter_index = VoterIndex()
+        if voter_index.has_voted(voter_id):
+            Clock.schedule_once(lambda dt: self.vote_error(
+                loading_popup, "You have already voted!"), 0)
+            return
         try:
             # Build transaction
             transaction = self.contract.functions.vote(candidate_id, voter_id).build_transaction({
@@ -702,6 +708,17 @@ class ElectionScreen(Screen):
             # Wait for confirmation
             receipt = self.web3.eth.wait_for_transaction_receipt(tx_hash)
 
+            # Mark the voter so the next card tap is rejected
+            try:
+                voter_index.record_vote(voter_id, {
+                    "tx_hash": tx_hash.hex(),
+                    "candidate_id": candidate_id,
+                    "timestamp": datetime.now().isoformat(),
+                })
+                self.verified_user['has_voted'] = True
+            except (IOError, OSError) as e:
+                print(f"Error recording vote for {voter_id}: {e}")
+
             # Schedule UI update on main thread
             Clock.schedule_once(lambda dt: self.vote_success(
                 loading_popup, tx_hash.hex()), 0)
@@ -0,0 +1,378 @@
+import os
+import json
+import time
+import queue
+import hashlib
+import logging
+import argparse
+import threading
+from typing import Dict, List, Optional
+from dataclasses import dataclass
+
+from utils.fingerprint import FingerprintReader
+from utils.template_store import FingerprintTemplateStore
+from utils.voter_index import VoterIndex, atomic_write_json
+
+import adafruit_fingerprint
+
+# Configure logging
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ProvisioningConfig:
+    """Configuration for bulk template provisioning"""
+    port: str = '/dev/serial0'
+    baudrate: Optional[int] = None  # None uses the negotiated link
+    template_dir: str = 'data/templates'
+    manifest_file: str = 'data/templates/manifest.json'
+    queue_size: int = 8  # Templates buffered between disk and UART
+    max_retries: int = 3
+    retry_delay: float = 0.5
+    journal_every: int = 10  # Persist resume state every N templates
+    verify_readback: bool = False
+
+
+class ProvisioningError(Exception):
+    """Custom exception for provisioning errors"""
+    pass
+
+
+def template_checksum(template) -> str:
+    return hashlib.sha256(bytes(template)).hexdigest()
+
+
+class TemplateProvisioner:
+    """Moves fingerprint templates between the host store and a sensor.
+
+    Disk reads, checksums and writes run on a helper thread connected to
+    the UART loop by a bounded queue, so the serial link is kept busy
+    while the next template is prepared. Progress is journaled so an
+    interrupted run resumes where it stopped.
+    """
+
+    def __init__(self, config: ProvisioningConfig,
+                 reader: Optional[FingerprintReader] = None):
+        self.config = config
+        self.store = FingerprintTemplateStore(config.template_dir)
+        self.reader = reader or FingerprintReader(
+            port=config.port, baudrate=config.baudrate,
+            logger=logger.info, template_store=self.store)
+        self.finger = self.reader.finger
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self) -> Dict:
+        if os.path.exists(self.config.manifest_file):
+            try:
+                with open(self.config.manifest_file, 'r') as f:
+                    return json.load(f)
+            except (json.JSONDecodeError, IOError) as e:
+                logger.warning(f"Ignoring unreadable manifest: {e}")
+        return {}
+
+    def _save_manifest(self) -> None:
+        atomic_write_json(self.config.manifest_file, self.manifest)
+
+    def _journal_path(self, direction: str) -> str:
+        return os.path.join(self.config.template_dir,
+                            f".{direction}_journal.json")
+
+    def _load_journal(self, direction: str, restart: bool) -> Dict:
+        path = self._journal_path(direction)
+        if restart and os.path.exists(path):
+            os.remove(path)
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                journal = json.load(f)
+            logger.info(
+                f"Resuming {direction}: {len(journal['done'])} templates already done")
+            return journal
+        return {'done': {}, 'failed': {}}
+
+    def _save_journal(self, direction: str, journal: Dict) -> None:
+        atomic_write_json(self._journal_path(direction), journal)
+
+    def _with_retries(self, action, description: str):
+        for attempt in range(self.config.max_retries):
+            try:
+                return action()
+            except Exception as e:
+                logger.warning(
+                    f"{description} attempt {attempt + 1} failed: {str(e)}")
+                if attempt < self.config.max_retries - 1:
+                    # Drop any half-read packet before retrying
+                    self.reader.serial_connection.reset_input_buffer()
+                    time.sleep(self.config.retry_delay * (attempt + 1))
+        raise ProvisioningError(
+            f"{description} failed after {self.config.max_retries} attempts")
+
+    # Sensor -> host store
+
+    def _download_slot(self, slot: int) -> List[int]:
+        if self.finger.load_model(slot, 1) != adafruit_fingerprint.OK:
+            raise ProvisioningError(f"No template at slot {slot}")
+        template = self.finger.get_fpdata("char", 1)
+        if not template:
+            raise ProvisioningError(f"Empty template from slot {slot}")
+        return template
+
+    def export_from_sensor(self, slots: Dict[str, int],
+                           restart: bool = False) -> Dict:
+        """Download templates at `slots` ({uid: slot}) into the host store"""
+        journal = self._load_journal('export', restart)
+        pending = [(uid, slot) for uid, slot in slots.items()
+                   if uid not in journal['done']]
+        logger.info(f"Exporting {len(pending)} templates from sensor")
+
+        work = queue.Queue(maxsize=self.config.queue_size)
+        journal_lock = threading.Lock()
+
+        def writer():
+            while True:
+                item = work.get()
+                if item is None:
+                    break
+                uid, slot, template = item
+                try:
+                    self.store.save(uid, template)
+                    checksum = template_checksum(template)
+                    with journal_lock:
+                        self.manifest[uid] = {'sha256': checksum, 'slot': slot}
+                        journal['done'][uid] = checksum
+                        journal['failed'].pop(uid, None)
+                except Exception as e:
+                    with journal_lock:
+                        journal['failed'][uid] = str(e)
+
+        writer_thread = threading.Thread(target=writer, daemon=True)
+        writer_thread.start()
+
+        start = time.time()
+        try:
+            for count, (uid, slot) in enumerate(pending, 1):
+                try:
+                    template = self._with_retries(
+                        lambda: self._download_slot(slot), f"Download slot {slot}")
+                    work.put((uid, slot, template))
+                except ProvisioningError as e:
+                    logger.error(str(e))
+                    with journal_lock:
+                        journal['failed'][uid] = str(e)
+
+                if count % self.config.journal_every == 0:
+                    with journal_lock:
+                        self._save_journal('export', journal)
+                    self._report_rate('export', count, len(pending), start)
+        finally:
+            work.put(None)
+            writer_thread.join()
+            self._save_manifest()
+            self._save_journal('export', journal)
+            # Verification now uploads these voters' templates from the host
+            self._update_index({uid: {'fingerprint_store': 'host'}
+                                for uid in journal['done']})
+
+        return self._finish('export', journal, len(pending), start)
+
+    # Host store -> sensor
+
+    def _upload_to_slot(self, uid: str, slot: int, template: List[int],
+                        checksum: str) -> None:
+        self.finger.send_fpdata(template, "char", 1)
+        if self.finger.store_model(slot, 1) != adafruit_fingerprint.OK:
+            raise ProvisioningError(f"Failed to store {uid} at slot {slot}")
+
+        if self.config.verify_readback:
+            if template_checksum(self._download_slot(slot)) != checksum:
+                raise ProvisioningError(
+                    f"Checksum mismatch after writing {uid} to slot {slot}")
+
+    def import_to_sensor(self, uids: Optional[List[str]] = None,
+                         first_slot: int = 1,
+                         restart: bool = False) -> Dict:
+        """Upload host-stored templates into sensor flash slots"""
+        journal = self._load_journal('import', restart)
+        uids = uids if uids is not None else self.store.uids()
+
+        self.finger.read_sysparam()
+        capacity = self.finger.library_size
+        assignments = self._assign_slots(
+            [uid for uid in uids if uid not in journal['done']],
+            first_slot, capacity, journal)
+        logger.info(f"Importing {len(assignments)} templates to sensor")
+
+        work = queue.Queue(maxsize=self.config.queue_size)
+
+        def prefetch():
+            # Read and checksum templates ahead of the UART loop
+            for uid, slot in assignments.items():
+                template = self.store.load(uid)
+                if template is None:
+                    work.put((uid, slot, None, "Template missing from store"))
+                    continue
+                checksum = template_checksum(template)
+                expected = self.manifest.get(uid, {}).get('sha256')
+                if expected and expected != checksum:
+                    work.put((uid, slot, None, "Checksum mismatch in store"))
+                    continue
+                work.put((uid, slot, (template, checksum), None))
+            work.put(None)
+
+        threading.Thread(target=prefetch, daemon=True).start()
+
+        start = time.time()
+        count = 0
+        try:
+            while True:
+                item = work.get()
+                if item is None:
+                    break
+                uid, slot, payload, error = item
+                count += 1
+                if error:
+                    logger.error(f"{uid}: {error}")
+                    journal['failed'][uid] = error
+                    continue
+
+                template, checksum = payload
+                try:
+                    self._with_retries(
+                        lambda: self._upload_to_slot(
+                            uid, slot, template, checksum),
+                        f"Upload {uid} to slot {slot}")
+                    journal['done'][uid] = slot
+                    journal['failed'].pop(uid, None)
+                    self.manifest[uid] = {'sha256': checksum, 'slot': slot}
+                except ProvisioningError as e:
+                    logger.error(str(e))
+                    journal['failed'][uid] = str(e)
+
+                if count % self.config.journal_every == 0:
+                    self._save_manifest()
+                    self._save_journal('import', journal)
+                    self._report_rate('import', count, len(assignments), start)
+        finally:
+            # The manifest keeps the uid -> slot map once the journal is gone
+            self._save_manifest()
+            self._save_journal('import', journal)
+            # Verification matches these voters against their sensor slot
+            self._update_index({uid: {'fingerprint_id': slot,
+                                      'fingerprint_store': 'sensor'}
+                                for uid, slot in journal['done'].items()})
+
+        return self._finish('import', journal, len(assignments), start)
+
+    def _assign_slots(self, uids: List[str], first_slot: int, capacity: int,
+                      journal: Dict) -> Dict[str, int]:
+        """{uid: slot} for an import.
+
+        A uid keeps the slot recorded for it in the manifest or the voter
+        index, so a rerun rewrites the same slots; new uids get free slots
+        from `first_slot` up, never one already held by another uid.
+        """
+        known = dict(sensor_slots_from_index())
+        for uid, entry in self.manifest.items():
+            if entry.get('slot') is not None:
+                known[uid] = int(entry['slot'])
+        known.update(journal['done'])
+        taken = set(known.values())
+
+        assignments = {}
+        next_slot = first_slot
+        for uid in uids:
+            if uid in known:
+                assignments[uid] = known[uid]
+                continue
+            while next_slot in taken:
+                next_slot += 1
+            if next_slot >= capacity:
+                logger.warning(
+                    f"Sensor library full at {capacity} slots, skipping the rest")
+                break
+            assignments[uid] = next_slot
+            taken.add(next_slot)
+        return assignments
+
+    def _update_index(self, updates: Dict[str, Dict]) -> None:
+        try:
+            updated = VoterIndex().update_voters(updates)
+        except Exception as e:
+            logger.error(f"Failed to update voter index: {str(e)}")
+            return
+        if updated:
+            logger.info(f"Updated fingerprint location of {updated} voters")
+
+    def _report_rate(self, direction: str, count: int, total: int,
+                     start: float) -> None:
+        elapsed = time.time() - start
+        rate = count / elapsed if elapsed > 0 else 0.0
+        logger.info(f"{direction}: {count}/{total} templates ({rate:.1f} templates/s)")
+
+    def _finish(self, direction: str, journal: Dict, total: int,
+                start: float) -> Dict:
+        elapsed = time.time() - start
+        done = total - len(journal['failed'])
+        summary = {
+            'direction': direction,
+            'attempted': total,
+            'failed': len(journal['failed']),
+            'seconds': elapsed,
+            'templates_per_second': done / elapsed if elapsed > 0 else 0.0
+        }
+        logger.info(f"{direction} finished: {summary}")
+        if not journal['failed']:
+            os.remove(self._journal_path(direction))
+        return summary
+
+
+def sensor_slots_from_index() -> Dict[str, int]:
+    """{uid: slot} for voters whose template lives in sensor flash"""
+    index = VoterIndex()
+    slots = {}
+    for uid, voter in index.voters.items():
+        if voter.get('fingerprint_store') == 'host':
+            continue
+        slot = voter.get('fingerprint_id')
+        if slot is not None:
+            slots[uid] = int(slot)
+    return slots
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Bulk fingerprint template provisioning")
+    parser.add_argument('action', choices=['export', 'import'],
+                        help="export: sensor -> host store, import: host store -> sensor")
+    parser.add_argument('--port', default='/dev/serial0')
+    parser.add_argument('--baudrate', type=int, default=None)
+    parser.add_argument('--first-slot', type=int, default=1,
+                        help="First sensor slot used by import")
+    parser.add_argument('--verify', action='store_true',
+                        help="Read each imported template back and compare checksums")
+    parser.add_argument('--restart', action='store_true',
+                        help="Ignore any saved progress and start over")
+    args = parser.parse_args()
+
+    config = ProvisioningConfig(port=args.port, baudrate=args.baudrate,
+                                verify_readback=args.verify)
+    try:
+        provisioner = TemplateProvisioner(config)
+        if args.action == 'export':
+            provisioner.export_from_sensor(
+                sensor_slots_from_index(), restart=args.restart)
+        else:
+            provisioner.import_to_sensor(
+                first_slot=args.first_slot, restart=args.restart)
+    except ProvisioningError as e:
+        logger.error(f"Provisioning error: {str(e)}")
+    except KeyboardInterrupt:
+        print("\nInterrupted, progress saved. Re-run to resume.")
+    finally:
+        if 'provisioner' in locals():
+            provisioner.reader.cleanup()
+
+
+if __name__ == "__main__":
+    main()
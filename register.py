@@ -3,7 +3,7 @@ from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.label import Label
 from kivy.uix.floatlayout import FloatLayout
 from kivy.graphics import Color, RoundedRectangle
-from kivy.clock import Clock
+from kivy.clock import Clock, mainthread
 from kivy.uix.popup import Popup
 from components import (
     RoundedButton,
@@ -16,9 +16,10 @@ import json
 import os
 import logging
 from datetime import datetime
-from utils.rfid import RFIDReader
-from utils.fingerprint import FingerprintReader
+from utils.device_manager import DeviceManager
 from utils.camera import CameraHandler
+from utils.image_writer import ImageWriterBusy
+from utils.voter_index import VoterIndex
 
 # Configure logging
 logging.basicConfig(
@@ -36,17 +37,21 @@ class RegistrationScreen(Screen):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
-        # Initialize hardware components with updated RFIDReader
-        self.rfid_reader = RFIDReader(callback=self.on_rfid_card_detected)
-        self.fingerprint_reader = FingerprintReader(
-            logger=self.update_fingerprint_status)
+        # Shared hardware: RFID reads by subscription, fingerprint by lease
+        self.devices = DeviceManager()
+        self.rfid_subscription = None
+        self.fingerprint = self.devices.lease(
+            'fingerprint', self, logger=self.update_fingerprint_status)
         self.camera_handler = CameraHandler()
+        self.voter_index = VoterIndex()
+        self.fingerprint_job = None
 
         # Registration data
         self.registration_data = {
             'uid': None,
             'name': '',
             'fingerprint_id': None,
+            'fingerprint_store': None,
             'face_image': None,
             'has_voted': False,
             'registration_date': None
@@ -128,6 +133,7 @@ class RegistrationScreen(Screen):
             camera_widget = self.camera_handler.image_widget
             if camera_widget.parent:
                 camera_widget.parent.remove_widget(camera_widget)
+            self.camera_handler.release(self)
 
     def load_step(self):
         """Load the current registration step"""
@@ -312,7 +318,7 @@ class RegistrationScreen(Screen):
         self.rfid_status.color = [0, 0.7, 0, 1]  # Green color
         self.next_btn.disabled = False
         self.rfid_scanning = False
-        self.rfid_reader.stop_continuous_scan()
+        self._unsubscribe_rfid()
 
         # Update button text
         self.rfid_scan_btn.text = 'Card Detected!'
@@ -320,15 +326,7 @@ class RegistrationScreen(Screen):
 
     def is_card_registered(self, card_id):
         """Check if card is already registered"""
-        try:
-            voters_file = 'data/voters.json'
-            if os.path.exists(voters_file):
-                with open(voters_file, 'r') as f:
-                    voters = json.load(f)
-                    return any(voter.get('uid') == card_id for voter in voters)
-        except Exception as e:
-            logger.error(f"Error checking card registration: {e}")
-        return False
+        return self.voter_index.is_registered(card_id)
 
     def start_rfid_scan(self, instance=None):
         """Start RFID scanning process"""
@@ -342,17 +340,23 @@ class RegistrationScreen(Screen):
         self.rfid_scan_btn.text = 'Scanning...'
         self.rfid_scan_btn.disabled = True
 
-        # Start continuous scanning
-        self.rfid_reader.start_continuous_scan()
+        # Subscribe to card reads from the shared reader
+        self.rfid_subscription = self.devices.subscribe_rfid(
+            self.on_rfid_card_detected)
 
     def stop_rfid_scan(self):
         """Stop RFID scanning"""
         logger.info("Stopping RFID scan")
         self.rfid_scanning = False
-        self.rfid_reader.stop_continuous_scan()
+        self._unsubscribe_rfid()
         self.rfid_scan_btn.text = 'Start Scanning'
         self.rfid_scan_btn.disabled = False
 
+    def _unsubscribe_rfid(self):
+        if self.rfid_subscription:
+            self.rfid_subscription.cancel()
+            self.rfid_subscription = None
+
     def load_fingerprint_step(self):
         """Load fingerprint scanning step"""
         # Title
@@ -430,6 +434,7 @@ class RegistrationScreen(Screen):
         # Title
         if self.camera_handler is None:
             self.camera_handler = CameraHandler()
+        self.camera_handler.acquire(self)
 
         title = Label(
             text='Capture Your Photo',
@@ -516,6 +521,10 @@ class RegistrationScreen(Screen):
         camera_container.add_widget(camera_layout)
         self.content_layout.add_widget(camera_container)
 
+        # Live alignment hint from the preview face tracker
+        Clock.unschedule(self.update_face_hint)
+        Clock.schedule_interval(self.update_face_hint, 0.25)
+
         # Update button
         self.next_btn.text = 'Complete Registration'
         self.next_btn.disabled = True
@@ -601,31 +610,67 @@ class RegistrationScreen(Screen):
         keyboard_popup.content = keyboard
         keyboard_popup.open()
 
+    @mainthread
     def update_fingerprint_status(self, message):
         """Update fingerprint status from fingerprint reader"""
         self.fp_status.text = message
         logger.info(f"Fingerprint status: {message}")
 
     def start_fingerprint_scan(self, instance):
-        """Start fingerprint scanning process"""
+        """Start fingerprint enrollment on the biometric worker, or cancel it"""
+        if self.fingerprint_job and self.fingerprint_job.active:
+            self.cancel_fingerprint_scan()
+            return
+
         logger.info("Starting fingerprint scan")
         self.fp_status.text = 'Scanning fingerprint enrollment...'
-        self.fp_scan_btn.disabled = True
-
-        def enroll_and_update(dt):
-            fingerprint_id = self.fingerprint_reader.enroll_finger()
-            if fingerprint_id:
-                self.registration_data['fingerprint_id'] = fingerprint_id
-                self.fp_status.text = f'Fingerprint registered! ID: {fingerprint_id}'
-                self.next_btn.disabled = False
-                logger.info(
-                    f"Fingerprint registered with ID: {fingerprint_id}")
-            else:
-                self.fp_status.text = 'Fingerprint scan failed. Please try again.'
-                self.fp_scan_btn.disabled = False
-                logger.warning("Fingerprint registration failed")
-
-        Clock.schedule_once(enroll_and_update, 0.1)  # Run non-blocking
+        self.fp_scan_btn.text = 'Cancel Scan'
+
+        # Template goes to the host store keyed by the card uid
+        self.fingerprint_job = self.fingerprint.submit(
+            'enroll_finger',
+            uid=self.registration_data['uid'],
+            on_result=self.on_fingerprint_enrolled,
+            on_error=self.on_fingerprint_error,
+            on_cancel=self.on_fingerprint_cancelled)
+
+    def cancel_fingerprint_scan(self):
+        """Cancel a running fingerprint enrollment"""
+        if self.fingerprint_job and self.fingerprint_job.cancel():
+            logger.info("Fingerprint scan cancelled")
+
+    def on_fingerprint_enrolled(self, fingerprint_id):
+        """Enrollment result (called on the main thread)"""
+        self.fp_scan_btn.text = 'Start Fingerprint Scan'
+        if fingerprint_id:
+            self.registration_data['fingerprint_id'] = fingerprint_id
+            self.registration_data['fingerprint_store'] = 'host'
+            self.fp_status.text = f'Fingerprint registered! ID: {fingerprint_id}'
+            self.fp_scan_btn.disabled = True
+            self.next_btn.disabled = False
+            logger.info(
+                f"Fingerprint registered with ID: {fingerprint_id}")
+        else:
+            self.fp_status.text = 'Fingerprint scan failed. Please try again.'
+            logger.warning("Fingerprint registration failed")
+
+    def on_fingerprint_error(self, error):
+        self.fp_scan_btn.text = 'Start Fingerprint Scan'
+        self.fp_status.text = 'Fingerprint sensor error. Please try again.'
+        logger.error(f"Fingerprint enrollment error: {error}")
+
+    def on_fingerprint_cancelled(self):
+        if self.steps[self.current_step] == 'fingerprint':
+            self.fp_scan_btn.text = 'Start Fingerprint Scan'
+            self.fp_status.text = 'Scan cancelled'
+
+    def update_face_hint(self, dt):
+        """Show the tracker's alignment hint until a photo is taken"""
+        if self.steps[self.current_step] != 'face':
+            return False  # Left the face step, stop the interval
+        if (not self.capture_btn.disabled
+                and not self.registration_data.get('face_image')):
+            self.face_status.text = self.camera_handler.alignment_hint()
 
     def capture_face(self, instance):
         """Capture face photo"""
@@ -636,18 +681,24 @@ class RegistrationScreen(Screen):
 
         def do_capture(dt):
             try:
-                # Capture face image
+                # Capture face image; the encoding may finish later
+                # Faces are keyed by card uid: names are not unique
                 image_path = self.camera_handler.capture_face(
-                    self.registration_data['name'])
+                    self.registration_data['uid'],
+                    on_encoded=self.on_face_encoded,
+                    label=self.registration_data['name'])
                 if image_path:
-                    self.registration_data['face_image'] = image_path
-                    self.face_status.text = 'Photo captured successfully!'
-                    self.face_status.color = [0, 1, 0, 1]  # Green for success
-                    self.next_btn.disabled = False
+                    # face_image is only recorded once the file is on disk
+                    if self.capture_btn.disabled:
+                        self.face_status.text = 'Saving photo, analysing face...'
                 else:
-                    self.face_status.text = 'Photo capture failed. Please try again.'
+                    self.face_status.text = f'{self.camera_handler.quality_hint()}. Please try again.'
                     self.face_status.color = [1, 0, 0, 1]  # Red for error
                     self.capture_btn.disabled = False
+            except ImageWriterBusy:
+                self.face_status.text = 'Still saving the last photo. Please try again.'
+                self.face_status.color = [1, 0, 0, 1]  # Red for error
+                self.capture_btn.disabled = False
             except Exception as e:
                 self.face_status.text = f'Error: {str(e)}'
                 self.face_status.color = [1, 0, 0, 1]  # Red for error
@@ -656,6 +707,49 @@ class RegistrationScreen(Screen):
         # Schedule the capture to run in the next frame
         Clock.schedule_once(do_capture, 0.1)
 
+    def on_face_encoded(self, uid, found, duplicates, saved, image_path):
+        """Face encoding for a capture is stored (main thread).
+
+        `duplicates` are the already registered faces it resembled,
+        searched before it was added. `saved` is False when the photo
+        could not be written; nothing was stored then.
+        """
+        if uid != self.registration_data.get('uid'):
+            return  # A previous registration's capture
+        self.capture_btn.disabled = False
+        if not saved:
+            logger.error(f"Face photo for card {uid} could not be saved")
+            self.face_status.text = 'Photo could not be saved. Please try again.'
+            self.face_status.color = [1, 0, 0, 1]  # Red for error
+            return
+
+        self.registration_data['face_image'] = image_path
+        self.next_btn.disabled = False
+        if not found:
+            self.face_status.text = 'Photo captured, but no face was found'
+            self.face_status.color = [1, 0.6, 0, 1]  # Orange for review
+            return
+
+        # Flag faces that look like an already registered voter
+        def voter_name(other):
+            voter = self.voter_index.get(other)
+            return voter.get('name', other) if voter else other
+
+        self.registration_data['face_duplicates'] = [
+            {'uid': other, 'name': voter_name(other),
+             'distance': round(distance, 3)}
+            for other, distance in duplicates]
+        if duplicates:
+            other, distance = duplicates[0]
+            logger.warning(
+                f"Possible duplicate registrant: face matches card {other} "
+                f"(distance {distance:.3f})")
+            self.face_status.text = f'Warning: face resembles registered voter {voter_name(other)}'
+            self.face_status.color = [1, 0.6, 0, 1]  # Orange for review
+        else:
+            self.face_status.text = 'Photo captured successfully!'
+            self.face_status.color = [0, 1, 0, 1]  # Green for success
+
     def next_step(self, instance):
         """Move to next registration step"""
         current_step_name = self.steps[self.current_step]
@@ -686,6 +780,7 @@ class RegistrationScreen(Screen):
             # Stop any ongoing scanning when going back
             if self.current_step == 1:  # RFID step
                 self.stop_rfid_scan()
+            self.cancel_fingerprint_scan()
 
             self.current_step -= 1
             self.load_step()
@@ -759,12 +854,20 @@ class RegistrationScreen(Screen):
 
             logger.info(
                 f"Registration saved successfully: {self.registration_data}")
-            return True
         except Exception as e:
             logger.error(f"Error saving registration: {e}")
             self.show_error("Failed to save registration data")
             return False
 
+        # Add the voter to the status index used at verification and voting
+        try:
+            self.voter_index.add_voter(self.registration_data)
+            return True
+        except Exception as e:
+            logger.error(f"Error updating voter index: {e}")
+            self.show_error("Failed to save registration data")
+            return False
+
     def get_registration_stats(self):
         """Get registration statistics"""
         try:
@@ -795,11 +898,22 @@ class RegistrationScreen(Screen):
         )
         popup.open()
 
+    def on_enter(self, *args):
+        """Called when entering the screen"""
+        # Resume the camera if we left while on the face step
+        if self.steps[self.current_step] == 'face' and self.camera_handler:
+            self.camera_handler.acquire(self)
+        super().on_enter(*args)
+
     def on_leave(self, *args):
         """Called when leaving the screen"""
         logger.info("Leaving registration screen")
-        # Clean up RFID scanning
+        # Clean up RFID scanning and any running enrollment
         self.stop_rfid_scan()
+        self.cancel_fingerprint_scan()
+        if self.camera_handler:
+            self.camera_handler.release(self)
+        Clock.unschedule(self.update_face_hint)
         super().on_leave(*args)
 
     def cleanup(self):
@@ -807,8 +921,8 @@ class RegistrationScreen(Screen):
         logger.info("Cleaning up registration screen resources")
         try:
             self.stop_rfid_scan()
-            self.rfid_reader.cleanup()
-            # Clean up other resources as needed
+            self.cancel_fingerprint_scan()
+            # Devices are shared and closed by the DeviceManager
         except Exception as e:
             logger.error(f"Error during cleanup: {e}")
 
@@ -0,0 +1,140 @@
+import os
+import time
+import logging
+import argparse
+import tempfile
+import statistics
+from typing import Dict, List
+
+from utils.rfid import RFIDReader
+from utils.fingerprint import FingerprintReader
+from utils.template_store import FingerprintTemplateStore
+from utils.voter_index import VoterIndex
+from utils.simulation import (
+    TracePlayer,
+    SimulatedRFIDSerial,
+    SimulatedFingerprintSensor,
+    generate_voter_trace,
+    load_trace,
+    save_trace,
+)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(name: str, values: List[float]) -> str:
+    if not values:
+        return f"{name}: no samples"
+    return (f"{name}: mean {statistics.mean(values) * 1000:.2f} ms, "
+            f"p50 {percentile(values, 50) * 1000:.2f} ms, "
+            f"p95 {percentile(values, 95) * 1000:.2f} ms")
+
+
+def run_flow(trace: List[Dict], speed, workdir: str) -> Dict:
+    """Replay `trace` through the real RFID and fingerprint drivers and the
+    voter index, running the verify -> vote flow for every tap.
+    """
+    uids = sorted({e['uid'] for e in trace if e['device'] == 'rfid'})
+    index = VoterIndex(index_file=os.path.join(workdir, 'voter_index.json'),
+                       migrate_legacy=False)
+    index.add_voters({'uid': uid, 'name': f'Voter {n}', 'fingerprint_id': n}
+                     for n, uid in enumerate(uids, 1))
+
+    player = TracePlayer(trace, speed=speed)
+    rfid = RFIDReader(ser=SimulatedRFIDSerial(player))
+    rfid.log_card_read = lambda card_id, card_data: None  # Keep output quiet
+    fingerprint = FingerprintReader(
+        sensor=SimulatedFingerprintSensor(player),
+        logger=lambda message: None,
+        template_store=FingerprintTemplateStore(
+            os.path.join(workdir, 'templates')))
+
+    timings = {'lookup': [], 'fingerprint': [], 'commit': [], 'voter': []}
+    counts = {'taps': 0, 'voted': 0, 'already_voted': 0,
+              'unknown': 0, 'mismatch': 0}
+
+    # Taps are never further apart than this in trace time
+    idle_timeout = 30.0 / speed if speed else 1.0
+    start = last_activity = time.perf_counter()
+    while True:
+        uid = rfid.read_card_blocking(timeout=idle_timeout)
+        if uid is None:
+            break
+        tap_time = last_activity = time.perf_counter()
+        counts['taps'] += 1
+
+        voter = index.get(uid)
+        timings['lookup'].append(time.perf_counter() - tap_time)
+        if voter is None:
+            counts['unknown'] += 1
+            continue
+        if voter.get('has_voted'):
+            counts['already_voted'] += 1
+            continue
+
+        fp_start = time.perf_counter()
+        matched, confidence = fingerprint.verify_voter(voter)
+        timings['fingerprint'].append(time.perf_counter() - fp_start)
+        if not matched:
+            counts['mismatch'] += 1
+            continue
+
+        commit_start = time.perf_counter()
+        index.record_vote(uid, {'vote_hash': f'sim-{uid}',
+                                'candidate_id': 1, 'ipfs_cid': None})
+        timings['commit'].append(time.perf_counter() - commit_start)
+        last_activity = time.perf_counter()
+        timings['voter'].append(last_activity - tap_time)
+        counts['voted'] += 1
+
+    elapsed = last_activity - start
+    return {'counts': counts, 'timings': timings, 'elapsed': elapsed,
+            'finger_wait': fingerprint.get_scan_latency_stats()}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay RFID/fingerprint traces through the verify -> vote flow")
+    parser.add_argument('--voters', type=int, default=1000,
+                        help="Voters in a generated trace")
+    parser.add_argument('--trace', help="Replay this JSON-lines trace instead")
+    parser.add_argument('--save-trace', help="Write the generated trace here")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--speed', type=float, default=0,
+                        help="Trace speed-up factor, 0 = as fast as possible")
+    args = parser.parse_args()
+
+    if args.trace:
+        trace = load_trace(args.trace)
+    else:
+        uids = [f"{n:010X}" for n in range(1, args.voters + 1)]
+        trace = generate_voter_trace(uids, seed=args.seed)
+        if args.save_trace:
+            save_trace(args.save_trace, trace)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        result = run_flow(trace, args.speed or None, workdir)
+
+    counts = result['counts']
+    logger.info(f"Results: {counts}")
+    for name, values in result['timings'].items():
+        logger.info(summarize(name, values))
+    logger.info(f"Finger wait: {result['finger_wait']}")
+    if result['elapsed'] > 0:
+        logger.info(f"Throughput: {counts['taps'] / result['elapsed']:.1f} taps/s "
+                    f"over {result['elapsed']:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
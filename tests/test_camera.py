@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+import pytest
+
+# Headless Kivy: no window, GL calls go to the mock backend
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+os.environ.setdefault('KIVY_GL_BACKEND', 'mock')
+os.environ.setdefault('KIVY_LOG_MODE', 'PYTHON')
+
+pytest.importorskip('kivy')
+from kivy.graphics.cgl import cgl_init  # noqa: E402
+
+
+@pytest.fixture
+def camera(tmp_path, monkeypatch):
+    cgl_init()
+    monkeypatch.chdir(tmp_path)
+    from utils.camera import CameraHandler
+    CameraHandler._instance = None
+    handler = CameraHandler(widget_size=(640, 480))
+    yield handler
+    CameraHandler._instance = None
+
+
+def make_frame(width, height):
+    frame = np.zeros((height, width, 3), np.uint8)
+    frame[:, :, 0] = np.arange(width, dtype=np.uint8)  # Non-uniform pixels
+    return frame
+
+
+def test_update_uploads_frame_of_widget_size(camera):
+    camera.latest = (make_frame(640, 480), 1)
+
+    camera.update(0)
+
+    assert camera.displayed_seq == 1
+    assert camera.texture.size == (640, 480)
+    assert camera.image_widget.texture is camera.texture
+
+
+def test_update_resizes_into_preallocated_buffer(camera):
+    camera.latest = (make_frame(1280, 720), 1)
+    camera.update(0)
+    buffer = camera.preview_buffer
+
+    camera.latest = (make_frame(1280, 720), 2)
+    camera.update(0)
+
+    assert camera.displayed_seq == 2
+    assert buffer.shape == (480, 640, 3)
+    assert camera.preview_buffer is buffer
+    assert camera.texture.size == (640, 480)
+
+
+def test_update_accepts_non_contiguous_frame(camera):
+    # e.g. a crop of a larger frame
+    frame = make_frame(800, 600)[60:540, 80:720]
+    assert not frame.flags['C_CONTIGUOUS']
+    camera.latest = (frame, 1)
+
+    camera.update(0)
+
+    assert camera.displayed_seq == 1
+
+
+def test_update_skips_frame_already_shown(camera):
+    camera.latest = (make_frame(640, 480), 1)
+    camera.update(0)
+    texture = camera.texture
+
+    camera.update(0)
+
+    assert camera.texture is texture
+    assert camera.displayed_seq == 1
@@ -0,0 +1,108 @@
+import queue
+import threading
+import itertools
+
+from kivy.clock import Clock
+
+
+class BiometricJob:
+    """Handle for a request queued on the BiometricWorker"""
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    CANCELLED = 'cancelled'
+
+    def __init__(self, job_id, func, args, kwargs, on_result=None,
+                 on_error=None, on_cancel=None, cancel=None):
+        self.job_id = job_id
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.on_result = on_result
+        self.on_error = on_error
+        self.on_cancel = on_cancel
+        self.cancel_callback = cancel  # Aborts the running operation
+        self.state = self.PENDING
+        self.lock = threading.Lock()
+
+    @property
+    def active(self):
+        return self.state in (self.PENDING, self.RUNNING)
+
+    def cancel(self):
+        """Cancel the job. A running operation is asked to abort"""
+        with self.lock:
+            if not self.active:
+                return False
+            was_running = self.state == self.RUNNING
+            self.state = self.CANCELLED
+
+        if was_running and self.cancel_callback:
+            self.cancel_callback()
+        if self.on_cancel:
+            Clock.schedule_once(lambda dt: self.on_cancel(), 0)
+        return True
+
+
+class BiometricWorker:
+    """Runs blocking biometric operations off the Kivy main thread.
+
+    Requests go through a queue to a single worker thread (the sensors
+    can only serve one operation at a time). Results and errors are
+    delivered back on the main thread through Clock. Progress messages
+    from the hardware classes should use `kivy.clock.mainthread`
+    callbacks.
+    """
+    _instance = None  # Singleton instance
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super(BiometricWorker, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if hasattr(self, 'initialized') and self.initialized:
+            return  # Already initialized
+
+        self.requests = queue.Queue()
+        self.job_ids = itertools.count(1)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+        self.initialized = True
+
+    def submit(self, func, *args, on_result=None, on_error=None,
+               on_cancel=None, cancel=None, **kwargs):
+        """Queue `func(*args, **kwargs)` and return its BiometricJob"""
+        job = BiometricJob(next(self.job_ids), func, args, kwargs,
+                           on_result=on_result, on_error=on_error,
+                           on_cancel=on_cancel, cancel=cancel)
+        self.requests.put(job)
+        return job
+
+    def _run(self):
+        while True:
+            job = self.requests.get()
+            with job.lock:
+                if job.state != BiometricJob.PENDING:
+                    continue  # Cancelled before it started
+                job.state = BiometricJob.RUNNING
+
+            try:
+                result = job.func(*job.args, **job.kwargs)
+            except Exception as e:
+                self._finish(job, job.on_error, e)
+            else:
+                self._finish(job, job.on_result, result)
+
+    def _finish(self, job, callback, value):
+        with job.lock:
+            if job.state != BiometricJob.RUNNING:
+                return  # Cancelled while running, drop the result
+            job.state = BiometricJob.DONE
+
+        if callback:
+            Clock.schedule_once(lambda dt: callback(value), 0)
+        elif isinstance(value, Exception):
+            print(f"Biometric job {job.job_id} failed: {value}")
@@ -1,14 +1,23 @@
 import os
 import cv2
-import json
 import time
+import threading
 import numpy as np
 from datetime import datetime
+from collections import OrderedDict
 
 from kivy.uix.image import Image
 from kivy.graphics.texture import Texture
 from kivy.clock import Clock
 
+from utils.face_index import FaceIndex, DUPLICATE_TOLERANCE
+from utils.face_store import FaceEmbeddingStore, load_face_precision
+from utils.frame_quality import FrameQualityGate
+from utils.face_tracker import FaceTracker
+from utils.face_pool import FaceEncodingPool
+from utils.face_pipeline import FacePipeline
+from utils.image_writer import ImageWriter
+
 try:
     import face_recognition
     FACE_RECOGNITION_AVAILABLE = True
@@ -25,23 +34,77 @@ class CameraHandler:
             cls._instance = super(CameraHandler, cls).__new__(cls)
         return cls._instance
 
-    def __init__(self, camera_index=0, widget_size=(640, 480)):
+    # Seconds the device stays open after the last user releases it, so
+    # quick screen changes resume without reopening the camera
+    IDLE_CLOSE_DELAY = 10.0
+
+    # cv2.imdecode flags that decode a JPEG straight to 1/N size
+    JPEG_REDUCED_FLAGS = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+                          4: cv2.IMREAD_REDUCED_COLOR_4,
+                          8: cv2.IMREAD_REDUCED_COLOR_8}
+
+    def __init__(self, camera_index=0, widget_size=(640, 480),
+                 face_precision=None, capture_size=(1280, 720),
+                 preview_width=640, use_mjpeg=True, image_format='jpg',
+                 image_quality=90):
         if hasattr(self, 'initialized') and self.initialized:
             return  # Already initialized
 
         self.camera_index = camera_index
         self.widget_size = widget_size
-        self.cap = cv2.VideoCapture(self.camera_index)
-        self.frame = None
+        self.cap = None
+
+        # Dual resolution: the device streams at capture_size, preview and
+        # detection work on a copy reduced to about preview_width, and a
+        # full-resolution still is only decoded when a face is captured
+        self.capture_size = capture_size
+        self.preview_width = preview_width
+        self.preview_reduction = 1
+        # MJPEG keeps USB bandwidth low at high resolutions; with
+        # passthrough the camera's own JPEG is kept and saved as is
+        self.use_mjpeg = use_mjpeg
+        self.jpeg_passthrough = False
+        self.jpeg_complete = False  # Frames carry Huffman tables (saveable)
+        # Sources of full-resolution stills for frames the quality gate
+        # kept: seq -> (BGR frame or None, JPEG bytes or None)
+        self.stills = OrderedDict()
+        self.stills_lock = threading.Lock()
         self.texture = None
-        self.face_encodings_db = self.load_face_database()
+        self.preview_buffer = None
 
-        if not self.cap.isOpened():
-            raise RuntimeError("Could not open camera")
+        # Single-slot buffer holding (frame, sequence number). The capture
+        # thread replaces the tuple in one assignment, so readers never
+        # need a lock and stale frames are simply dropped.
+        self.latest = (None, 0)
+        self.displayed_seq = 0
+        self.capturing = False
+        self.capture_thread = None
+
+        # Cheap quality checks on the preview stream; face encoding only
+        # runs on the best recent frame
+        self.face_tracker = FaceTracker()
+        self.quality_gate = FrameQualityGate(tracker=self.face_tracker)
 
-        # Set camera resolution for better quality
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+        # Detection/encoding settings of the deployment's face profile
+        self.face_pipeline = FacePipeline()
+        # Captured images are written off the UI thread
+        self.image_writer = ImageWriter(image_format=image_format,
+                                        quality=image_quality)
+
+        # Screens currently using the camera; capture runs only while
+        # this set is non-empty
+        self.users = set()
+        self.users_lock = threading.Lock()
+        self.close_event = None
+        # Registered faces: person id -> {'row', 'image'} plus the
+        # memory-mapped encoding rows they point into. The precision is
+        # the deployment's (data/face_store.json) unless given
+        face_precision = face_precision or load_face_precision()
+        self.face_precision = face_precision
+        self.face_store = FaceEmbeddingStore(precision=face_precision)
+        self.face_entries, self.face_rows = self.load_face_database()
+        self.face_index = FaceIndex.from_store(
+            self.face_entries, self.face_rows, precision=face_precision)
 
         # Create image widget with specified size
         self.image_widget = Image(
@@ -50,101 +113,429 @@ class CameraHandler:
             size_hint_x=None,
             width=widget_size[0]
         )
-        Clock.schedule_interval(self.update, 1.0 / 30.0)  # 30 FPS
 
         os.makedirs('data/faces', exist_ok=True)
 
         self.initialized = True
         print(f"[INFO] CameraHandler initialized with size {widget_size}")
 
+    def _open_camera(self):
+        """Open the capture device if it is not already open"""
+        if self.cap is not None and self.cap.isOpened():
+            return
+        self.cap = cv2.VideoCapture(self.camera_index)
+        if not self.cap.isOpened():
+            self.cap = None
+            raise RuntimeError("Could not open camera")
+
+        # FOURCC first: many UVC cameras only offer high resolutions
+        # over MJPEG
+        if self.use_mjpeg:
+            self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+        width, height = self.capture_size
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)) or width
+        height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) or height
+
+        # Largest JPEG scaling factor that keeps the preview wide enough
+        self.preview_reduction = max(
+            [r for r in self.JPEG_REDUCED_FLAGS
+             if width // r >= self.preview_width] or [1])
+        self.jpeg_passthrough = self.use_mjpeg and self._enable_passthrough()
+        mode = 'MJPEG passthrough' if self.jpeg_passthrough else 'decoded'
+        print(f"[INFO] Camera opened at {width}x{height} ({mode}), "
+              f"preview 1/{self.preview_reduction}.")
+
+    def _enable_passthrough(self):
+        """Ask the backend for undecoded MJPEG frames; True if it obliges"""
+        if int(self.cap.get(cv2.CAP_PROP_FOURCC)) != cv2.VideoWriter_fourcc(*'MJPG'):
+            return False
+        self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+        ret, data = self.cap.read()
+        # Raw frames arrive as a single row of JPEG bytes
+        if (ret and data is not None and data.dtype == np.uint8
+                and (data.ndim == 1 or data.shape[0] == 1)
+                and cv2.imdecode(data, cv2.IMREAD_REDUCED_COLOR_8) is not None):
+            # Some cameras leave out the Huffman tables (DHT marker);
+            # OpenCV decodes those, but other viewers cannot
+            self.jpeg_complete = b'\xff\xc4' in data.tobytes()[:4096]
+            return True
+        self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 1)
+        return False
+
+    def _close_camera(self, *args):
+        """Release the device so the sensor can power down"""
+        self.close_event = None
+        with self.users_lock:
+            if self.users:
+                return  # Re-acquired during the grace period
+        self.stop_capture()
+        if self.cap is not None and self.cap.isOpened():
+            self.cap.release()
+        self.cap = None
+        print("[INFO] Camera idle, device closed.")
+
+    def acquire(self, owner):
+        """Start (or keep) capturing on behalf of `owner`.
+
+        Call from a screen's on_enter or when it shows the camera; pair it
+        with release(owner). Acquiring twice with the same owner is a no-op.
+        """
+        with self.users_lock:
+            first = not self.users
+            self.users.add(owner)
+        if not first:
+            return
+
+        if self.close_event is not None:
+            self.close_event.cancel()
+            self.close_event = None
+        try:
+            self._open_camera()
+        except Exception:
+            with self.users_lock:
+                self.users.discard(owner)
+            raise
+        self.start_capture()
+        Clock.unschedule(self.update)
+        Clock.schedule_interval(self.update, 1.0 / 30.0)  # 30 FPS
+
+    def release(self, owner):
+        """Drop `owner`'s use of the camera.
+
+        When no users remain, preview and capture pause at once and the
+        device is closed after IDLE_CLOSE_DELAY seconds.
+        """
+        with self.users_lock:
+            if owner not in self.users:
+                return
+            self.users.discard(owner)
+            idle = not self.users
+        if not idle:
+            return
+
+        Clock.unschedule(self.update)
+        self.stop_capture()
+        if self.close_event is None:
+            self.close_event = Clock.schedule_once(
+                self._close_camera, self.IDLE_CLOSE_DELAY)
+
+    @property
+    def active(self):
+        return bool(self.users)
+
     def update_widget_size(self, width, height):
         """Update the camera widget size"""
         self.widget_size = (width, height)
         self.image_widget.width = width
         self.image_widget.height = height
 
-    def update(self, dt):
-        """Read from camera and update Kivy image widget"""
-        ret, frame = self.cap.read()
-        if not ret:
+    @property
+    def frame(self):
+        """Newest captured frame (BGR), or None before the first one"""
+        return self.latest[0]
+
+    def get_latest_frame(self):
+        """Return (frame, sequence number) of the newest captured frame"""
+        return self.latest
+
+    def get_best_frame(self):
+        """(frame, quality) of the best recent frame that passed the
+        quality checks, or (None, None) when none did
+        """
+        return self.quality_gate.best()
+
+    def get_best_still(self):
+        """(frame, quality, jpeg) for the best recent frame at full
+        capture resolution, or (None, None, None).
+
+        `quality['face_box']` is scaled to the still. `jpeg` holds the
+        camera's own encoding when it can be saved as is, else None.
+        """
+        preview, quality = self.get_best_frame()
+        if preview is None:
+            return None, None, None
+        with self.stills_lock:
+            frame, jpeg = self.stills.get(quality['seq'], (preview, None))
+        if frame is None:
+            frame = cv2.imdecode(jpeg, cv2.IMREAD_COLOR)
+            if frame is None:
+                return preview, quality, None
+        if not self.jpeg_complete:
+            jpeg = None
+
+        box = quality['face_box']
+        factor = frame.shape[1] / preview.shape[1]
+        if box is not None and factor != 1:
+            box = tuple(int(v * factor) for v in box)
+        return frame, dict(quality, face_box=box), jpeg
+
+    def quality_hint(self):
+        return self.quality_gate.hint()
+
+    def alignment_hint(self):
+        """Where the voter should move, from the preview face tracker"""
+        return self.face_tracker.hint()
+
+    def start_capture(self):
+        """Start the capture thread that keeps the newest frame buffered"""
+        if self.capturing:
             return
+        self.capturing = True
+        self.capture_thread = threading.Thread(
+            target=self._capture_loop, daemon=True)
+        self.capture_thread.start()
+
+    def stop_capture(self):
+        self.capturing = False
+        if self.capture_thread:
+            self.capture_thread.join(timeout=1)
+            self.capture_thread = None
+        # Never hand out a frame from before the pause
+        self.latest = (None, self.latest[1])
+        with self.stills_lock:
+            self.stills.clear()
+        self.quality_gate.reset()
+        self.face_tracker.reset()
+
+    def _capture_loop(self):
+        """Capture thread: camera I/O never runs on the Kivy main thread"""
+        seq = self.latest[1]
+        cap = self.cap
+        while self.capturing:
+            ret, data = cap.read()
+            if not ret or data is None:
+                time.sleep(0.05)
+                continue
+            try:
+                frame, still = self._split_frame(data)
+            except Exception as e:
+                print(f"Frame decode failed: {e}")
+                continue
+            seq += 1
+            self.latest = (frame, seq)
+            try:
+                self.face_tracker.update(frame, seq)
+                quality = self.quality_gate.submit(frame, seq)
+                if quality is not None and quality['ok']:
+                    self._keep_still(seq, still)
+            except Exception as e:
+                print(f"Frame quality check failed: {e}")
 
-        self.frame = frame
-        # Resize frame to match widget size for better display
-        resized_frame = cv2.resize(frame, self.widget_size)
+    def _split_frame(self, data):
+        """(preview frame, still source) for one frame read from the device"""
+        reduction = self.preview_reduction
+        if self.jpeg_passthrough:
+            # libjpeg scales while decoding, far cheaper than a full
+            # decode plus resize; the JPEG stays around for the still
+            frame = cv2.imdecode(data, self.JPEG_REDUCED_FLAGS[reduction])
+            if frame is None:
+                raise ValueError("corrupt JPEG frame")
+            return frame, (None, data)
+        if reduction == 1:
+            return data, (data, None)
+        height, width = data.shape[:2]
+        frame = cv2.resize(data, (width // reduction, height // reduction),
+                           interpolation=cv2.INTER_AREA)
+        return frame, (data, None)
 
-        buf = cv2.flip(resized_frame, 0).tobytes()
-        texture = Texture.create(
-            size=(resized_frame.shape[1], resized_frame.shape[0]), colorfmt='bgr')
-        texture.blit_buffer(buf, colorfmt='bgr', bufferfmt='ubyte')
-        self.image_widget.texture = texture
+    def _keep_still(self, seq, still):
+        """Hold the still source of a frame the quality gate kept"""
+        with self.stills_lock:
+            self.stills[seq] = still
+            while len(self.stills) > self.quality_gate.recent.maxlen:
+                self.stills.popitem(last=False)
 
-    def capture_face(self, name):
-        """Capture current frame, save it, and extract face encoding"""
-        if self.frame is None:
-            print("[ERROR] No frame to capture")
+    def update(self, dt):
+        """Upload the newest captured frame to the Kivy image widget"""
+        frame, seq = self.latest
+        if frame is None or seq == self.displayed_seq:
+            return  # Nothing new since the last tick
+        self.displayed_seq = seq
+
+        width, height = self.widget_size
+        if frame.shape[1] == width and frame.shape[0] == height:
+            preview = frame
+        else:
+            # Resize into a preallocated buffer, reused while the size holds
+            if (self.preview_buffer is None
+                    or self.preview_buffer.shape[:2] != (height, width)):
+                self.preview_buffer = np.empty((height, width, 3), np.uint8)
+            preview = cv2.resize(frame, (width, height),
+                                 dst=self.preview_buffer)
+
+        texture = self._get_preview_texture(width, height)
+        # blit_buffer takes a flat buffer; reshaping a C-contiguous array
+        # (the preallocated buffer always is) does not copy
+        texture.blit_buffer(np.ascontiguousarray(preview).reshape(-1),
+                            colorfmt='bgr', bufferfmt='ubyte')
+        self.image_widget.canvas.ask_update()
+
+    def _get_preview_texture(self, width, height):
+        """Return the preview texture, creating it only when the size changes"""
+        if self.texture is None or self.texture.size != (width, height):
+            self.texture = Texture.create(size=(width, height), colorfmt='bgr')
+            # OpenCV rows run top-down; flip the texture coordinates instead
+            # of copying the pixels every frame
+            self.texture.flip_vertical()
+            self.image_widget.texture = self.texture
+        return self.texture
+
+    def capture_face(self, person_id, on_encoded=None, label=None):
+        """Capture current frame, queue it for saving, and extract the
+        face encoding for `person_id` (the voter's RFID uid).
+
+        The image is written by the background ImageWriter while the face
+        is encoded (in the FaceEncodingPool, started on the first capture,
+        when `on_encoded` is given and face_recognition is installed, else
+        on the BiometricWorker when `on_encoded` is given, else inline). The
+        face is stored only once both are done and the image is on disk,
+        so no record points at a missing file; then
+        `on_encoded(person_id, found, duplicates, saved, image_path)` is
+        called on the main thread. Returns the image path, or None without
+        a usable frame. Raises ImageWriterBusy when earlier images are
+        still being saved. `label` (e.g. the voter's name) only names the
+        image file.
+        """
+        frame, quality, jpeg = self.get_best_still()
+        if frame is None:
+            print(f"[WARNING] No usable frame to capture: {self.quality_hint()}")
             return None
 
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"{name.replace(' ', '_')}_{timestamp}.jpg"
-        image_path = os.path.join('data/faces', filename)
-
-        # Save frame
-        cv2.imwrite(image_path, self.frame)
-        print(f"[INFO] Image saved at {image_path}")
-
-        if FACE_RECOGNITION_AVAILABLE:
-            rgb_frame = cv2.cvtColor(self.frame, cv2.COLOR_BGR2RGB)
-            face_locations = face_recognition.face_locations(rgb_frame)
-            face_encodings = face_recognition.face_encodings(
-                rgb_frame, face_locations)
-
-            if face_encodings:
-                print("[INFO] Face encoding extracted.")
-                self.face_encodings_db[name] = {
-                    'encodings': [face_encodings[0].tolist()],
-                    'image': image_path
-                }
-                self.save_face_database()
+        pending = {}  # 'encoding' and 'saved', filled on the main thread
+
+        def finish():
+            if len(pending) < 2:
+                return  # Still waiting on the encoder or the disk
+            if pending['saved']:
+                found, duplicates = self._store_encoding(
+                    person_id, pending['encoding'], image_path)
             else:
-                print("[WARNING] No face found in captured image")
+                print(f"[ERROR] Face image {image_path} not saved, encoding discarded")
+                found, duplicates = False, []
+            if on_encoded is not None:
+                on_encoded(person_id, found, duplicates, pending['saved'],
+                           image_path)
+
+        def store(encoding):
+            pending['encoding'] = encoding
+            finish()
+
+        def written(path, ok):
+            def record(dt):
+                pending['saved'] = ok
+                finish()
+            Clock.schedule_once(record, 0)
+
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        filename = f"{(label or person_id).replace(' ', '_')}_{timestamp}.jpg"
+        # The camera's JPEG, when there is one, is saved without re-encoding
+        image_path = self.image_writer.submit(
+            os.path.join('data/faces', filename), frame=frame, jpeg=jpeg,
+            on_done=written)
+
+        pool = FaceEncodingPool()
+        use_pool = on_encoded is not None and FACE_RECOGNITION_AVAILABLE
+        if use_pool and not pool.accepts(frame):
+            print(f"[WARNING] Frame {frame.shape} too large for the encoding "
+                  f"pool, encoding on the biometric worker")
+            use_pool = False
+        if use_pool and pool.start():
+            profile = self.face_pipeline.profile
+            future = pool.submit(frame, detect_scale=profile.detect_scale,
+                                 region=quality['face_box'],
+                                 **profile.encoder_options())
+
+            def done(future):
+                try:
+                    _, encoding, _ = future.result()
+                except Exception as e:
+                    print(f"[ERROR] Face encoding failed: {e}")
+                    encoding = None
+                Clock.schedule_once(lambda dt: store(encoding), 0)
+
+            future.add_done_callback(done)
+        elif not FACE_RECOGNITION_AVAILABLE:
+            store(None)
+        elif on_encoded is not None:
+            def failed(error):
+                print(f"[ERROR] Face encoding failed: {error}")
+                store(None)
+
+            self.face_pipeline.submit(
+                frame, face_box=quality['face_box'],
+                on_result=lambda result: store(result['encoding']),
+                on_error=failed)
+        else:
+            result = self.face_pipeline.process(
+                frame, face_box=quality['face_box'])
+            store(result['encoding'])
 
         return image_path
 
+    def _store_encoding(self, person_id, encoding, image_path):
+        """Store a captured encoding; returns (found, duplicates).
+
+        Duplicates ([(person_id, distance)] of other registered people)
+        are searched before the new face is inserted. Only `person_id`'s
+        own earlier capture is excluded, so a retake replaces it.
+        """
+        if encoding is None:
+            print("[WARNING] No face found in captured image")
+            return False, []
+        print("[INFO] Face encoding extracted.")
+        duplicates = self.face_index.find_duplicates(
+            encoding, exclude=person_id)
+        self.face_index.add(person_id, encoding)
+        self.save_face(person_id, encoding, image_path)
+        return True, duplicates
+
+    def get_face_encodings(self, person_id):
+        """Stored encodings for `person_id` (float32), or None"""
+        entry = self.face_entries.get(person_id)
+        if entry is None:
+            return None
+        return [self.face_rows[entry['row']]]
+
+    def find_duplicate_faces(self, person_id, tolerance=DUPLICATE_TOLERANCE):
+        """Other registered people whose face is close to `person_id`'s.
+
+        Returns [(person_id, distance)], nearest first.
+        """
+        encodings = self.get_face_encodings(person_id)
+        if not encodings:
+            return []
+        return self.face_index.find_duplicates(
+            encodings[0], tolerance=tolerance, exclude=person_id)
+
     def load_face_database(self):
-        """Load face encodings database from file"""
-        db_file = 'data/face_encodings.json'
-        if os.path.exists(db_file):
-            try:
-                with open(db_file, 'r') as f:
-                    data = json.load(f)
-                for person_id, person_data in data.items():
-                    if 'encodings' in person_data:
-                        person_data['encodings'] = [
-                            np.array(enc) for enc in person_data['encodings']]
-                return data
-            except Exception as e:
-                print(f"Error loading face database: {e}")
-        return {}
-
-    def save_face_database(self):
-        """Save face encodings database to file"""
-        db_file = 'data/face_encodings.json'
-        serializable_data = {}
-        for person_id, person_data in self.face_encodings_db.items():
-            serializable_data[person_id] = person_data.copy()
-            if 'encodings' in person_data:
-                serializable_data[person_id]['encodings'] = [
-                    enc.tolist() if isinstance(enc, np.ndarray) else enc
-                    for enc in person_data['encodings']
-                ]
-
-        with open(db_file, 'w') as f:
-            json.dump(serializable_data, f, indent=2)
-
-    def release(self):
+        """Map the binary face store; returns (entries, rows).
+
+        Rows are memory-mapped, so nothing is parsed or copied at startup.
+        """
+        try:
+            self.face_store.migrate()
+            rows, entries = self.face_store.load()
+        except Exception as e:
+            print(f"Error loading face database: {e}")
+            return {}, self.face_store.load_matrix()
+        return entries, rows
+
+    def save_face(self, person_id, encoding, image_path):
+        """Append one face to the store (O(1), no rewrite) and remap it"""
+        row = self.face_store.append(person_id, encoding, image_path)
+        self.face_rows = self.face_store.load_matrix()
+        self.face_entries[person_id] = {'id': person_id, 'row': row,
+                                        'image': image_path}
+
+    def shutdown(self):
         """Release camera and stop update loop"""
-        Clock.unschedule(self.update)
-        if self.cap and self.cap.isOpened():
-            self.cap.release()
+        with self.users_lock:
+            self.users.clear()
+        if self.close_event is not None:
+            self.close_event.cancel()
+        self._close_camera()
+        if not self.image_writer.flush():
+            print("[WARNING] Some captured images were not saved")
         print("[INFO] Camera released.")
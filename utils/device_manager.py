@@ -0,0 +1,201 @@
+import inspect
+import threading
+
+from utils.rfid import RFIDReader
+from utils.fingerprint import FingerprintReader, load_touch_settings
+from utils.biometric_worker import BiometricWorker
+
+
+class RFIDSubscription:
+    """Handle returned by DeviceManager.subscribe_rfid"""
+
+    def __init__(self, manager, callback, once=False):
+        self.manager = manager
+        self.callback = callback
+        self.once = once
+        self.active = True
+
+    def cancel(self):
+        if self.active:
+            self.active = False
+            self.manager._unsubscribe_rfid(self)
+
+
+class DeviceLease:
+    """A screen's handle on a shared device.
+
+    Calls made through the lease are serialized with every other lease on
+    the same device, and messages the device logs while the lease holds it
+    are routed to the lease's logger.
+    """
+
+    def __init__(self, manager, device_name, owner, logger=None):
+        self.manager = manager
+        self.device_name = device_name
+        self.owner = owner
+        self.logger = logger
+        self.released = False
+        self.cancel_event = None  # Cancel flag of the latest call
+
+    @property
+    def device(self):
+        return self.manager.get_device(self.device_name)
+
+    def call(self, method_name, *args, cancel_event=None, **kwargs):
+        """Run a device method on the calling thread (blocking).
+
+        Methods taking a `cancel_event` get `cancel_event` (or a new one)
+        so cancel() reaches them even before they hold the device.
+        """
+        if self.released:
+            raise RuntimeError(f"Lease on {self.device_name} was released")
+        self.cancel_event = cancel_event or threading.Event()
+        return self.manager._call_locked(self, method_name, args, kwargs,
+                                         self.cancel_event)
+
+    def submit(self, method_name, *args, on_result=None, on_error=None,
+               on_cancel=None, **kwargs):
+        """Run a device method on the biometric worker, returns the job"""
+        # The flag exists from submission on, so cancelling the job
+        # between its start and the device call is not lost
+        cancel_event = threading.Event()
+        return self.manager.worker.submit(
+            self.call, method_name, *args, cancel_event=cancel_event,
+            on_result=on_result, on_error=on_error, on_cancel=on_cancel,
+            cancel=lambda: self.cancel(cancel_event), **kwargs)
+
+    def cancel(self, cancel_event=None):
+        """Abort the operation this lease is running, if any"""
+        cancel_event = cancel_event or self.cancel_event
+        if cancel_event is not None:
+            cancel_event.set()
+        if self.manager.active_leases.get(self.device_name) is self:
+            device = self.manager.devices.get(self.device_name)
+            if device is not None and hasattr(device, 'cancel'):
+                device.cancel()
+
+    def release(self):
+        self.cancel()
+        self.released = True
+
+
+class DeviceManager:
+    """Process-wide owner of the serial peripherals.
+
+    Each physical device is opened once, on first use, and shared by all
+    screens through leases (fingerprint sensor) or subscriptions (RFID
+    card reads).
+    """
+    _instance = None  # Singleton instance
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super(DeviceManager, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if hasattr(self, 'initialized') and self.initialized:
+            return  # Already initialized
+
+        self.devices = {}
+        self.factories = {
+            'rfid': lambda: RFIDReader(callback=self._dispatch_card),
+            'fingerprint': self._open_fingerprint,
+        }
+        self.open_lock = threading.Lock()
+        self.device_locks = {name: threading.RLock()
+                             for name in self.factories}
+        self.active_leases = {}
+        self.rfid_subscribers = []
+        self.subscribers_lock = threading.Lock()
+        self.worker = BiometricWorker()
+
+        self.initialized = True
+
+    def get_device(self, name):
+        """Return the shared device, opening it on first use"""
+        with self.open_lock:
+            if name not in self.devices:
+                print(f"[INFO] DeviceManager opening {name}")
+                self.devices[name] = self.factories[name]()
+            return self.devices[name]
+
+    def _open_fingerprint(self):
+        # Interrupt-driven finger detection when the touch line is wired
+        # (data/fingerprint_link.json or env), adaptive polling otherwise
+        touch_pin, touch_active_high = load_touch_settings()
+        return FingerprintReader(
+            logger=lambda msg: self._route_log('fingerprint', msg),
+            touch_pin=touch_pin, touch_active_high=touch_active_high)
+
+    def lease(self, name, owner, logger=None):
+        return DeviceLease(self, name, owner, logger=logger)
+
+    def _call_locked(self, lease, method_name, args, kwargs,
+                     cancel_event=None):
+        device = self.get_device(lease.device_name)
+        method = getattr(device, method_name)
+        if (cancel_event is not None and
+                'cancel_event' in inspect.signature(method).parameters):
+            kwargs = dict(kwargs, cancel_event=cancel_event)
+        with self.device_locks[lease.device_name]:
+            self.active_leases[lease.device_name] = lease
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.active_leases.pop(lease.device_name, None)
+
+    def _route_log(self, name, message):
+        lease = self.active_leases.get(name)
+        if lease is not None and lease.logger:
+            lease.logger(message)
+        else:
+            print(f"[{name}] {message}")
+
+    # RFID
+
+    def subscribe_rfid(self, callback, once=False):
+        """Call `callback(card_id)` from the reader thread on every card
+        (or only the next one with `once`). Returns an RFIDSubscription.
+        """
+        subscription = RFIDSubscription(self, callback, once=once)
+        with self.subscribers_lock:
+            self.rfid_subscribers.append(subscription)
+            first = len(self.rfid_subscribers) == 1
+        if first:
+            self.get_device('rfid').start_continuous_scan()
+        return subscription
+
+    def read_card_async(self, callback):
+        """Deliver the next card read to `callback`"""
+        return self.subscribe_rfid(callback, once=True)
+
+    def _unsubscribe_rfid(self, subscription):
+        with self.subscribers_lock:
+            if subscription in self.rfid_subscribers:
+                self.rfid_subscribers.remove(subscription)
+            idle = not self.rfid_subscribers
+        if idle and 'rfid' in self.devices:
+            self.devices['rfid'].stop_continuous_scan()
+
+    def _dispatch_card(self, card_id):
+        with self.subscribers_lock:
+            subscribers = list(self.rfid_subscribers)
+        for subscription in subscribers:
+            if subscription.once:
+                subscription.cancel()
+            try:
+                subscription.callback(card_id)
+            except Exception as e:
+                print(f"Error in RFID subscriber: {e}")
+
+    def shutdown(self):
+        """Close every open device"""
+        with self.subscribers_lock:
+            self.rfid_subscribers = []
+        for name, device in list(self.devices.items()):
+            try:
+                device.cleanup()
+            except Exception as e:
+                print(f"Error closing {name}: {e}")
+        self.devices = {}
@@ -0,0 +1,157 @@
+import os
+import json
+
+import numpy as np
+
+from utils.face_index import ENCODING_SIZE
+from utils.face_quantization import quantize, dequantize, dot_rows
+
+
+def squared_distances(points, centroids):
+    """|p - c|^2 for every point/centroid pair, shape (points, centroids)"""
+    p2 = np.einsum('ij,ij->i', points, points)[:, None]
+    c2 = np.einsum('ij,ij->i', centroids, centroids)[None, :]
+    return np.maximum(p2 - 2 * points @ centroids.T + c2, 0)
+
+
+def nearest_centroid(points, centroids, block=16384):
+    labels = np.empty(len(points), dtype=np.int32)
+    for start in range(0, len(points), block):
+        labels[start:start + block] = squared_distances(
+            points[start:start + block], centroids).argmin(axis=1)
+    return labels
+
+
+def train_centroids(matrix, nlist, iterations=15, sample=50000, seed=0):
+    """k-means (Lloyd) on at most `sample` rows; empty lists are reseeded"""
+    rng = np.random.default_rng(seed)
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if len(matrix) > sample:
+        matrix = matrix[rng.choice(len(matrix), sample, replace=False)]
+    nlist = min(nlist, len(matrix))
+    centroids = matrix[rng.choice(len(matrix), nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        labels = nearest_centroid(matrix, centroids)
+        counts = np.bincount(labels, minlength=nlist)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, matrix)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = matrix[rng.choice(len(matrix), len(empty))]
+    return centroids
+
+
+class IVFFaceIndex:
+    """Inverted-file approximate nearest-neighbour index for face encodings.
+
+    Encodings are clustered into `nlist` cells by k-means. Each cell's rows
+    are stored contiguously (sorted by cell), so a query scans only the
+    `nprobe` cells whose centroids are closest. `nprobe` trades recall for
+    latency: nprobe=nlist is an exact search. Rows can be kept quantized
+    (see utils.face_quantization).
+
+    The index is built offline and saved as a directory of .npy files that
+    load memory-mapped.
+    """
+
+    def __init__(self, centroids, keys, codes, scales, sq_norms, offsets,
+                 precision='float32', nprobe=8):
+        self.centroids = centroids
+        self.keys = keys          # Stored row -> person id
+        self.codes = codes        # Rows grouped by cell
+        self.scales = scales
+        self.sq_norms = sq_norms
+        self.offsets = offsets    # Cell i is rows offsets[i]:offsets[i + 1]
+        self.precision = precision
+        self.nprobe = nprobe
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def build(cls, keys, matrix, nlist=None, precision='float32',
+              nprobe=8, iterations=15, seed=0):
+        """Cluster `matrix` (one row per key) and lay out the cells.
+
+        `nlist` defaults to about 4 * sqrt(N), the usual IVF sizing.
+        """
+        matrix = np.asarray(matrix, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        if nlist is None:
+            nlist = max(1, int(4 * np.sqrt(len(matrix))))
+        centroids = train_centroids(matrix, nlist, iterations=iterations,
+                                    seed=seed)
+        labels = nearest_centroid(matrix, centroids)
+        order = np.argsort(labels, kind='stable')
+        offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=len(centroids)),
+                  out=offsets[1:])
+
+        codes, scales = quantize(matrix[order], precision)
+        restored = dequantize(codes, scales)
+        sq_norms = np.einsum('ij,ij->i', restored, restored)
+        keys = [keys[row] for row in order]
+        return cls(centroids, keys, codes, scales, sq_norms, offsets,
+                   precision=precision, nprobe=nprobe)
+
+    @classmethod
+    def from_store(cls, store, **kwargs):
+        """Build from every person in a FaceEmbeddingStore.
+
+        Raises ValueError when the store's index file maps no rows.
+        """
+        rows, entries = store.load()
+        if not entries:
+            raise ValueError(
+                f"{store.index_file} maps none of the {len(rows)} stored rows")
+        keys = list(entries)
+        matrix = np.stack([rows[entries[key]['row']] for key in keys])
+        return cls.build(keys, matrix, **kwargs)
+
+    def search(self, encoding, k=5, nprobe=None):
+        """Approximate `k` nearest people as [(key, distance)]"""
+        query = np.asarray(encoding, dtype=np.float32).reshape(-1)
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+
+        cell_d = squared_distances(query[None, :], self.centroids)[0]
+        cells = np.argpartition(cell_d, nprobe - 1)[:nprobe]
+        rows = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1])
+                               for c in cells])
+        if len(rows) == 0:
+            return []
+
+        d2 = (self.sq_norms[rows]
+              - 2 * dot_rows(self.codes[rows], self.scales[rows], query)
+              + query @ query)
+        k = min(k, len(rows))
+        best = np.argpartition(d2, k - 1)[:k]
+        best = best[np.argsort(d2[best])]
+        return [(self.keys[rows[i]], float(np.sqrt(max(d2[i], 0))))
+                for i in best]
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name in ('centroids', 'codes', 'scales', 'sq_norms', 'offsets'):
+            np.save(os.path.join(directory, f'{name}.npy'), getattr(self, name))
+        with open(os.path.join(directory, 'meta.json'), 'w') as f:
+            json.dump({'precision': self.precision, 'nprobe': self.nprobe,
+                       'keys': self.keys}, f)
+
+    @classmethod
+    def load(cls, directory, nprobe=None):
+        """Load a saved index; the row arrays are memory-mapped"""
+        with open(os.path.join(directory, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(directory, f'{name}.npy'),
+                                mmap_mode='r')
+                  for name in ('centroids', 'codes', 'scales', 'sq_norms',
+                               'offsets')}
+        arrays['centroids'] = np.array(arrays['centroids'])
+        return cls(keys=meta['keys'], precision=meta['precision'],
+                   nprobe=nprobe or meta['nprobe'], **arrays)
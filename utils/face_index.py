@@ -0,0 +1,154 @@
+import threading
+
+import numpy as np
+
+from utils.face_quantization import CODE_DTYPES, quantize, dequantize, dot_rows
+
+
+ENCODING_SIZE = 128  # face_recognition embedding length
+DUPLICATE_TOLERANCE = 0.5  # Stricter than the 0.6 used to verify a voter
+
+
+class FaceIndex:
+    """In-memory nearest-neighbour index over enrolled face encodings.
+
+    All encodings live in one contiguous float32 matrix (one row per
+    person) with their squared norms cached, so a query is a single
+    matrix-vector product:
+
+        |m - q|^2 = |m|^2 - 2 m.q + |q|^2
+
+    The matrix grows by doubling; removing a person moves the last row
+    into the freed slot. With `precision` 'float16' or 'int8' (per-row
+    scale) the rows are kept quantized and queried in blocks of
+    QUERY_BLOCK rows, so the float32 copy never exists in full.
+    """
+
+    QUERY_BLOCK = 65536
+
+    def __init__(self, dim=ENCODING_SIZE, capacity=1024, precision='float32'):
+        self.dim = dim
+        self.precision = precision
+        self.matrix = np.empty((capacity, dim), dtype=CODE_DTYPES[precision])
+        self.scales = np.ones(capacity, dtype=np.float32)
+        self.sq_norms = np.empty(capacity, dtype=np.float32)
+        self.keys = []   # row -> key
+        self.rows = {}   # key -> row
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_store(cls, entries, rows, precision='float32'):
+        """Build an index from the face store's (entries, rows).
+
+        When the store's precision matches, the codes are copied as-is
+        without a float32 round trip.
+        """
+        keys = list(entries)
+        row_ids = np.array([entries[key]['row'] for key in keys], dtype=np.int64)
+        index = cls(capacity=max(1024, len(keys)), precision=precision)
+        if keys:
+            if rows.precision == precision:
+                codes, scales = rows.codes[row_ids], rows.scales[row_ids]
+            else:
+                codes, scales = quantize(
+                    np.stack([rows[row] for row in row_ids]), precision)
+            count = len(keys)
+            index.matrix[:count] = codes
+            index.scales[:count] = scales
+            for start in range(0, count, cls.QUERY_BLOCK):
+                end = min(count, start + cls.QUERY_BLOCK)
+                block = dequantize(index.matrix[start:end],
+                                   index.scales[start:end])
+                index.sq_norms[start:end] = np.einsum('ij,ij->i', block, block)
+            index.keys = keys
+            index.rows = {key: row for row, key in enumerate(keys)}
+        return index
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    def _grow(self):
+        capacity = self.matrix.shape[0] * 2
+        matrix = np.empty((capacity, self.dim), dtype=self.matrix.dtype)
+        scales = np.ones(capacity, dtype=np.float32)
+        sq_norms = np.empty(capacity, dtype=np.float32)
+        count = len(self.keys)
+        matrix[:count] = self.matrix[:count]
+        scales[:count] = self.scales[:count]
+        sq_norms[:count] = self.sq_norms[:count]
+        self.matrix, self.scales, self.sq_norms = matrix, scales, sq_norms
+
+    def add(self, key, encoding):
+        """Add or replace the encoding stored for `key`"""
+        codes, scales = quantize(
+            np.asarray(encoding, dtype=np.float32).reshape(self.dim),
+            self.precision)
+        restored = dequantize(codes, scales)[0]
+        with self.lock:
+            row = self.rows.get(key)
+            if row is None:
+                if len(self.keys) == self.matrix.shape[0]:
+                    self._grow()
+                row = len(self.keys)
+                self.keys.append(key)
+                self.rows[key] = row
+            self.matrix[row] = codes[0]
+            self.scales[row] = scales[0]
+            self.sq_norms[row] = restored @ restored
+
+    def remove(self, key):
+        with self.lock:
+            row = self.rows.pop(key, None)
+            if row is None:
+                return False
+            last = len(self.keys) - 1
+            if row != last:
+                moved = self.keys[last]
+                self.matrix[row] = self.matrix[last]
+                self.scales[row] = self.scales[last]
+                self.sq_norms[row] = self.sq_norms[last]
+                self.keys[row] = moved
+                self.rows[moved] = row
+            self.keys.pop()
+            return True
+
+    def distances(self, encoding):
+        """Euclidean distance from `encoding` to every row, in row order"""
+        query = np.asarray(encoding, dtype=np.float32).reshape(self.dim)
+        with self.lock:
+            count = len(self.keys)
+            products = np.empty(count, dtype=np.float32)
+            for start in range(0, count, self.QUERY_BLOCK):
+                end = min(count, start + self.QUERY_BLOCK)
+                products[start:end] = dot_rows(
+                    self.matrix[start:end], self.scales[start:end], query)
+            d2 = self.sq_norms[:count] - 2 * products + query @ query
+        return np.sqrt(np.maximum(d2, 0))
+
+    def search(self, encoding, k=5, exclude=None):
+        """The `k` closest people as [(key, distance)], nearest first"""
+        distances = self.distances(encoding)
+        with self.lock:
+            keys = list(self.keys)
+            skip = self.rows.get(exclude)
+        if skip is not None and skip < len(distances):
+            distances[skip] = np.inf
+
+        k = min(k, len(distances))
+        if k == 0:
+            return []
+        nearest = np.argpartition(distances, k - 1)[:k]
+        nearest = nearest[np.argsort(distances[nearest])]
+        return [(keys[row], float(distances[row])) for row in nearest
+                if np.isfinite(distances[row])]
+
+    def find_duplicates(self, encoding, tolerance=DUPLICATE_TOLERANCE,
+                        exclude=None, limit=5):
+        """People whose face is within `tolerance` of `encoding`"""
+        return [(key, distance)
+                for key, distance in self.search(encoding, k=limit,
+                                                 exclude=exclude)
+                if distance <= tolerance]
@@ -0,0 +1,110 @@
+import time
+
+import cv2
+import numpy as np
+
+from utils.biometric_worker import BiometricWorker
+from utils.face_pool import FaceEncodingPool, locate_face
+from utils.face_profiles import load_face_profile
+
+try:
+    import face_recognition
+    FACE_RECOGNITION_AVAILABLE = True
+except ImportError:
+    FACE_RECOGNITION_AVAILABLE = False
+
+
+class FacePipeline:
+    """Detect, encode and match a face in one camera frame.
+
+    Detection runs on a copy of the frame downscaled by the profile's
+    `detect_scale`, which is where most of the time goes on a Pi. The
+    boxes are mapped back to full resolution so the encoding keeps its
+    accuracy. Only the largest face is encoded. Models, jitters and the
+    match tolerance come from the FaceEngineProfile (see
+    utils.face_profiles).
+    """
+
+    def __init__(self, profile=None):
+        self.profile = profile or load_face_profile()
+        self.detect_scale = self.profile.detect_scale
+        self.detection_model = self.profile.detection_model
+        self.upsample = self.profile.upsample
+        self.tolerance = self.profile.tolerance
+
+    def detect(self, rgb_frame, region=None):
+        """Largest face box in full-resolution coordinates, or None"""
+        return locate_face(rgb_frame, self.detect_scale,
+                           model=self.detection_model, upsample=self.upsample,
+                           region=region)
+
+    def process(self, frame, known_encodings=None, face_box=None):
+        """Run the pipeline on a BGR frame.
+
+        `face_box` (from the preview FaceTracker) limits detection to a
+        small crop around it. Returns a dict with the face `box`, its
+        `encoding` (None when no face was found), `matched`/`distance`
+        against `known_encodings` and per-stage `timings` in milliseconds.
+        """
+        if not FACE_RECOGNITION_AVAILABLE:
+            raise RuntimeError("face_recognition is not installed")
+
+        timings = {}
+        start = stage = time.perf_counter()
+
+        def lap(name):
+            nonlocal stage
+            now = time.perf_counter()
+            timings[name] = (now - stage) * 1000
+            stage = now
+
+        result = {'box': None, 'encoding': None, 'faces': 0,
+                  'matched': False, 'distance': None, 'timings': timings}
+        pool = FaceEncodingPool()
+        if pool.running and pool.accepts(frame):
+            # Detect and encode in a worker process, off the GIL
+            box, encoding, worker_timings = pool.encode(
+                frame, detect_scale=self.detect_scale, region=face_box,
+                **self.profile.encoder_options())
+            timings.update(worker_timings)
+            lap('pool')
+            if encoding is not None:
+                result.update(box=box, encoding=encoding, faces=1)
+        else:
+            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            lap('convert')
+
+            box = self.detect(rgb_frame, region=face_box)
+            lap('detect')
+            if box is not None:
+                result['faces'] = 1
+                encodings = face_recognition.face_encodings(
+                    rgb_frame, [box], num_jitters=self.profile.num_jitters,
+                    model=self.profile.landmarks)
+                lap('encode')
+                if encodings:
+                    result['box'] = box
+                    result['encoding'] = encodings[0]
+
+        if result['encoding'] is not None and known_encodings:
+            distances = face_recognition.face_distance(
+                np.asarray(known_encodings), result['encoding'])
+            result['distance'] = float(distances.min())
+            result['matched'] = result['distance'] <= self.tolerance
+            lap('match')
+
+        timings['total'] = (time.perf_counter() - start) * 1000
+        return result
+
+    def submit(self, frame, known_encodings=None, face_box=None,
+               on_result=None, on_error=None, on_cancel=None):
+        """Run process() on the biometric worker; callbacks run on the
+        main thread. Returns the BiometricJob.
+        """
+        return BiometricWorker().submit(
+            self.process, frame, known_encodings, face_box,
+            on_result=on_result, on_error=on_error, on_cancel=on_cancel)
+
+
+def format_timings(timings):
+    return ', '.join(f"{name} {ms:.0f} ms" for name, ms in timings.items())
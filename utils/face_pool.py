@@ -0,0 +1,276 @@
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Worker processes import this module, so it must not import Kivy
+
+
+FRAME_SLOT_BYTES = 1920 * 1080 * 3  # Largest frame a slot can carry
+
+# Each worker loads its own copy of the dlib models (~100 MB)
+SMALL_DEVICE_RAM = 2 * 1024 ** 3
+MAX_DEFAULT_PROCESSES = 2
+
+
+def default_processes():
+    """Worker count: VOTELINK_FACE_WORKERS if set, else 1 on devices with
+    less than 2 GB of RAM and at most 2 otherwise
+    """
+    configured = os.environ.get('VOTELINK_FACE_WORKERS')
+    if configured:
+        try:
+            return max(1, int(configured))
+        except ValueError:
+            print(f"[WARNING] Invalid face worker count {configured!r}")
+
+    try:
+        ram = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        ram = None
+    if ram is not None and ram < SMALL_DEVICE_RAM:
+        return 1
+    return max(1, min(MAX_DEFAULT_PROCESSES, (os.cpu_count() or 2) - 1))
+
+
+class FrameTooLarge(ValueError):
+    """The frame does not fit in an encoding pool slot"""
+    pass
+
+
+# Worker process side
+
+_attached = {}  # Shared memory blocks this worker has attached, by name
+
+
+def _attach(name):
+    block = _attached.get(name)
+    if block is None:
+        try:
+            block = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python < 3.13 always tracks; spawned workers share the
+            # parent's resource tracker, so the parent's unlink still
+            # settles it
+            block = shared_memory.SharedMemory(name=name)
+        _attached[name] = block
+    return block
+
+
+def locate_face(rgb_frame, detect_scale=0.25, model='hog', upsample=1,
+                region=None, region_width=240):
+    """Largest face box (top, right, bottom, left) in full-resolution
+    pixels, or None.
+
+    With `region` (e.g. a box from the preview tracker) detection first
+    runs on a small crop around it; only if that finds nothing does the
+    whole frame, downscaled by `detect_scale`, get searched.
+    """
+    import cv2
+    import face_recognition
+
+    height, width = rgb_frame.shape[:2]
+
+    def largest(boxes, factor, dx=0, dy=0):
+        if not boxes:
+            return None
+        top, right, bottom, left = max(
+            boxes, key=lambda b: (b[2] - b[0]) * (b[1] - b[3]))
+        return (max(0, int(top * factor) + dy),
+                min(width, int(right * factor) + dx),
+                min(height, int(bottom * factor) + dy),
+                max(0, int(left * factor) + dx))
+
+    if region is not None:
+        top, right, bottom, left = region
+        pad_x, pad_y = int((right - left) * 0.3), int((bottom - top) * 0.3)
+        x0, y0 = max(0, left - pad_x), max(0, top - pad_y)
+        x1, y1 = min(width, right + pad_x), min(height, bottom + pad_y)
+        crop = rgb_frame[y0:y1, x0:x1]
+        if crop.size:
+            scale = min(1.0, region_width / crop.shape[1])
+            if scale < 1:
+                crop = cv2.resize(crop, (0, 0), fx=scale, fy=scale,
+                                  interpolation=cv2.INTER_AREA)
+            box = largest(face_recognition.face_locations(
+                crop, number_of_times_to_upsample=0, model=model),
+                1 / scale, x0, y0)
+            if box is not None:
+                return box
+
+    small = rgb_frame
+    if detect_scale and detect_scale != 1:
+        small = cv2.resize(rgb_frame, (0, 0), fx=detect_scale,
+                           fy=detect_scale, interpolation=cv2.INTER_AREA)
+    return largest(face_recognition.face_locations(
+        small, number_of_times_to_upsample=upsample, model=model),
+        1 / (detect_scale or 1))
+
+
+def _worker_init():
+    """Load the dlib models once per worker, before the first real job"""
+    import face_recognition
+    blank = np.zeros((120, 160, 3), dtype=np.uint8)
+    face_recognition.face_encodings(blank, [(10, 110, 110, 10)])
+
+
+def _worker_encode(slot, shape, box, detect_scale, options):
+    """Detect (unless `box` is given) and encode the face in a frame
+    held in shared memory. Returns (box, encoding list or None, timings).
+    """
+    import cv2
+    import face_recognition
+
+    timings = {}
+    start = time.perf_counter()
+    frame = np.ndarray(shape, dtype=np.uint8, buffer=_attach(slot).buf)
+    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+    if box is None:
+        box = locate_face(rgb_frame, detect_scale,
+                          model=options.get('model', 'hog'),
+                          upsample=options.get('upsample', 1),
+                          region=options.get('region'))
+        timings['detect'] = (time.perf_counter() - start) * 1000
+        if box is None:
+            return None, None, timings
+
+    stage = time.perf_counter()
+    encodings = face_recognition.face_encodings(
+        rgb_frame, [box], num_jitters=options.get('num_jitters', 1),
+        model=options.get('landmarks', 'large'))
+    timings['encode'] = (time.perf_counter() - stage) * 1000
+    return box, (encodings[0].tolist() if encodings else None), timings
+
+
+# GUI process side
+
+class FaceEncodingPool:
+    """Process pool that runs face detection and encoding off the UI
+    process.
+
+    Workers are started (and their models loaded) by start(), called on
+    the first capture; `processes` defaults to default_processes(). Frames
+    travel through a fixed set of shared memory slots:
+    the caller's frame is copied once into a free slot and the worker
+    reads it in place, so no frame is ever pickled. Only the 128 floats
+    of the encoding come back.
+    """
+    _instance = None  # Singleton instance
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super(FaceEncodingPool, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self, processes=None):
+        if hasattr(self, 'initialized') and self.initialized:
+            return  # Already initialized
+
+        self.processes = processes or default_processes()
+        self.executor = None
+        self.unavailable = False  # face_recognition missing
+        self.slots = []
+        self.free_slots = None
+        self.lock = threading.Lock()
+
+        self.initialized = True
+
+    @property
+    def running(self):
+        return self.executor is not None
+
+    def start(self):
+        """Start and warm the workers; returns False if unavailable"""
+        with self.lock:
+            if self.executor is not None:
+                return True
+            if self.unavailable:
+                return False
+            try:
+                import face_recognition  # noqa: F401
+            except ImportError:
+                print("[WARNING] face_recognition missing, encoding pool disabled")
+                self.unavailable = True
+                return False
+
+            # Spawn, not fork: forking a process that runs Kivy/GL is unsafe
+            context = multiprocessing.get_context('spawn')
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.processes, mp_context=context,
+                initializer=_worker_init)
+            self.slots = [shared_memory.SharedMemory(create=True,
+                                                     size=FRAME_SLOT_BYTES)
+                          for _ in range(self.processes * 2)]
+            self.free_slots = threading.Semaphore(len(self.slots))
+            self.available = list(self.slots)
+
+        # Make every worker start and load its models now
+        for _ in range(self.processes):
+            self.executor.submit(time.sleep, 0)
+        print(f"[INFO] Face encoding pool started with {self.processes} workers")
+        return True
+
+    @staticmethod
+    def accepts(frame):
+        """True if `frame` fits in a shared memory slot"""
+        return frame.nbytes <= FRAME_SLOT_BYTES
+
+    def _take_slot(self, frame):
+        if not self.accepts(frame):
+            raise FrameTooLarge(
+                f"Frame {frame.shape} is larger than the encoding pool's "
+                f"{FRAME_SLOT_BYTES} byte slots")
+        self.free_slots.acquire()
+        with self.lock:
+            slot = self.available.pop()
+        np.ndarray(frame.shape, dtype=np.uint8, buffer=slot.buf)[...] = frame
+        return slot
+
+    def _return_slot(self, slot):
+        with self.lock:
+            self.available.append(slot)
+        self.free_slots.release()
+
+    def submit(self, frame, box=None, detect_scale=0.25, **options):
+        """Encode the largest face in a BGR frame on a worker.
+
+        Returns a concurrent.futures.Future resolving to (box, encoding
+        or None, timings). Blocks only while all slots are in use. Raises
+        FrameTooLarge for frames bigger than FRAME_SLOT_BYTES.
+        """
+        if not self.running:
+            raise RuntimeError("Face encoding pool is not running")
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        slot = self._take_slot(frame)
+        try:
+            future = self.executor.submit(_worker_encode, slot.name,
+                                          frame.shape, box, detect_scale,
+                                          options)
+        except Exception:
+            self._return_slot(slot)
+            raise
+        future.add_done_callback(lambda f: self._return_slot(slot))
+        return future
+
+    def encode(self, frame, box=None, detect_scale=0.25, **options):
+        """Blocking submit(); returns (box, encoding array or None, timings)"""
+        box, encoding, timings = self.submit(
+            frame, box=box, detect_scale=detect_scale, **options).result()
+        return box, (np.array(encoding) if encoding else None), timings
+
+    def shutdown(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is None:
+            return
+        executor.shutdown(wait=False, cancel_futures=True)
+        for slot in self.slots:
+            slot.close()
+            slot.unlink()
+        self.slots = []
+        print("[INFO] Face encoding pool stopped")
@@ -0,0 +1,73 @@
+import os
+import json
+from dataclasses import dataclass, asdict, replace
+
+
+PROFILE_FILE = 'data/face_profile.json'
+
+
+@dataclass(frozen=True)
+class FaceEngineProfile:
+    """face_recognition settings for one accuracy/latency trade-off"""
+    name: str
+    detection_model: str = 'hog'   # 'hog' (CPU) or 'cnn' (slow without CUDA)
+    upsample: int = 1              # Detector upsampling passes
+    detect_scale: float = 0.25     # Detection runs on a frame this size
+    landmarks: str = 'large'       # 'large' (68 points) or 'small' (5 points)
+    num_jitters: int = 1           # Re-samples averaged per encoding
+    tolerance: float = 0.6         # Max distance accepted as the same face
+
+    def encoder_options(self):
+        """Keyword options for FaceEncodingPool.submit()"""
+        return {'model': self.detection_model, 'upsample': self.upsample,
+                'landmarks': self.landmarks, 'num_jitters': self.num_jitters}
+
+
+PROFILES = {
+    # HOG finds faces of 80 px and up; without upsampling at half scale
+    # that means a face at least 160 px wide, fine for a kiosk camera
+    'fast': FaceEngineProfile('fast', upsample=0, detect_scale=0.5,
+                              landmarks='small', tolerance=0.55),
+    'balanced': FaceEngineProfile('balanced'),
+    'accurate': FaceEngineProfile('accurate', upsample=1, detect_scale=0.5,
+                                  num_jitters=5, tolerance=0.6),
+    'cnn': FaceEngineProfile('cnn', detection_model='cnn', upsample=0,
+                             detect_scale=0.5, num_jitters=2),
+}
+DEFAULT_PROFILE = 'balanced'
+
+
+def load_face_profile(path=PROFILE_FILE):
+    """The deployment's profile.
+
+    `data/face_profile.json` names a base profile and may override any
+    field, e.g. {"profile": "fast", "tolerance": 0.5}. The
+    VOTELINK_FACE_PROFILE environment variable overrides the base name.
+    """
+    settings = {}
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                settings = json.load(f)
+        except Exception as e:
+            print(f"Error loading face profile: {e}")
+
+    name = os.environ.get('VOTELINK_FACE_PROFILE',
+                          settings.pop('profile', DEFAULT_PROFILE))
+    settings.pop('profile', None)
+    if name not in PROFILES:
+        print(f"[WARNING] Unknown face profile {name!r}, using {DEFAULT_PROFILE}")
+        name = DEFAULT_PROFILE
+
+    known = {k: v for k, v in settings.items()
+             if k in FaceEngineProfile.__dataclass_fields__ and k != 'name'}
+    return replace(PROFILES[name], **known)
+
+
+def save_face_profile(profile, path=PROFILE_FILE):
+    """Persist `profile` as the deployment's choice"""
+    settings = asdict(profile)
+    settings['profile'] = settings.pop('name')
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(settings, f, indent=2)
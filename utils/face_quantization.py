@@ -0,0 +1,204 @@
+import time
+
+import numpy as np
+
+
+PRECISIONS = ('float32', 'float16', 'int8')
+CODE_DTYPES = {'float32': '<f4', 'float16': '<f2', 'int8': 'i1'}
+FILE_SUFFIXES = {'float32': 'f32', 'float16': 'f16', 'int8': 'i8'}
+
+
+def row_dtype(precision, dim):
+    """On-disk record for one encoding: codes plus a per-vector scale
+    (int8 only). Bytes per face: float32 512, float16 256, int8 132.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown face precision: {precision}")
+    fields = [('codes', CODE_DTYPES[precision], (dim,))]
+    if precision == 'int8':
+        fields.insert(0, ('scale', '<f4'))
+    return np.dtype(fields)
+
+
+def quantize(matrix, precision):
+    """Return (codes, scales) for a 2-D float matrix.
+
+    int8 uses a symmetric per-vector scale (max |x| / 127); the float
+    precisions are a plain cast with a unit scale.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    if precision == 'int8':
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.rint(matrix / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    return (matrix.astype(CODE_DTYPES[precision]),
+            np.ones(len(matrix), dtype=np.float32))
+
+
+def dequantize(codes, scales):
+    """Float32 rows back from (codes, scales)"""
+    block = np.asarray(codes, dtype=np.float32)
+    if codes.dtype == np.int8:
+        block = block * np.asarray(scales, dtype=np.float32)[:, None]
+    return block
+
+
+def dot_rows(codes, scales, query):
+    """Dot product of every stored row with a float32 query. The scale is
+    applied to the products, not to the matrix.
+    """
+    if codes.dtype == np.float32:
+        return codes @ query
+    products = codes.astype(np.float32) @ query
+    if codes.dtype == np.int8:
+        products *= scales
+    return products
+
+
+def encode_records(matrix, precision, dim):
+    """Pack float rows into row_dtype records for the face store"""
+    codes, scales = quantize(np.asarray(matrix).reshape(-1, dim), precision)
+    records = np.empty(len(codes), dtype=row_dtype(precision, dim))
+    records['codes'] = codes
+    if precision == 'int8':
+        records['scale'] = scales
+    return records
+
+
+class QuantizedRows:
+    """Read-only float32 view over stored records of any precision"""
+
+    def __init__(self, records, precision):
+        self.records = records
+        self.precision = precision
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def codes(self):
+        return self.records['codes']
+
+    @property
+    def scales(self):
+        if self.precision == 'int8':
+            return self.records['scale']
+        return np.ones(len(self.records), dtype=np.float32)
+
+    def __getitem__(self, row):
+        """The float32 encoding stored at `row`"""
+        codes = self.records['codes'][row]
+        if self.precision == 'float32':
+            return codes
+        if self.precision == 'int8':
+            return codes.astype(np.float32) * self.records['scale'][row]
+        return codes.astype(np.float32)
+
+
+def compare_precisions(gallery, queries, truth, tolerance=0.6, repeats=3):
+    """Measure matching with each precision against float32.
+
+    `gallery` holds one encoding per person, `queries` are fresh captures
+    and `truth[i]` is the gallery row of query i's person. Returns one
+    dict per precision with bytes per face, top-1 accuracy, agreement
+    with float32 (nearest person and accept/reject at `tolerance`), the
+    largest distance error and mean latency per query.
+    """
+    gallery = np.asarray(gallery, dtype=np.float32)
+    queries = np.asarray(queries, dtype=np.float32)
+    truth = np.asarray(truth)
+
+    def distances(codes, scales, sq_norms, query):
+        d2 = sq_norms - 2 * dot_rows(codes, scales, query) + query @ query
+        return np.sqrt(np.maximum(d2, 0))
+
+    results = {}
+    reference = None
+    for precision in PRECISIONS:
+        codes, scales = quantize(gallery, precision)
+        restored = dequantize(codes, scales)
+        sq_norms = np.einsum('ij,ij->i', restored, restored)
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            all_d = np.stack([distances(codes, scales, sq_norms, q)
+                              for q in queries])
+        latency = (time.perf_counter() - start) / (repeats * len(queries))
+
+        nearest = all_d.argmin(axis=1)
+        best = all_d[np.arange(len(queries)), nearest]
+        accepted = best <= tolerance
+        if reference is None:
+            reference = (all_d, nearest, accepted)
+        ref_d, ref_nearest, ref_accepted = reference
+
+        results[precision] = {
+            'bytes_per_face': row_dtype(precision, gallery.shape[1]).itemsize,
+            'top1_accuracy': float(np.mean((nearest == truth) & accepted)),
+            'top1_agreement': float(np.mean(nearest == ref_nearest)),
+            'decision_agreement': float(np.mean(accepted == ref_accepted)),
+            'max_distance_error': float(np.abs(all_d - ref_d).max()),
+            'latency_ms': latency * 1000,
+        }
+    return results
+
+
+def synthetic_sample(people=2000, queries=500, dim=128, spread=0.06,
+                     noise=0.035, seed=0):
+    """Gallery/query set shaped like face_recognition encodings: people
+    about 0.9-1.0 apart, captures of one person about 0.35-0.45 apart.
+    """
+    rng = np.random.default_rng(seed)
+    gallery = rng.normal(0, spread, (people, dim)).astype(np.float32)
+    truth = rng.integers(0, people, queries)
+    probes = gallery[truth] + rng.normal(0, noise, (queries, dim))
+    return gallery, probes.astype(np.float32), truth
+
+
+def format_report(results):
+    lines = [f"{'precision':<9} {'bytes':>5} {'acc':>6} {'top1=':>6} "
+             f"{'dec=':>6} {'max err':>8} {'ms/query':>9}"]
+    for precision, r in results.items():
+        lines.append(
+            f"{precision:<9} {r['bytes_per_face']:>5} {r['top1_accuracy']:>6.3f} "
+            f"{r['top1_agreement']:>6.3f} {r['decision_agreement']:>6.3f} "
+            f"{r['max_distance_error']:>8.4f} {r['latency_ms']:>9.3f}")
+    return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+    from utils.face_store import FaceEmbeddingStore, load_face_precision
+
+    parser = argparse.ArgumentParser(
+        description="Compare quantized face matching with float32")
+    parser.add_argument('--people', type=int, default=2000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--store', action='store_true',
+                        help="Use the enrolled faces (with synthetic probe "
+                             "noise) instead of synthetic people")
+    parser.add_argument('--store-precision', default=None, choices=PRECISIONS,
+                        help="Face store to read (default: the deployment's, "
+                             "data/face_store.json)")
+    args = parser.parse_args()
+
+    gallery, probes, truth = synthetic_sample(args.people, args.queries)
+    if args.store:
+        store = FaceEmbeddingStore(
+            precision=args.store_precision or load_face_precision())
+        store.migrate()
+        rows, entries = store.load()
+        if not entries:
+            raise SystemExit(f"No enrolled faces in the {store.precision} store")
+        if store.precision != 'float32':
+            # The float32 baseline is then the dequantized store
+            print(f"[INFO] Using the {store.precision} store as the baseline")
+        gallery = np.stack([rows[e['row']] for e in entries.values()])
+        rng = np.random.default_rng(0)
+        truth = rng.integers(0, len(gallery), args.queries)
+        probes = gallery[truth] + rng.normal(0, 0.035, (args.queries,
+                                                       gallery.shape[1]))
+    print(format_report(compare_precisions(gallery, probes, truth)))
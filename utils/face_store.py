@@ -0,0 +1,196 @@
+import os
+import json
+import threading
+
+import numpy as np
+
+from utils.face_index import ENCODING_SIZE
+from utils.face_quantization import (
+    FILE_SUFFIXES, PRECISIONS, QuantizedRows, encode_records, row_dtype)
+
+
+STORE_DIR = 'data'
+LEGACY_JSON_FILE = 'data/face_encodings.json'
+SETTINGS_FILE = 'data/face_store.json'
+DEFAULT_PRECISION = 'float32'
+
+
+def load_face_precision(path=SETTINGS_FILE):
+    """The deployment's face store precision.
+
+    `data/face_store.json` may set it, e.g. {"precision": "int8"}. The
+    VOTELINK_FACE_PRECISION environment variable overrides the file.
+    """
+    settings = {}
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                settings = json.load(f)
+        except Exception as e:
+            print(f"Error loading face store settings: {e}")
+
+    precision = os.environ.get('VOTELINK_FACE_PRECISION',
+                               settings.get('precision', DEFAULT_PRECISION))
+    if precision not in PRECISIONS:
+        print(f"[WARNING] Unknown face precision {precision!r}, "
+              f"using {DEFAULT_PRECISION}")
+        precision = DEFAULT_PRECISION
+    return precision
+
+
+def save_face_precision(precision, path=SETTINGS_FILE):
+    """Persist `precision` as the deployment's choice"""
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown face precision: {precision}")
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({'precision': precision}, f, indent=2)
+
+
+class FaceEmbeddingStore:
+    """Append-only binary store of face encodings.
+
+    `face_encodings.f32` holds the encodings as raw little-endian float32
+    rows and is memory-mapped at startup instead of being parsed.
+    `face_index.jsonl` maps each person id to its row and image, one JSON
+    line per save; the last line for an id wins. A save appends one row
+    and one line, so it costs the same however many faces are stored.
+
+    The row is flushed before its index line, so after a crash the index
+    never points at a missing row; a torn trailing row is ignored.
+
+    `precision` 'float16' or 'int8' keeps a quantized store next to the
+    float32 one (`face_encodings.f16`/`.i8` with its own index file); an
+    empty quantized store is filled from the float32 store on first use.
+    The app only appends to the store of the deployment's precision (see
+    load_face_precision()), so the other stores stop receiving new faces
+    once it is switched; tools should open that store too.
+    """
+
+    def __init__(self, directory=STORE_DIR, dim=ENCODING_SIZE,
+                 precision='float32'):
+        self.directory = directory
+        self.dim = dim
+        self.precision = precision
+        self.dtype = row_dtype(precision, dim)
+        suffix = FILE_SUFFIXES[precision]
+        self.matrix_file = os.path.join(directory, f'face_encodings.{suffix}')
+        if precision == 'float32':
+            self.index_file = os.path.join(directory, 'face_index.jsonl')
+        else:
+            self.index_file = os.path.join(directory, f'face_index.{suffix}.jsonl')
+        self.row_bytes = self.dtype.itemsize
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def row_count(self):
+        if not os.path.exists(self.matrix_file):
+            return 0
+        return os.path.getsize(self.matrix_file) // self.row_bytes
+
+    def load_matrix(self):
+        """Memory-map every stored row (read-only) as QuantizedRows"""
+        rows = self.row_count()
+        if rows == 0:
+            records = np.empty(0, dtype=self.dtype)
+        else:
+            records = np.memmap(self.matrix_file, dtype=self.dtype, mode='r',
+                                shape=(rows,))
+        return QuantizedRows(records, self.precision)
+
+    def load_index(self):
+        """Return {person_id: {'row': ..., 'image': ...}}"""
+        entries = {}
+        if not os.path.exists(self.index_file):
+            return entries
+        rows = self.row_count()
+        with open(self.index_file, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # Torn last line
+                if entry.get('row', rows) < rows:
+                    entries[entry['id']] = entry
+        return entries
+
+    def load(self):
+        """Return (rows, entries) for the current store"""
+        with self.lock:
+            return self.load_matrix(), self.load_index()
+
+    def _truncate_torn_row(self):
+        size = os.path.getsize(self.matrix_file)
+        if size % self.row_bytes:
+            with open(self.matrix_file, 'r+b') as f:
+                f.truncate(size - size % self.row_bytes)
+
+    def append(self, person_id, encoding, image=None):
+        """Store `encoding` for `person_id`. Returns its row number"""
+        record = encode_records(encoding, self.precision, self.dim)
+        with self.lock:
+            if os.path.exists(self.matrix_file):
+                self._truncate_torn_row()
+            with open(self.matrix_file, 'ab') as f:
+                row = f.tell() // self.row_bytes
+                f.write(record.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            entry = {'id': person_id, 'row': row, 'image': image}
+            with open(self.index_file, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+        return row
+
+    def append_many(self, people):
+        """Bulk append of (person_id, encoding, image) tuples"""
+        people = list(people)
+        if not people:
+            return
+        with self.lock:
+            if os.path.exists(self.matrix_file):
+                self._truncate_torn_row()
+            with open(self.matrix_file, 'ab') as f:
+                first_row = f.tell() // self.row_bytes
+                records = encode_records([enc for _, enc, _ in people],
+                                         self.precision, self.dim)
+                f.write(records.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.index_file, 'a') as f:
+                for offset, (person_id, _, image) in enumerate(people):
+                    f.write(json.dumps({'id': person_id,
+                                        'row': first_row + offset,
+                                        'image': image}) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+    def migrate(self, json_file=LEGACY_JSON_FILE):
+        """Fill an empty store from the float32 store or, failing that,
+        the old JSON face database. Returns the number of faces imported.
+        """
+        if self.row_count():
+            return 0
+        if self.precision != 'float32':
+            source = FaceEmbeddingStore(self.directory, self.dim)
+            rows, entries = source.load()
+            if entries:
+                self.append_many((person_id, rows[entry['row']],
+                                  entry.get('image'))
+                                 for person_id, entry in entries.items())
+                print(f"[INFO] Quantized {len(entries)} faces to {self.precision}")
+                return len(entries)
+
+        if not os.path.exists(json_file):
+            return 0
+        with open(json_file, 'r') as f:
+            data = json.load(f)
+        people = [(person_id, person_data['encodings'][0],
+                   person_data.get('image'))
+                  for person_id, person_data in data.items()
+                  if person_data.get('encodings')]
+        self.append_many(people)
+        print(f"[INFO] Migrated {len(people)} faces from {json_file}")
+        return len(people)
@@ -0,0 +1,131 @@
+import time
+import threading
+
+import cv2
+
+from utils.frame_quality import ANALYSIS_WIDTH, load_face_detector
+
+
+class FaceTracker:
+    """Keeps a current face box on the preview stream.
+
+    The Haar cascade runs every `detect_every` frames on a small grey
+    copy; in between, the face is followed by template matching in a
+    window around its last position, which costs far less than detection.
+    The box (top, right, bottom, left in preview pixels) seeds the face
+    encoder and drives the on-screen alignment hint.
+    """
+
+    def __init__(self, detect_every=5, search_margin=0.5, min_match=0.55,
+                 max_lost=10, max_age=0.5):
+        self.detect_every = detect_every
+        self.search_margin = search_margin  # Search window, in face widths
+        self.min_match = min_match          # Template match score to accept
+        self.max_lost = max_lost            # Missed frames before giving up
+        self.max_age = max_age              # Seconds a box stays current
+        self.detector = load_face_detector()
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.small_box = None    # (x, y, w, h) in analysis pixels
+            self.template = None
+            self.scale = 1.0
+            self.frame_size = None   # (width, height) of preview frames
+            self.last_detect_seq = None
+            self.lost = 0
+            self.box = None
+            self.box_time = 0.0
+
+    def _detect(self, gray):
+        faces = self.detector.detectMultiScale(gray, scaleFactor=1.2,
+                                               minNeighbors=4)
+        if len(faces) == 0:
+            return None
+        return tuple(int(v) for v in max(faces, key=lambda f: f[2] * f[3]))
+
+    def _track(self, gray):
+        x, y, w, h = self.small_box
+        margin = int(w * self.search_margin)
+        x0, y0 = max(0, x - margin), max(0, y - margin)
+        x1 = min(gray.shape[1], x + w + margin)
+        y1 = min(gray.shape[0], y + h + margin)
+        window = gray[y0:y1, x0:x1]
+        if window.shape[0] < h or window.shape[1] < w:
+            return None
+        scores = cv2.matchTemplate(window, self.template, cv2.TM_CCOEFF_NORMED)
+        _, best, _, (bx, by) = cv2.minMaxLoc(scores)
+        if best < self.min_match:
+            return None
+        return (x0 + bx, y0 + by, w, h)
+
+    def update(self, frame, seq):
+        """Process one preview frame (capture thread); returns the box"""
+        if self.detector is None:
+            return None
+        height, width = frame.shape[:2]
+        scale = ANALYSIS_WIDTH / width
+        small = cv2.resize(frame, (ANALYSIS_WIDTH, int(height * scale)),
+                           interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+        due = (self.small_box is None or self.last_detect_seq is None
+               or seq - self.last_detect_seq >= self.detect_every)
+        found = None
+        if due:
+            found = self._detect(gray)
+            self.last_detect_seq = seq
+            if found is not None:
+                x, y, w, h = found
+                self.template = gray[y:y + h, x:x + w].copy()
+        if found is None and self.small_box is not None:
+            found = self._track(gray)
+
+        with self.lock:
+            self.scale = scale
+            self.frame_size = (width, height)
+            if found is None:
+                self.lost += 1
+                if self.lost > self.max_lost:
+                    self.small_box = None
+                    self.template = None
+                    self.box = None
+                return self.box
+
+            self.lost = 0
+            self.small_box = found
+            x, y, w, h = found
+            self.box = (int(y / scale), int((x + w) / scale),
+                        int((y + h) / scale), int(x / scale))
+            self.box_time = time.monotonic()
+            return self.box
+
+    def current_box(self):
+        """The tracked box if it is recent, else None"""
+        with self.lock:
+            if self.box and time.monotonic() - self.box_time <= self.max_age:
+                return self.box
+        return None
+
+    def hint(self):
+        """Alignment instruction for the voter"""
+        with self.lock:
+            box, frame_size = self.box, self.frame_size
+        if self.detector is None or frame_size is None:
+            return 'Look directly at the camera'
+        if box is None or self.current_box() is None:
+            return 'Position your face in the frame'
+
+        width, height = frame_size
+        top, right, bottom, left = box
+        face_width = (right - left) / width
+        centre_x = (left + right) / 2 / width
+        centre_y = (top + bottom) / 2 / height
+        if face_width < 0.2:
+            return 'Move closer to the camera'
+        if face_width > 0.6:
+            return 'Move back a little'
+        if abs(centre_x - 0.5) > 0.15 or abs(centre_y - 0.45) > 0.15:
+            return 'Centre your face in the frame'
+        return 'Good - hold still'
@@ -2,31 +2,158 @@ import time
 import serial
 import json
 import os
+import threading
+from collections import deque
 
 import adafruit_fingerprint
 
+from utils.template_store import FingerprintTemplateStore
+
+try:
+    import RPi.GPIO as GPIO
+    GPIO_AVAILABLE = True
+except ImportError:
+    GPIO_AVAILABLE = False
+
+
+LINK_FILE = 'data/fingerprint_link.json'
+DEFAULT_BAUDRATE = 57600
+
+# Baud rates the R30x family accepts (9600 * N), fastest first
+SUPPORTED_BAUDRATES = [115200, 57600, 38400, 19200, 9600]
+
+# Data packet size codes used by SetSysPara parameter 6
+PACKET_SIZES = {0: 32, 1: 64, 2: 128, 3: 256}
+
+# Char-buffer sized payload used to test both transfer directions
+LINK_TEST_PATTERN = list(range(256)) * 2
+
+
+def load_touch_settings(path=LINK_FILE):
+    """The sensor's touch line as (BCM pin or None, active_high).
+
+    Read from `touch_pin` / `touch_active_high` in the link settings file,
+    e.g. {"touch_pin": 17, "touch_active_high": false}. The
+    VOTELINK_FINGERPRINT_TOUCH_PIN ("" or "none" to disable) and
+    VOTELINK_FINGERPRINT_TOUCH_ACTIVE ("high" or "low") environment
+    variables override the file. Without a pin the reader polls.
+    """
+    settings = {}
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                settings = json.load(f)
+        except Exception as e:
+            print(f"Error loading fingerprint link settings: {e}")
+
+    pin = settings.get('touch_pin')
+    active_high = settings.get('touch_active_high', True)
+
+    env_pin = os.environ.get('VOTELINK_FINGERPRINT_TOUCH_PIN')
+    if env_pin is not None:
+        env_pin = env_pin.strip().lower()
+        if env_pin in ('', 'none'):
+            pin = None
+        else:
+            try:
+                pin = int(env_pin)
+            except ValueError:
+                print(f"[WARNING] Invalid touch pin {env_pin!r}, polling instead")
+                pin = None
+    env_active = os.environ.get('VOTELINK_FINGERPRINT_TOUCH_ACTIVE')
+    if env_active is not None:
+        active_high = env_active.strip().lower() != 'low'
+
+    return (int(pin) if pin is not None else None), bool(active_high)
+
 
 class FingerprintReader:
     """Fingerprint Reader for Adafruit-compatible modules like R305"""
 
-    def __init__(self, port='/dev/serial0', baudrate=57600, logger=None):
+    # Finger detection polling: tight for the first second after a prompt,
+    # then backing off so an idle sensor is not hammered over the UART
+    FAST_POLL_INTERVAL = 0.02
+    FAST_POLL_WINDOW = 1.0
+    MAX_POLL_INTERVAL = 0.5
+    POLL_BACKOFF = 1.5
+
+    LINK_TEST_ROUNDS = 3
+
+    def __init__(self, port='/dev/serial0', baudrate=None, logger=None,
+                 touch_pin=None, touch_active_high=True, template_store=None,
+                 sensor=None):
         self.logger = logger or print
         self.port = port
-        self.baudrate = baudrate
         self.serial_connection = None
+        self.link_settings = self.load_link_settings()
         self.enrolled_fingerprints = self.load_fingerprint_database()
+        self.template_store = template_store or FingerprintTemplateStore()
 
-        try:
-            # Initialize serial connection
-            self.serial_connection = serial.Serial(port, baudrate, timeout=1)
-            print(f" Fingerprint reader connected on {port}")
-
-            # Initialize Adafruit Fingerprint Sensor
-            self.finger = adafruit_fingerprint.Adafruit_Fingerprint(
-                self.serial_connection)
-            print(" Adafruit Fingerprint initialized")
-        except Exception as e:
-            raise RuntimeError(f"Failed to initialize fingerprint reader: {e}")
+        # Per-scan finger detection latency, most recent last
+        self.scan_latencies = deque(maxlen=100)
+
+        # Cancel flag of the scan in progress; each scan gets its caller's
+        # (or a fresh) event, set by cancel() from any thread
+        self.cancel_event = threading.Event()
+
+        # Optional touch/wake-up line (BCM pin) for interrupt-driven waits
+        self.touch_pin = None
+        self.touch_event = threading.Event()
+        if touch_pin is not None:
+            self.setup_touch_interrupt(touch_pin, touch_active_high)
+
+        if sensor is not None:
+            # Pre-built sensor object, e.g. a trace-replay simulator
+            self.finger = sensor
+            self.baudrate = baudrate
+            return
+
+        # Try the requested rate, then the negotiated one, then the rest
+        candidates = [baudrate, self.link_settings.get('baudrate'),
+                      DEFAULT_BAUDRATE] + SUPPORTED_BAUDRATES
+        tried = []
+        for rate in candidates:
+            if rate is None or rate in tried:
+                continue
+            tried.append(rate)
+            try:
+                self._connect(rate)
+                break
+            except Exception as e:
+                print(f"Fingerprint reader not responding at {rate} baud: {e}")
+        else:
+            raise RuntimeError(
+                f"Failed to initialize fingerprint reader on {port}")
+
+    def _connect(self, baudrate):
+        """Open the port at `baudrate` and handshake with the sensor"""
+        if self.serial_connection:
+            self.serial_connection.close()
+
+        # Initialize serial connection
+        self.serial_connection = serial.Serial(self.port, baudrate, timeout=1)
+        self.baudrate = baudrate
+        print(f" Fingerprint reader connected on {self.port} at {baudrate} baud")
+
+        # Initialize Adafruit Fingerprint Sensor (verifies password and
+        # reads system parameters, i.e. a full round trip)
+        self.finger = adafruit_fingerprint.Adafruit_Fingerprint(
+            self.serial_connection)
+        print(" Adafruit Fingerprint initialized")
+
+    def load_link_settings(self):
+        if os.path.exists(LINK_FILE):
+            try:
+                with open(LINK_FILE, 'r') as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"Error loading fingerprint link settings: {e}")
+        return {}
+
+    def save_link_settings(self):
+        os.makedirs('data', exist_ok=True)
+        with open(LINK_FILE, 'w') as f:
+            json.dump(self.link_settings, f, indent=2)
 
     def load_fingerprint_database(self):
         db_file = 'data/fingerprints.json'
@@ -44,15 +171,26 @@ class FingerprintReader:
         with open(db_file, 'w') as f:
             json.dump(self.enrolled_fingerprints, f, indent=2)
 
-    def enroll_finger(self, location=None):
-        if location is None:
+    def enroll_finger(self, location=None, uid=None, cancel_event=None):
+        """Enroll a finger.
+
+        With `uid` the template is downloaded into the host template store
+        and the uid is returned; otherwise it is stored in sensor flash and
+        the location is returned. Returns None on failure.
+        `cancel_event` aborts the scan once set, even before it starts.
+        """
+        if uid is None and location is None:
             location = self.get_next_available_location()
 
-        if location is None:
-            print("No available storage locations")
-            return None
+            if location is None:
+                print("No available storage locations")
+                return None
 
-        print(f"Starting fingerprint enrollment at location {location}")
+        self._begin_scan(cancel_event)
+        if uid is not None:
+            print(f"Starting fingerprint enrollment for card {uid}")
+        else:
+            print(f"Starting fingerprint enrollment at location {location}")
 
         # First scan
         self.logger("Place finger on sensor...")
@@ -65,7 +203,9 @@ class FingerprintReader:
             return None
 
         self.logger("Remove finger...")
-        time.sleep(2)
+        if self.cancel_event.wait(2):
+            self.logger("Scan cancelled")
+            return None
 
         # Second scan
         self.logger("👉 Place the same finger again...")
@@ -82,6 +222,9 @@ class FingerprintReader:
             self.logger("Failed to create fingerprint model.")
             return None
 
+        if uid is not None:
+            return self._save_template_to_store(uid)
+
         if self.finger.store_model(location) != adafruit_fingerprint.OK:
             self.logger("Failed to store fingerprint.")
             return None
@@ -96,23 +239,135 @@ class FingerprintReader:
             f" Fingerprint enrolled successfully at location {location}")
         return location
 
+    def setup_touch_interrupt(self, pin, active_high=True):
+        """Watch the sensor's touch line through a GPIO edge callback"""
+        if not GPIO_AVAILABLE:
+            print("RPi.GPIO not available, using adaptive polling")
+            return False
+
+        try:
+            GPIO.setmode(GPIO.BCM)
+            pull = GPIO.PUD_DOWN if active_high else GPIO.PUD_UP
+            edge = GPIO.RISING if active_high else GPIO.FALLING
+            GPIO.setup(pin, GPIO.IN, pull_up_down=pull)
+            GPIO.add_event_detect(pin, edge, callback=self._on_touch)
+            self.touch_pin = pin
+            self.touch_active_level = GPIO.HIGH if active_high else GPIO.LOW
+            print(f" Fingerprint touch line enabled on GPIO {pin}")
+            return True
+        except Exception as e:
+            print(f"Failed to set up touch line on GPIO {pin}: {e}")
+            return False
+
+    def _begin_scan(self, cancel_event):
+        """Use the caller's cancel flag for this scan. A cancel that
+        landed before the scan started stays set.
+        """
+        self.cancel_event = cancel_event or threading.Event()
+
+    def cancel(self):
+        """Abort the scan in progress (safe to call from any thread)"""
+        self.cancel_event.set()
+        self.touch_event.set()  # Wake an interrupt-driven wait
+
+    def _on_touch(self, channel):
+        """GPIO edge callback (runs on the RPi.GPIO thread)"""
+        self.touch_event.set()
+
+    def _finger_touching(self):
+        return GPIO.input(self.touch_pin) == self.touch_active_level
+
+    def _save_template_to_store(self, uid):
+        """Download the model in char buffer 1 into the host store"""
+        try:
+            template = self.finger.get_fpdata("char", 1)
+        except Exception as e:
+            self.logger(f"Failed to download fingerprint template: {e}")
+            return None
+
+        if not template:
+            self.logger("Failed to download fingerprint template.")
+            return None
+
+        self.template_store.save(uid, template)
+        self.logger(" Fingerprint enrolled successfully")
+        return uid
+
     def _wait_for_finger(self, timeout=10):
+        """Wait for a finger and capture its image.
+
+        Uses the touch line when wired, otherwise polls `get_image()` with
+        a short interval right after the prompt and backs off afterwards.
+        """
         start = time.time()
+        polls = 0
+        interval = self.FAST_POLL_INTERVAL
+        if self.cancel_event.is_set():
+            self._record_scan_latency(start, polls, False)
+            return False
+
+        if self.touch_pin is not None:
+            self.touch_event.clear()
+            if not self._finger_touching():
+                if (not self.touch_event.wait(timeout) or
+                        self.cancel_event.is_set()):
+                    self._record_scan_latency(start, polls, False)
+                    return False
+        # Fast polling window starts once a finger is expected
+        poll_start = time.time()
+
         while True:
             result = self.finger.get_image()
+            polls += 1
             if result == adafruit_fingerprint.OK:
+                self._record_scan_latency(start, polls, True)
                 return True
             elif result == adafruit_fingerprint.NOFINGER:
                 pass
             elif result == adafruit_fingerprint.IMAGEFAIL:
                 self.logger(" Image capture failed")
+                self._record_scan_latency(start, polls, False)
+                return False
+
+            now = time.time()
+            if now - start > timeout:
+                self._record_scan_latency(start, polls, False)
                 return False
 
-            if time.time() - start > timeout:
+            if now - poll_start > self.FAST_POLL_WINDOW:
+                interval = min(interval * self.POLL_BACKOFF,
+                               self.MAX_POLL_INTERVAL)
+            if self.cancel_event.wait(interval):
+                self._record_scan_latency(start, polls, False)
                 return False
-            time.sleep(0.5)
 
-    def search_finger(self):
+    def _record_scan_latency(self, start, polls, detected):
+        """Keep one wait's numbers; see get_scan_latency_stats()"""
+        self.scan_latencies.append({
+            'latency': time.time() - start,
+            'polls': polls,
+            'detected': detected,
+            'interrupt': self.touch_pin is not None
+        })
+
+    def get_scan_latency_stats(self):
+        """Summarize recent finger detection latencies in milliseconds"""
+        detected = sorted(s['latency'] for s in self.scan_latencies
+                          if s['detected'])
+        if not detected:
+            return {'scans': len(self.scan_latencies), 'detected': 0}
+        return {
+            'scans': len(self.scan_latencies),
+            'detected': len(detected),
+            'mean_ms': sum(detected) / len(detected) * 1000,
+            'median_ms': detected[len(detected) // 2] * 1000,
+            'max_ms': detected[-1] * 1000,
+            'mean_polls': sum(s['polls'] for s in self.scan_latencies) /
+            len(self.scan_latencies)
+        }
+
+    def search_finger(self, cancel_event=None):
+        self._begin_scan(cancel_event)
         self.logger("Place your finger on the sensor...")
         if not self._wait_for_finger(timeout=10):
             self.logger("No finger detected")
@@ -130,6 +385,90 @@ class FingerprintReader:
         self.logger("No match found")
         return None, None
 
+    def verify_finger(self, location, cancel_event=None):
+        """1:1 match of a live finger against the template at `location`.
+
+        Loads the stored template into char buffer 2 and compares it with
+        the scan in buffer 1, so the cost does not depend on how many
+        templates the sensor library holds.
+        Returns (matched, confidence).
+        """
+        self._begin_scan(cancel_event)
+        self.logger("Place your finger on the sensor...")
+        if not self._wait_for_finger(timeout=10):
+            self.logger("No finger detected")
+            return False, None
+
+        if self.finger.image_2_tz(1) != adafruit_fingerprint.OK:
+            self.logger("Failed to convert image")
+            return False, None
+
+        if self.finger.load_model(int(location), 2) != adafruit_fingerprint.OK:
+            self.logger(f"Failed to load template at location {location}")
+            return False, None
+
+        if self.finger.compare_templates() == adafruit_fingerprint.OK:
+            confidence = self._compare_confidence()
+            self.logger(
+                f" Matched location {location} with confidence {confidence}")
+            return True, confidence
+
+        self.logger("Fingerprint does not match")
+        return False, None
+
+    def verify_template(self, uid, cancel_event=None):
+        """1:1 match of a live finger against the host-stored template.
+
+        Uploads only this voter's template into char buffer 2 and compares
+        it on the sensor. Returns (matched, confidence).
+        """
+        template = self.template_store.load(uid)
+        if template is None:
+            self.logger("No fingerprint template stored for this card")
+            return False, None
+
+        self._begin_scan(cancel_event)
+        self.logger("Place your finger on the sensor...")
+        if not self._wait_for_finger(timeout=10):
+            self.logger("No finger detected")
+            return False, None
+
+        if self.finger.image_2_tz(1) != adafruit_fingerprint.OK:
+            self.logger("Failed to convert image")
+            return False, None
+
+        try:
+            self.finger.send_fpdata(template, "char", 2)
+        except Exception as e:
+            self.logger(f"Failed to upload template: {e}")
+            return False, None
+
+        if self.finger.compare_templates() == adafruit_fingerprint.OK:
+            confidence = self._compare_confidence()
+            self.logger(
+                f" Matched card {uid} with confidence {confidence}")
+            return True, confidence
+
+        self.logger("Fingerprint does not match")
+        return False, None
+
+    def _compare_confidence(self):
+        """Score of the last compare_templates(); the driver leaves it as
+        a 1-tuple from struct.unpack (searches set a plain int)
+        """
+        return self.finger.confidence[0]
+
+    def verify_voter(self, voter, cancel_event=None):
+        """1:1 verify a voter record using its host template or sensor slot"""
+        if voter.get('fingerprint_store') == 'host':
+            return self.verify_template(voter.get('uid'), cancel_event)
+
+        location = voter.get('fingerprint_id')
+        if location is None:
+            self.logger("No fingerprint enrolled for this voter")
+            return False, None
+        return self.verify_finger(location, cancel_event)
+
     def delete_finger(self, location):
         if self.finger.delete_model(location) == adafruit_fingerprint.OK:
             self.enrolled_fingerprints.pop(str(location), None)
@@ -145,6 +484,151 @@ class FingerprintReader:
                 return i
         return None
 
+    def _link_round_trip(self):
+        """Check commands and both data directions work on the current link"""
+        try:
+            for _ in range(self.LINK_TEST_ROUNDS):
+                if self.finger.verify_password() != adafruit_fingerprint.OK:
+                    return False
+                self.finger.read_sysparam()
+
+            # Push a known pattern into a char buffer and read it back
+            self.finger.send_fpdata(LINK_TEST_PATTERN, "char", 2)
+            echoed = self.finger.get_fpdata("char", 2)
+            return echoed[:len(LINK_TEST_PATTERN)] == LINK_TEST_PATTERN
+        except Exception as e:
+            print(f"Link test failed: {e}")
+            return False
+
+    def _set_baudrate(self, baudrate):
+        """Switch sensor and host to `baudrate`. Returns True if verified"""
+        previous = self.baudrate
+        try:
+            self.finger.set_sysparam(4, baudrate // 9600)
+        except Exception as e:
+            print(f"Sensor rejected {baudrate} baud: {e}")
+            return False
+
+        self.serial_connection.baudrate = baudrate
+        self.serial_connection.reset_input_buffer()
+        self.baudrate = baudrate
+        if self._link_round_trip():
+            return True
+
+        # Some modules only apply the new rate after a power cycle
+        self.serial_connection.baudrate = previous
+        self.serial_connection.reset_input_buffer()
+        self.baudrate = previous
+        if self._link_round_trip():
+            print(f"Sensor kept {previous} baud after requesting {baudrate}")
+            return False
+
+        self._recover_link()
+        return False
+
+    def _recover_link(self):
+        """Find the rate the sensor is answering on after a failed switch"""
+        for rate in SUPPORTED_BAUDRATES:
+            self.serial_connection.baudrate = rate
+            self.serial_connection.reset_input_buffer()
+            try:
+                if self.finger.verify_password() == adafruit_fingerprint.OK:
+                    self.baudrate = rate
+                    print(f"Recovered fingerprint link at {rate} baud")
+                    return True
+            except Exception:
+                continue
+        raise RuntimeError("Lost contact with fingerprint sensor")
+
+    def _set_packet_size(self, code):
+        previous = self.finger.data_packet_size
+        try:
+            self.finger.set_sysparam(6, code)
+        except Exception as e:
+            print(f"Sensor rejected packet size {PACKET_SIZES[code]}: {e}")
+            return False
+
+        if self._link_round_trip():
+            return True
+
+        self.serial_connection.reset_input_buffer()
+        self.finger.set_sysparam(6, previous)
+        return False
+
+    def benchmark_link(self, rounds=3):
+        """Time template and image transfers on the current link (seconds).
+
+        Upload is host -> sensor, download is sensor -> host.
+        """
+        timings = {'template_upload': [], 'template_download': [],
+                   'image_download': []}
+        for _ in range(rounds):
+            start = time.time()
+            self.finger.send_fpdata(LINK_TEST_PATTERN, "char", 2)
+            if self.serial_connection:
+                self.serial_connection.flush()  # Until the last byte is out
+            timings['template_upload'].append(time.time() - start)
+            self.finger.verify_password()  # Let the sensor settle, untimed
+
+            start = time.time()
+            self.finger.get_fpdata("char", 2)
+            timings['template_download'].append(time.time() - start)
+
+            start = time.time()
+            self.finger.get_fpdata("image")
+            timings['image_download'].append(time.time() - start)
+
+        return {name: min(values) for name, values in timings.items()}
+
+    def negotiate_link(self, baudrates=None, packet_codes=None, benchmark=True):
+        """Move to the fastest baud rate and packet size that pass a
+        round-trip test, persist them and optionally benchmark each step.
+        """
+        baudrates = baudrates or SUPPORTED_BAUDRATES
+        packet_codes = packet_codes or sorted(PACKET_SIZES, reverse=True)
+        results = []
+
+        def record(label):
+            entry = {'setting': label, 'baudrate': self.baudrate,
+                     'packet_size': PACKET_SIZES.get(self.finger.data_packet_size)}
+            if benchmark:
+                try:
+                    entry.update(self.benchmark_link())
+                except Exception as e:
+                    print(f"Link benchmark failed: {e}")
+            results.append(entry)
+            print(f"[INFO] Link {entry}")
+
+        record('initial')
+
+        for rate in sorted(baudrates, reverse=True):
+            if rate == self.baudrate:
+                break
+            if self._set_baudrate(rate):
+                record(f'{rate} baud')
+                break
+
+        for code in packet_codes:
+            if code == self.finger.data_packet_size:
+                break
+            if self._set_packet_size(code):
+                record(f'{PACKET_SIZES[code]} byte packets')
+                break
+
+        # Keep other settings in the file (e.g. the touch line)
+        self.link_settings = dict(self.link_settings)
+        self.link_settings.update({
+            'baudrate': self.baudrate,
+            'data_packet_size': self.finger.data_packet_size,
+            'negotiated_at': time.time(),
+            'benchmarks': results
+        })
+        self.save_link_settings()
+        self.logger(
+            f"Fingerprint link: {self.baudrate} baud, "
+            f"{PACKET_SIZES.get(self.finger.data_packet_size)} byte packets")
+        return self.link_settings
+
     def get_fingerprint_count(self):
         try:
             return self.finger.count_templates()
@@ -168,9 +652,27 @@ class FingerprintReader:
             return {}
 
     def cleanup(self):
+        if self.touch_pin is not None:
+            try:
+                GPIO.remove_event_detect(self.touch_pin)
+                GPIO.cleanup(self.touch_pin)
+            except Exception as e:
+                self.logger(f"Error releasing touch line: {e}")
+            self.touch_pin = None
+
         if self.serial_connection:
             try:
                 self.serial_connection.close()
                 self.logger("Fingerprint reader connection closed")
             except Exception as e:
                 self.logger(f"Error during cleanup: {e}")
+
+
+# Run as `python -m utils.fingerprint` from the project root, or use
+# negotiate_fingerprint_link.py
+if __name__ == "__main__":
+    reader = FingerprintReader()
+    try:
+        print(json.dumps(reader.negotiate_link(), indent=2))
+    finally:
+        reader.cleanup()
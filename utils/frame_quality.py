@@ -0,0 +1,147 @@
+import os
+import time
+import threading
+from collections import deque
+
+import cv2
+
+
+ANALYSIS_WIDTH = 160  # Quality checks run on a frame this wide
+
+
+def load_face_detector():
+    """OpenCV's frontal-face Haar cascade, or None if this build lacks it
+    (distro packages without cv2.data, OpenCV 5 without contrib)
+    """
+    try:
+        path = os.path.join(cv2.data.haarcascades,
+                            'haarcascade_frontalface_default.xml')
+        detector = cv2.CascadeClassifier(path)
+    except AttributeError:
+        return None
+    return None if detector.empty() else detector
+
+
+class FrameQualityGate:
+    """Scores preview frames cheaply and keeps the best recent one.
+
+    Each checked frame is downscaled to ANALYSIS_WIDTH and measured for
+    sharpness (variance of the Laplacian), brightness (mean grey level)
+    and the size of the largest face the Haar cascade (or the preview
+    FaceTracker) finds. Frames that
+    pass all checks are ranked by sharpness and face size; the best of the
+    last `history` checked frames is what expensive face encoding gets.
+    """
+
+    def __init__(self, history=8, every=2, min_sharpness=40.0,
+                 min_brightness=60.0, max_brightness=200.0,
+                 min_face_fraction=0.2, max_age=1.0, tracker=None):
+        self.every = every  # Check every Nth frame
+        self.min_sharpness = min_sharpness
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.min_face_fraction = min_face_fraction  # Face width / frame width
+        self.max_age = max_age  # Seconds a kept frame stays usable
+        self.recent = deque(maxlen=history)
+        self.last_quality = None
+        self.lock = threading.Lock()
+        # With a FaceTracker the face size comes from its box instead of
+        # running the cascade here as well
+        self.tracker = tracker
+        self.detector = None if tracker else load_face_detector()
+
+    def assess(self, frame):
+        """Return the quality dict for one BGR frame"""
+        scale = ANALYSIS_WIDTH / frame.shape[1]
+        small = cv2.resize(frame, (ANALYSIS_WIDTH, int(frame.shape[0] * scale)),
+                           interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+        sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+        brightness = float(gray.mean())
+        quality = {'sharpness': sharpness, 'brightness': brightness,
+                   'face_box': None, 'face_fraction': None,
+                   'ok': False, 'reason': None, 'score': 0.0}
+
+        if brightness < self.min_brightness:
+            quality['reason'] = 'too_dark'
+        elif brightness > self.max_brightness:
+            quality['reason'] = 'too_bright'
+        elif sharpness < self.min_sharpness:
+            quality['reason'] = 'blurry'
+
+        if quality['reason'] is None and self.tracker is not None:
+            if self.tracker.detector is not None:
+                box = self.tracker.current_box()
+                if box is None:
+                    quality['reason'] = 'no_face'
+                else:
+                    top, right, bottom, left = box
+                    quality['face_box'] = box
+                    quality['face_fraction'] = (right - left) / frame.shape[1]
+                    if quality['face_fraction'] < self.min_face_fraction:
+                        quality['reason'] = 'face_too_small'
+        elif quality['reason'] is None and self.detector is not None:
+            faces = self.detector.detectMultiScale(
+                gray, scaleFactor=1.2, minNeighbors=4)
+            if len(faces) == 0:
+                quality['reason'] = 'no_face'
+            else:
+                x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+                quality['face_fraction'] = w / gray.shape[1]
+                # (top, right, bottom, left) in full-frame pixels, as
+                # face_recognition expects
+                quality['face_box'] = (int(y / scale), int((x + w) / scale),
+                                       int((y + h) / scale), int(x / scale))
+                if quality['face_fraction'] < self.min_face_fraction:
+                    quality['reason'] = 'face_too_small'
+
+        if quality['reason'] is None:
+            quality['ok'] = True
+            quality['score'] = sharpness * (quality['face_fraction'] or 1.0)
+        return quality
+
+    def submit(self, frame, seq):
+        """Assess a preview frame (capture thread); keeps it if it passes.
+
+        Returns the quality dict, or None when the frame was skipped.
+        """
+        if self.every > 1 and seq % self.every:
+            return None
+        quality = self.assess(frame)
+        quality['seq'] = seq
+        with self.lock:
+            self.last_quality = quality
+            if quality['ok']:
+                self.recent.append((time.monotonic(), seq, frame, quality))
+        return quality
+
+    def best(self):
+        """(frame, quality) of the best recent passing frame, or (None, None)"""
+        now = time.monotonic()
+        with self.lock:
+            candidates = [item for item in self.recent
+                          if now - item[0] <= self.max_age]
+        if not candidates:
+            return None, None
+        _, _, frame, quality = max(candidates, key=lambda item: item[3]['score'])
+        return frame, quality
+
+    def reset(self):
+        with self.lock:
+            self.recent.clear()
+            self.last_quality = None
+
+    def hint(self):
+        """Short instruction for the voter based on the last checked frame"""
+        quality = self.last_quality
+        if quality is None:
+            return 'Waiting for camera...'
+        return {
+            None: 'Hold still',
+            'too_dark': 'Too dark - face the light',
+            'too_bright': 'Too bright - move out of direct light',
+            'blurry': 'Hold still - image is blurry',
+            'no_face': 'Position your face in the frame',
+            'face_too_small': 'Move closer to the camera',
+        }.get(quality['reason'], 'Hold still')
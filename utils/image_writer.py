@@ -0,0 +1,120 @@
+import os
+import time
+import queue
+import threading
+
+import cv2
+
+
+# cv2.imencode parameters per format; `quality` (0-100) fills in the
+# lossy ones, PNG is lossless and always uses a fast compression level
+ENCODE_PARAMS = {
+    'jpg': lambda quality: [cv2.IMWRITE_JPEG_QUALITY, quality],
+    'webp': lambda quality: [cv2.IMWRITE_WEBP_QUALITY, max(1, quality)],
+    'png': lambda quality: [cv2.IMWRITE_PNG_COMPRESSION, 3],
+}
+
+
+class ImageWriterBusy(Exception):
+    """The write queue is full; the image was not queued"""
+    pass
+
+
+class ImageWriter:
+    """Writes captured images to disk on a background thread.
+
+    Encoding a frame and writing it to an SD card can take hundreds of
+    milliseconds, so callers only queue the frame and get the final path
+    back at once. The queue is bounded: when `max_pending` images are
+    waiting, submit() raises ImageWriterBusy instead of blocking the
+    caller (usually the UI thread) or letting frames pile up in memory.
+    Files are written under a temporary name
+    and renamed, so a crash never leaves a half-written image behind.
+    """
+    _instance = None  # Singleton instance
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super(ImageWriter, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self, image_format='jpg', quality=90, max_pending=4):
+        if hasattr(self, 'initialized') and self.initialized:
+            return  # Already initialized
+
+        if image_format not in ENCODE_PARAMS:
+            raise ValueError(f"Unsupported image format: {image_format}")
+        self.image_format = image_format
+        self.quality = quality
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+        self.initialized = True
+
+    @property
+    def extension(self):
+        return '.' + self.image_format
+
+    def submit(self, path, frame=None, jpeg=None, on_done=None):
+        """Queue a BGR `frame` (or ready-made `jpeg` bytes) for `path`.
+
+        The extension of `path` is replaced by the configured format's;
+        the final path is returned. `jpeg` is written as is when the
+        format is 'jpg', otherwise `frame` is encoded. `on_done(path, ok)`
+        is called on the writer thread once the file is in place (or the
+        write failed); nothing should refer to the path before that.
+        Raises ImageWriterBusy when `max_pending` images are queued.
+        """
+        path = os.path.splitext(path)[0] + self.extension
+        if self.image_format != 'jpg':
+            jpeg = None
+        if frame is None and jpeg is None:
+            raise ValueError("Nothing to write")
+        try:
+            self.pending.put_nowait((path, frame, jpeg, on_done))
+        except queue.Full:
+            raise ImageWriterBusy(
+                f"{self.pending.maxsize} images are still being saved")
+        return path
+
+    def _encode(self, frame):
+        params = ENCODE_PARAMS[self.image_format](int(self.quality))
+        ok, data = cv2.imencode(self.extension, frame, params)
+        if not ok:
+            raise ValueError(f"Could not encode image as {self.image_format}")
+        return data
+
+    def _run(self):
+        while True:
+            path, frame, jpeg, on_done = self.pending.get()
+            ok = False
+            try:
+                data = jpeg if jpeg is not None else self._encode(frame)
+                temp_path = path + '.tmp'
+                with open(temp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(temp_path, path)
+                ok = True
+                print(f"[INFO] Image saved at {path}")
+            except Exception as e:
+                print(f"[ERROR] Failed to save image {path}: {e}")
+            finally:
+                self.pending.task_done()
+
+            if on_done:
+                try:
+                    on_done(path, ok)
+                except Exception as e:
+                    print(f"Image writer callback failed: {e}")
+
+    def flush(self, timeout=5.0):
+        """Wait until every queued image is written; False on timeout"""
+        deadline = time.monotonic() + timeout
+        with self.pending.all_tasks_done:
+            while self.pending.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.pending.all_tasks_done.wait(remaining)
+        return True
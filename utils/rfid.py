@@ -4,14 +4,109 @@ import threading
 import random
 import string
 import glob
+import os
+import json
+from collections import deque
 from datetime import datetime
 
 
+PORT_CACHE_FILE = 'data/rfid_port.json'
+RFID_BAUDRATE = 9600
+
+# USB-serial bridges used by the reader boards (vendor, product)
+KNOWN_READER_USB_IDS = [
+    ('1a86', '7523'),  # CH340
+    ('2341', None),    # Arduino
+    ('0403', '6001'),  # FTDI FT232
+    ('10c4', 'ea60'),  # CP210x
+]
+
+
+def read_usb_identity(port):
+    """Return {'vid', 'pid', 'serial'} for a tty from sysfs, or None"""
+    name = os.path.basename(port)
+    device = os.path.realpath(f'/sys/class/tty/{name}/device')
+    # Walk up from the interface to the USB device node
+    while device and device != '/':
+        vid_file = os.path.join(device, 'idVendor')
+        if os.path.exists(vid_file):
+            identity = {}
+            for key, filename in (('vid', 'idVendor'), ('pid', 'idProduct'),
+                                  ('serial', 'serial')):
+                try:
+                    with open(os.path.join(device, filename)) as f:
+                        identity[key] = f.read().strip().lower()
+                except IOError:
+                    identity[key] = None
+            return identity
+        device = os.path.dirname(device)
+    return None
+
+
+class CardFrameParser:
+    """Incremental framer for the reader's line protocol.
+
+    The reader prints `Card found`, then `Dec: ...` and `Hex: ...` lines
+    for every tap. Bytes can be fed in arbitrary chunks; completed cards
+    are returned as (card_id, card_data) tuples.
+    """
+
+    def __init__(self):
+        self.buffer = b''
+        self.card_data = {}
+
+    def reset(self):
+        self.buffer = b''
+        self.card_data = {}
+
+    def feed(self, data):
+        """Consume raw bytes and return the cards completed by them"""
+        self.buffer += data
+        cards = []
+        while b'\n' in self.buffer:
+            raw_line, self.buffer = self.buffer.split(b'\n', 1)
+            card = self.parse_line(raw_line.decode('utf-8', 'ignore').strip())
+            if card:
+                cards.append(card)
+        return cards
+
+    def parse_line(self, line):
+        # Skip empty lines and dots
+        if not line or line == ".":
+            return None
+
+        # Look for card detection
+        if "Card found" in line:
+            self.card_data = {}
+
+        # Extract decimal values
+        elif line.startswith("Dec: "):
+            dec_str = line.replace("Dec: ", "").strip()
+            try:
+                self.card_data['decimal'] = [
+                    int(x.strip()) for x in dec_str.split(",")]
+            except ValueError:
+                print(f"Ignoring malformed RFID line: {line}")
+
+        # Extract hex values and create card ID
+        elif line.startswith("Hex: "):
+            hex_str = line.replace("Hex: ", "").strip()
+            hex_values = [x.strip().upper() for x in hex_str.split(",")]
+            card_data = dict(self.card_data, hex=hex_values)
+            self.card_data = {}
+
+            # Create a unique card ID from hex values
+            card_id = "".join([val.zfill(2) for val in hex_values])
+            return card_id, card_data
+
+        return None
+
+
 class RFIDReader:
     """RFID Reader class for USB-connected RFID module"""
 
-    def __init__(self, callback=None):
-        self.ser = None
+    def __init__(self, callback=None, ser=None):
+        self.ser = ser  # Optional pre-opened port, e.g. a trace-replay simulator
         self.simulation_mode = False  # Set to False for actual hardware
         self.callback = callback  # Optional callback for real-time updates
         self.last_card_id = None
@@ -20,6 +115,12 @@ class RFIDReader:
         self.is_scanning = False
         self.scan_thread = None
         self.current_card_data = {}
+        self.parser = CardFrameParser()
+        self.pending_cards = deque()  # Framed cards not yet returned
+        self.read_timeout = 0.5  # Blocking read timeout in the scan thread
+        # (port, usb identity) picked only because it stayed silent; it is
+        # cached once it delivers a real card frame
+        self.provisional_port = None
 
         # Known cards database (for testing)
         self.known_cards = {
@@ -27,7 +128,9 @@ class RFIDReader:
             "AABBCCDDEE": {"name": "Jane Smith", "access_level": "user"}
         }
 
-        if not self.simulation_mode:
+        if self.ser is not None:
+            print("RFID Reader using provided serial port")
+        elif not self.simulation_mode:
             self.initialize_serial()
         else:
             print("RFID Reader in simulation mode")
@@ -38,8 +141,7 @@ class RFIDReader:
             # Try to find the correct port automatically
             port = self.find_serial_port()
             if port:
-                self.ser = serial.Serial(port, 9600, timeout=1)
-                time.sleep(2)  # Give device time to initialize
+                self.ser = self._open_port(port, timeout=1)
                 print(f"RFID Reader connected to {port}")
                 self.simulation_mode = False
             else:
@@ -49,23 +151,117 @@ class RFIDReader:
             print(f"Failed to initialize RFID reader: {e}")
             self.simulation_mode = True
 
-    def find_serial_port(self):
-        """Automatically find the correct serial port"""
-        possible_ports = ['/dev/ttyUSB0', '/dev/ttyACM0', '/dev/ttyUSB1']
-
-        # Add all available USB/ACM ports
-        possible_ports.extend(glob.glob('/dev/ttyUSB*'))
-        possible_ports.extend(glob.glob('/dev/ttyACM*'))
+    def _open_port(self, port, timeout):
+        """Open `port` with DTR held low so Arduino-style boards don't
+        reset, which removes the 2 s boot wait after opening
+        """
+        ser = serial.Serial()
+        ser.port = port
+        ser.baudrate = RFID_BAUDRATE
+        ser.timeout = timeout
+        ser.dtr = False
+        ser.open()
+        return ser
+
+    def _handshake(self, port, wait=0.1):
+        """Quick check of what `port` sends.
+
+        Returns 'reader' when it sends a line of the reader's protocol
+        (idle dots or a card frame), 'silent' when it sends nothing (an
+        idle reader, but also any other quiet device) and None when it
+        sends anything else (printer status, fingerprint packets).
+        """
+        try:
+            ser = self._open_port(port, timeout=wait)
+        except (serial.SerialException, OSError):
+            return None
+        try:
+            data = ser.read(ser.in_waiting or 1)
+            if data:
+                time.sleep(wait)  # Let the rest of the line arrive
+                data += ser.read(ser.in_waiting)
+        finally:
+            ser.close()
+
+        if not data:
+            return 'silent'
+        if not all(32 <= b < 127 or b in (9, 10, 13) for b in data):
+            return None
+        lines = [line.strip() for line in data.split(b'\n')]
+        if any(line == b'.' or line.startswith((b'Card found', b'Dec: ', b'Hex: '))
+               for line in lines):
+            return 'reader'
+        return None
 
-        for port in possible_ports:
+    def load_port_cache(self):
+        if os.path.exists(PORT_CACHE_FILE):
             try:
-                test_ser = serial.Serial(port, 9600, timeout=1)
-                test_ser.close()
-                return port
-            except serial.SerialException:
-                continue
+                with open(PORT_CACHE_FILE, 'r') as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"Error loading RFID port cache: {e}")
+        return {}
 
-        return None
+    def save_port_cache(self, port, identity):
+        os.makedirs(os.path.dirname(PORT_CACHE_FILE), exist_ok=True)
+        with open(PORT_CACHE_FILE, 'w') as f:
+            json.dump({'port': port, 'usb': identity}, f, indent=2)
+
+    def list_usb_serial_ports(self):
+        """{port: usb identity} for every USB tty"""
+        ports = {}
+        for port in sorted(glob.glob('/dev/ttyUSB*') + glob.glob('/dev/ttyACM*')):
+            ports[port] = read_usb_identity(port)
+        return ports
+
+    def find_serial_port(self):
+        """Find the reader's port: cached USB identity first, probing on a miss.
+
+        Only a port that sent reader output is cached. A port that merely
+        stayed silent is used provisionally and cached on its first card.
+        """
+        ports = self.list_usb_serial_ports()
+        cache = self.load_port_cache()
+        cached_usb = cache.get('usb')
+        self.provisional_port = None
+
+        # The tty name can change between boots, the USB identity can't
+        if cached_usb:
+            for port, identity in ports.items():
+                if identity == cached_usb and self._handshake(port) is not None:
+                    return port
+
+        # Cache miss: probe known reader bridges first, then other USB ttys
+        def is_known_reader(identity):
+            return identity is not None and any(
+                identity['vid'] == vid and (pid is None or identity['pid'] == pid)
+                for vid, pid in KNOWN_READER_USB_IDS)
+
+        candidates = sorted(ports, key=lambda p: not is_known_reader(ports[p]))
+        silent = None
+        for port in candidates:
+            result = self._handshake(port)
+            if result == 'reader':
+                if ports[port]:
+                    self.save_port_cache(port, ports[port])
+                return port
+            if result == 'silent' and silent is None:
+                silent = port
+
+        if silent is not None:
+            print(f"RFID port {silent} is silent, using it until a card confirms it")
+            self.provisional_port = (silent, ports[silent])
+        return silent
+
+    def _confirm_port(self):
+        """A card frame arrived: the provisional port is the reader"""
+        port, identity = self.provisional_port
+        self.provisional_port = None
+        if identity:
+            try:
+                self.save_port_cache(port, identity)
+            except (IOError, OSError) as e:
+                print(f"Error saving RFID port cache: {e}")
 
     def start_continuous_scan(self):
         """Start continuous scanning in a separate thread"""
@@ -80,24 +276,67 @@ class RFIDReader:
     def stop_continuous_scan(self):
         """Stop continuous scanning"""
         self.is_scanning = False
-        if self.scan_thread:
+        # A subscriber may stop scanning from inside the scan callback
+        if self.scan_thread and self.scan_thread is not threading.current_thread():
             self.scan_thread.join(timeout=1)
 
     def _scan_loop(self):
-        """Internal scanning loop"""
+        """Reader thread: block on the port and push cards to the callback"""
+        if self.ser:
+            # Blocking reads wake on data; the timeout only bounds how long
+            # stop_continuous_scan() waits
+            self.ser.timeout = self.read_timeout
+            self.parser.reset()
+
         while self.is_scanning:
             try:
-                card_id = self.read_card()
-                if card_id and self.callback:
-                    self.callback(card_id)
-                time.sleep(0.1)  # Small delay to prevent overwhelming
+                if self.simulation_mode or not self.ser:
+                    card_id = self.read_card()
+                    if card_id and self.callback:
+                        self.callback(card_id)
+                    time.sleep(0.1)
+                    continue
+
+                data = self.ser.read(max(1, self.ser.in_waiting))
+                if not data:
+                    continue
+
+                for card_id, card_data in self.parser.feed(data):
+                    if self._accept_card(card_id, card_data) and self.callback:
+                        self.callback(card_id)
             except Exception as e:
                 print(f"Error in scan loop: {e}")
                 time.sleep(1)
 
+    def _accept_card(self, card_id, card_data):
+        """Apply the same-card cooldown and log accepted reads"""
+        if self.provisional_port is not None:
+            self._confirm_port()
+        self.current_card_data = card_data
+
+        # Check cooldown to prevent duplicate reads
+        current_time = time.time()
+        if (card_id != self.last_card_id or
+                current_time - self.last_scan_time > self.scan_cooldown):
+
+            self.last_card_id = card_id
+            self.last_scan_time = current_time
+
+            # Log the card read
+            self.log_card_read(card_id, card_data)
+            return True
+        return False
+
+    def _next_pending_card(self):
+        while self.pending_cards:
+            card_id, card_data = self.pending_cards.popleft()
+            if self._accept_card(card_id, card_data):
+                return card_id
+        return None
+
     def read_card(self):
         """
-        Read RFID card and return UID
+        Read RFID card and return UID (non-blocking)
         Returns: str - UID of the card or None if no card detected
         """
         if self.simulation_mode:
@@ -107,50 +346,11 @@ class RFIDReader:
             return None
 
         try:
-            # Check if data is available
-            if self.ser.in_waiting > 0:
-                line = self.ser.readline().decode('utf-8').strip()
-
-                # Skip empty lines and dots
-                if not line or line == ".":
-                    return None
-
-                # Look for card detection
-                if "Card found" in line:
-                    self.current_card_data = {}
-                    return None
-
-                # Extract decimal values
-                elif line.startswith("Dec: "):
-                    dec_str = line.replace("Dec: ", "").strip()
-                    dec_values = [int(x.strip()) for x in dec_str.split(",")]
-                    self.current_card_data['decimal'] = dec_values
-                    return None
-
-                # Extract hex values and create card ID
-                elif line.startswith("Hex: "):
-                    hex_str = line.replace("Hex: ", "").strip()
-                    hex_values = [x.strip().upper()
-                                  for x in hex_str.split(",")]
-                    self.current_card_data['hex'] = hex_values
-
-                    # Create a unique card ID from hex values
-                    card_id = "".join([val.zfill(2) for val in hex_values])
-
-                    # Check cooldown to prevent duplicate reads
-                    current_time = time.time()
-                    if (card_id != self.last_card_id or
-                            current_time - self.last_scan_time > self.scan_cooldown):
-
-                        self.last_card_id = card_id
-                        self.last_scan_time = current_time
-
-                        # Log the card read
-                        self.log_card_read(card_id, self.current_card_data)
-
-                        return card_id
-
-                return None
+            # Consume whatever is available without blocking
+            waiting = self.ser.in_waiting
+            if waiting > 0:
+                self.pending_cards.extend(self.parser.feed(self.ser.read(waiting)))
+            return self._next_pending_card()
 
         except Exception as e:
             print(f"Error reading RFID card: {e}")
@@ -187,13 +387,25 @@ class RFIDReader:
         """
         start_time = time.time()
 
-        while time.time() - start_time < timeout:
-            card_id = self.read_card()
+        if self.simulation_mode or not self.ser:
+            while time.time() - start_time < timeout:
+                card_id = self.read_card()
+                if card_id:
+                    return card_id
+                time.sleep(0.1)
+            return None
+
+        while True:
+            card_id = self._next_pending_card()
             if card_id:
                 return card_id
-            time.sleep(0.1)
 
-        return None
+            remaining = timeout - (time.time() - start_time)
+            if remaining <= 0:
+                return None
+            self.ser.timeout = min(remaining, self.read_timeout)
+            data = self.ser.read(max(1, self.ser.in_waiting))
+            self.pending_cards.extend(self.parser.feed(data))
 
     def write_card(self, data):
         """
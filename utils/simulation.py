@@ -0,0 +1,266 @@
+import json
+import time
+import random
+import threading
+from collections import deque
+
+import adafruit_fingerprint
+
+
+class TracePlayer:
+    """Replays a timestamped device trace against a shared clock.
+
+    A trace is a list of events such as
+    `{"t": 1.5, "device": "rfid", "event": "tap", "uid": "93F34DC5E8"}`.
+    `speed` scales trace time (2.0 plays twice as fast); `speed=None`
+    makes every event due immediately, for throughput benchmarks.
+    """
+
+    def __init__(self, events, speed=1.0):
+        self.events = sorted(events, key=lambda e: e['t'])
+        self.speed = speed
+        self.lock = threading.Lock()
+
+        # One queue per (device, event kind) keeps peek/consume O(1)
+        self.queues = {}
+        for event in self.events:
+            key = (event['device'], event['event'])
+            self.queues.setdefault(key, deque()).append(event)
+
+        self.start_time = time.monotonic()
+
+    def now(self):
+        """Current position in trace time (seconds)"""
+        if not self.speed:
+            return float('inf')
+        return (time.monotonic() - self.start_time) * self.speed
+
+    def real_delay(self, trace_time):
+        """Real seconds until `trace_time` is reached"""
+        if not self.speed:
+            return 0.0
+        return max(0.0, (trace_time - self.now()) / self.speed)
+
+    def peek(self, device, kinds):
+        """Earliest unconsumed `device` event of one of `kinds`"""
+        with self.lock:
+            heads = [self.queues[(device, kind)][0] for kind in kinds
+                     if self.queues.get((device, kind))]
+        return min(heads, key=lambda e: e['t']) if heads else None
+
+    def consume(self, event):
+        with self.lock:
+            queue = self.queues[(event['device'], event['event'])]
+            if queue and queue[0] is event:
+                queue.popleft()
+
+    def is_due(self, event):
+        return event['t'] <= self.now()
+
+
+def card_frame(uid):
+    """Bytes the USB reader prints for one tap of card `uid`"""
+    hex_values = [uid[i:i + 2] for i in range(0, len(uid), 2)]
+    dec_values = [str(int(h, 16)) for h in hex_values]
+    return (f"Card found\r\nDec: {', '.join(dec_values)}\r\n"
+            f"Hex: {', '.join(hex_values)}\r\n").encode('utf-8')
+
+
+class SimulatedRFIDSerial:
+    """Serial-port stand-in that emits the reader's line protocol for each
+    `rfid` tap in the trace. Pass it to `RFIDReader(ser=...)`.
+    """
+
+    def __init__(self, player):
+        self.player = player
+        self.buffer = b''
+        self.timeout = 1
+        self.dtr = False
+        self.is_open = True
+        self.port = 'trace://rfid'
+
+    def _collect_due(self):
+        while True:
+            event = self.player.peek('rfid', kinds=('tap',))
+            if event is None or not self.player.is_due(event):
+                return event
+            self.player.consume(event)
+            self.buffer += card_frame(event['uid'])
+
+    @property
+    def in_waiting(self):
+        self._collect_due()
+        return len(self.buffer)
+
+    def read(self, size=1):
+        deadline = time.monotonic() + (self.timeout or 0)
+        while True:
+            pending = self._collect_due()
+            if self.buffer:
+                data, self.buffer = self.buffer[:size], self.buffer[size:]
+                return data
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return b''
+            if pending is None:
+                time.sleep(remaining)
+                return b''
+            time.sleep(min(remaining, self.player.real_delay(pending['t'])))
+
+    def reset_input_buffer(self):
+        self.buffer = b''
+
+    def close(self):
+        self.is_open = False
+
+
+class SimulatedFingerprintSensor:
+    """Stand-in for `adafruit_fingerprint.Adafruit_Fingerprint` driven by
+    `fingerprint` events: images are captured while a finger is down,
+    from a due `finger_on` until the next due `finger_off`, and each
+    `match` event decides the next compare or search result.
+    Pass it to `FingerprintReader(sensor=...)`.
+    """
+
+    TEMPLATE_SIZE = 512
+
+    def __init__(self, player, library_size=1000):
+        self.player = player
+        self.finger_id = None
+        self.confidence = None
+        self.finger_down = False
+        self.template_count = 0
+        self.library_size = library_size
+        self.security_level = 3
+        self.device_address = b'\xff\xff\xff\xff'
+        self.data_packet_size = 3
+        self.baudrate = 6
+        self.system_id = 0
+        self.status_register = 0
+        self.buffers = {1: [0] * self.TEMPLATE_SIZE, 2: [0] * self.TEMPLATE_SIZE}
+
+    def get_image(self):
+        # One press or lift per poll, so with speed=None a lift is still
+        # seen between two voters' presses
+        event = self.player.peek('fingerprint',
+                                 kinds=('finger_on', 'finger_off'))
+        if event is not None and self.player.is_due(event):
+            self.player.consume(event)
+            self.finger_down = event['event'] == 'finger_on'
+        if self.finger_down:
+            return adafruit_fingerprint.OK
+        return adafruit_fingerprint.NOFINGER
+
+    def _next_match(self):
+        event = self.player.peek('fingerprint', kinds=('match',))
+        if event is None:
+            return None
+        self.player.consume(event)
+        return event
+
+    def compare_templates(self):
+        event = self._next_match()
+        if event and event.get('matched'):
+            # Same 1-tuple the real driver leaves after a compare
+            self.confidence = (event.get('confidence', 100),)
+            return adafruit_fingerprint.OK
+        self.confidence = None
+        return adafruit_fingerprint.NOMATCH
+
+    def finger_fast_search(self):
+        event = self._next_match()
+        if event and event.get('matched'):
+            self.finger_id = event.get('finger_id', 1)
+            self.confidence = event.get('confidence', 100)
+            return adafruit_fingerprint.OK
+        self.finger_id = None
+        self.confidence = None
+        return adafruit_fingerprint.NOTFOUND
+
+    finger_search = finger_fast_search
+
+    def image_2_tz(self, slot=1):
+        return adafruit_fingerprint.OK
+
+    def create_model(self):
+        return adafruit_fingerprint.OK
+
+    def store_model(self, location, slot=1):
+        self.template_count += 1
+        return adafruit_fingerprint.OK
+
+    def load_model(self, location, slot=1):
+        return adafruit_fingerprint.OK
+
+    def delete_model(self, location):
+        return adafruit_fingerprint.OK
+
+    def get_fpdata(self, sensorbuffer="char", slot=1):
+        return list(self.buffers.get(slot, self.buffers[1]))
+
+    def send_fpdata(self, data, sensorbuffer="char", slot=1):
+        self.buffers[slot] = list(data)
+        return True
+
+    def verify_password(self):
+        return adafruit_fingerprint.OK
+
+    def read_sysparam(self):
+        return adafruit_fingerprint.OK
+
+    def set_sysparam(self, param_num, param_val):
+        return adafruit_fingerprint.OK
+
+    def count_templates(self):
+        return self.template_count
+
+    def set_led(self, color=1, mode=3, speed=0x80, cycles=0):
+        return adafruit_fingerprint.OK
+
+
+def load_trace(path):
+    """Load a JSON-lines trace file"""
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_trace(path, events):
+    with open(path, 'w') as f:
+        for event in events:
+            f.write(json.dumps(event) + '\n')
+
+
+def generate_voter_trace(uids, seed=0, tap_interval=(4.0, 8.0),
+                         mismatch_rate=0.02, repeat_rate=0.01):
+    """Build a reproducible verify trace: a card tap, a finger press and a
+    match result per voter. A fraction of voters re-tap later to exercise
+    the already-voted rejection.
+    """
+    rng = random.Random(seed)
+    events = []
+    t = 0.0
+    voted = []
+    for uid in uids:
+        t += rng.uniform(*tap_interval)
+        if voted and rng.random() < repeat_rate:
+            # Re-tap of a voter that already voted: no finger events follow
+            events.append({'t': round(t, 3), 'device': 'rfid',
+                           'event': 'tap', 'uid': rng.choice(voted)})
+            t += rng.uniform(*tap_interval)
+
+        events.append({'t': round(t, 3), 'device': 'rfid',
+                       'event': 'tap', 'uid': uid})
+        finger_on = t + rng.uniform(0.8, 2.5)
+        events.append({'t': round(finger_on, 3), 'device': 'fingerprint',
+                       'event': 'finger_on'})
+        events.append({'t': round(finger_on + rng.uniform(0.3, 0.8), 3),
+                       'device': 'fingerprint', 'event': 'finger_off'})
+        matched = rng.random() >= mismatch_rate
+        events.append({'t': round(finger_on + 0.01, 3),
+                       'device': 'fingerprint', 'event': 'match',
+                       'matched': matched,
+                       'confidence': rng.randint(60, 250) if matched else 0})
+        if matched:
+            voted.append(uid)
+    return events
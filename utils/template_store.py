@@ -0,0 +1,72 @@
+import os
+import re
+import hashlib
+
+
+TEMPLATE_DIR = 'data/templates'
+
+
+class FingerprintTemplateStore:
+    """Host-side fingerprint template library keyed by RFID uid.
+
+    Templates are the raw char-buffer bytes downloaded from the sensor,
+    one file per voter, so capacity is limited by disk rather than by
+    the sensor's on-chip flash.
+    """
+
+    def __init__(self, directory=TEMPLATE_DIR):
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, uid):
+        safe_uid = re.sub(r'[^A-Za-z0-9_-]', '_', str(uid))
+        return os.path.join(self.directory, f"{safe_uid}.tpl")
+
+    def save(self, uid, template):
+        """Store a template (list of ints or bytes) for `uid`"""
+        path = self._path(uid)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(bytes(template))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return path
+
+    def load(self, uid):
+        """Return the template for `uid` as a list of ints, or None"""
+        path = self._path(uid)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return list(f.read())
+        except IOError as e:
+            print(f"Error loading template for {uid}: {e}")
+            return None
+
+    def has(self, uid):
+        return os.path.exists(self._path(uid))
+
+    def delete(self, uid):
+        path = self._path(uid)
+        if os.path.exists(path):
+            os.remove(path)
+            return True
+        return False
+
+    def uids(self):
+        """List the uids with a stored template"""
+        return sorted(
+            name[:-len('.tpl')] for name in os.listdir(self.directory)
+            if name.endswith('.tpl'))
+
+    def count(self):
+        return len(self.uids())
+
+    def checksum(self, uid):
+        """SHA-256 of the stored template, or None if missing"""
+        template = self.load(uid)
+        if template is None:
+            return None
+        return hashlib.sha256(bytes(template)).hexdigest()
@@ -0,0 +1,299 @@
+import os
+import json
+import threading
+from datetime import datetime
+
+
+INDEX_FILE = 'data/voter_index.json'
+VOTERS_FILE = 'data/voters.json'
+COMMIT_FILE = 'votes/commit.json'
+SECRETS_FILE = 'votes/secrets.json'
+
+
+def atomic_write_json(path, data, indent=2):
+    """Write JSON to a temp file, fsync it and rename it over `path`"""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    # Make the rename itself durable
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    except OSError:
+        pass
+
+
+class VoterIndex:
+    """Single status index of voters keyed by RFID uid.
+
+    Each entry holds the voter's registration details, the `has_voted`
+    flag and, once voted, the vote commit and its reveal secret. Votes are
+    appended to a journal next to the index (one fsynced JSON line per
+    vote, so the flag, the commit and the secret land together) instead
+    of rewriting the whole
+    index; the journal is folded back into the index at startup and every
+    `compact_every` votes.
+    """
+    _instance = None  # Singleton instance
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super(VoterIndex, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self, index_file=INDEX_FILE, migrate_legacy=True,
+                 compact_every=1000):
+        if hasattr(self, 'initialized') and self.initialized:
+            return  # Already initialized
+
+        self.index_file = index_file
+        self.journal_file = os.path.splitext(index_file)[0] + '_votes.jsonl'
+        self.migrate_legacy = migrate_legacy
+        self.compact_every = compact_every
+        self.journal_entries = 0
+        self.lock = threading.RLock()
+        self.voters = self.load_index()
+        # Compacting at startup also drops a torn last line, which the
+        # next append would otherwise run into
+        if os.path.exists(self.journal_file) and os.path.getsize(self.journal_file):
+            self.compact()
+
+        self.initialized = True
+        print(f"[INFO] VoterIndex loaded with {len(self.voters)} voters")
+
+    def load_index(self):
+        """Load the index and replay the vote journal over it, building
+        the index from legacy files on first run
+        """
+        voters = None
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, 'r') as f:
+                    voters = json.load(f)
+            except Exception as e:
+                print(f"Error loading voter index: {e}")
+
+        if voters is None:
+            voters = {}
+            if self.migrate_legacy:
+                voters = self._build_from_legacy_files()
+                if voters:
+                    atomic_write_json(self.index_file, voters)
+
+        self._replay_journal(voters)
+        return voters
+
+    def _replay_journal(self, voters):
+        """Apply journalled votes to `voters`. Replaying a vote that the
+        index already holds is harmless, so a crash during compaction
+        loses nothing.
+        """
+        self.journal_entries = 0
+        if not os.path.exists(self.journal_file):
+            return
+        with open(self.journal_file, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # Torn last line from a crash mid-append
+                uid = record['uid']
+                entry = voters.setdefault(uid, {'uid': uid})
+                entry['has_voted'] = True
+                entry['voted_at'] = record.get('voted_at')
+                entry['commit'] = record.get('commit')
+                if record.get('secret') is not None:
+                    entry['secret'] = record['secret']
+                self.journal_entries += 1
+
+    def compact(self):
+        """Fold the vote journal into the index file and empty it"""
+        with self.lock:
+            atomic_write_json(self.index_file, self.voters)
+            with open(self.journal_file, 'w') as f:
+                os.fsync(f.fileno())
+            self.journal_entries = 0
+
+    def _build_from_legacy_files(self):
+        """Merge data/voters.json, votes/commit.json and votes/secrets.json
+        into index entries
+        """
+        voters = {}
+        try:
+            if os.path.exists(VOTERS_FILE):
+                with open(VOTERS_FILE, 'r') as f:
+                    for voter in json.load(f):
+                        uid = voter.get('uid')
+                        if uid:
+                            voters[uid] = dict(voter)
+        except Exception as e:
+            print(f"Error reading voters file: {e}")
+
+        try:
+            if os.path.exists(COMMIT_FILE):
+                with open(COMMIT_FILE, 'r') as f:
+                    for uid, commit in json.load(f).items():
+                        entry = voters.setdefault(uid, {'uid': uid})
+                        entry['has_voted'] = True
+                        entry['commit'] = commit
+        except Exception as e:
+            print(f"Error reading commit file: {e}")
+
+        try:
+            if os.path.exists(SECRETS_FILE):
+                with open(SECRETS_FILE, 'r') as f:
+                    for uid, secret in json.load(f).items():
+                        if uid in voters:
+                            voters[uid]['secret'] = secret
+        except Exception as e:
+            print(f"Error reading secrets file: {e}")
+
+        for entry in voters.values():
+            entry.setdefault('has_voted', False)
+        return voters
+
+    def get(self, uid):
+        """Return a copy of the entry for `uid` or None"""
+        with self.lock:
+            entry = self.voters.get(uid)
+            return dict(entry) if entry else None
+
+    def is_registered(self, uid):
+        with self.lock:
+            return uid in self.voters
+
+    def has_voted(self, uid):
+        with self.lock:
+            entry = self.voters.get(uid)
+            return bool(entry and entry.get('has_voted'))
+
+    def add_voter(self, voter):
+        """Add a newly registered voter. Returns False if uid exists"""
+        uid = voter.get('uid')
+        with self.lock:
+            if not uid or uid in self.voters:
+                return False
+            entry = dict(voter)
+            entry['has_voted'] = False
+            self.voters[uid] = entry
+            atomic_write_json(self.index_file, self.voters)
+            return True
+
+    def add_voters(self, voters):
+        """Add many voters with a single write. Returns the number added"""
+        added = 0
+        with self.lock:
+            for voter in voters:
+                uid = voter.get('uid')
+                if uid and uid not in self.voters:
+                    self.voters[uid] = dict(voter, has_voted=False)
+                    added += 1
+            if added:
+                atomic_write_json(self.index_file, self.voters)
+        return added
+
+    def update_voters(self, updates):
+        """Merge {uid: {field: value}} into existing entries with a single
+        write. Unknown uids are skipped; returns the number updated.
+        """
+        updated = 0
+        with self.lock:
+            for uid, fields in updates.items():
+                entry = self.voters.get(uid)
+                if entry is None:
+                    continue
+                self.voters[uid] = dict(entry, **fields)
+                updated += 1
+            if updated:
+                atomic_write_json(self.index_file, self.voters)
+        return updated
+
+    def record_vote(self, uid, commit, secret=None):
+        """Flip `has_voted` and store the commit (and the reveal `secret`,
+        if any) with one journal append.
+
+        Returns False without writing if the voter has already voted.
+        """
+        with self.lock:
+            entry = self.voters.get(uid)
+            if entry and entry.get('has_voted'):
+                return False
+
+            voted_at = datetime.now().isoformat()
+            record = {'uid': uid, 'voted_at': voted_at, 'commit': commit}
+            if secret is not None:
+                record['secret'] = secret
+            line = json.dumps(record)
+            os.makedirs(os.path.dirname(self.journal_file) or '.',
+                        exist_ok=True)
+            # Memory is only updated once the vote is durable
+            with open(self.journal_file, 'a') as f:
+                f.write(line + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+            updated = dict(entry) if entry else {'uid': uid}
+            updated['has_voted'] = True
+            updated['voted_at'] = voted_at
+            updated['commit'] = commit
+            if secret is not None:
+                updated['secret'] = secret
+            self.voters[uid] = updated
+            self.journal_entries += 1
+
+            if self.compact_every and self.journal_entries >= self.compact_every:
+                try:
+                    self.compact()
+                except (IOError, OSError) as e:
+                    # The journal still holds every vote
+                    print(f"Error compacting voter index: {e}")
+            return True
+
+    def get_commits(self):
+        """Return {uid: commit} for every offline commit-reveal vote.
+
+        Votes sent straight to the contract (commit with a `tx_hash` but no
+        `vote_hash`) have nothing left to commit and are skipped.
+        """
+        with self.lock:
+            return {
+                uid: dict(entry['commit'])
+                for uid, entry in self.voters.items()
+                if entry.get('has_voted') and entry.get('commit')
+                and entry['commit'].get('vote_hash')
+            }
+
+    def export_commits(self, path=COMMIT_FILE):
+        """Write the commit file consumed by deploy_votes.py"""
+        atomic_write_json(path, self.get_commits(), indent=4)
+
+    def get_secrets(self):
+        """Return {uid: secret} for every vote recorded with a secret"""
+        with self.lock:
+            return {
+                uid: dict(entry['secret'])
+                for uid, entry in self.voters.items()
+                if entry.get('has_voted') and entry.get('secret')
+            }
+
+    def export_secrets(self, path=SECRETS_FILE):
+        """Write the secrets file consumed by deploy_votes.py.
+
+        Secrets already in the file (e.g. copied from another machine) are
+        kept; the index wins for uids it knows.
+        """
+        secrets = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                secrets = json.load(f)
+        secrets.update(self.get_secrets())
+        atomic_write_json(path, secrets, indent=4)
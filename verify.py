@@ -4,7 +4,7 @@ from kivy.uix.label import Label
 from kivy.uix.floatlayout import FloatLayout
 from kivy.uix.popup import Popup
 from kivy.graphics import Color, RoundedRectangle
-from kivy.clock import Clock
+from kivy.clock import Clock, mainthread
 from kivy.uix.image import Image
 from kivy.app import App
 
@@ -13,10 +13,12 @@ from components import RoundedButton, SecondaryButton, RoundedBox
 import json
 import os
 import cv2
+import time
 from datetime import datetime
-from utils.rfid import RFIDReader
-from utils.fingerprint import FingerprintReader
+from utils.device_manager import DeviceManager
 from utils.camera import CameraHandler
+from utils.voter_index import VoterIndex
+from utils.face_pipeline import FacePipeline, format_timings
 
 try:
     import face_recognition
@@ -27,14 +29,22 @@ except ImportError:
 
 
 class VerificationScreen(Screen):
+    # Seconds to wait for a usable camera frame before giving up
+    FACE_WAIT = 3.0
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
         # Initialize hardware components
-        self.rfid_reader = RFIDReader(callback=self.on_rfid_card_detected)
-        self.fingerprint_reader = FingerprintReader(
-            logger=self.update_status)
+        self.devices = DeviceManager()
+        self.rfid_subscription = None
+        self.fingerprint = self.devices.lease(
+            'fingerprint', self, logger=self.update_status)
         self.camera_handler = None
+        self.voter_index = VoterIndex()
+        self.fingerprint_job = None
+        self.face_pipeline = FacePipeline()
+        self.face_job = None
 
         # Verification data
         self.verified_user = None
@@ -286,6 +296,7 @@ class VerificationScreen(Screen):
         """Load face verification step with enlarged camera"""
         if self.camera_handler is None:
             self.camera_handler = CameraHandler()
+        self.camera_handler.acquire(self)
 
         # Instruction
         instruction = Label(
@@ -338,6 +349,10 @@ class VerificationScreen(Screen):
         self.action_btn.text = 'Scan Face'
         self.action_btn.disabled = False
 
+        # Live alignment hint from the preview face tracker
+        Clock.unschedule(self.update_face_hint)
+        Clock.schedule_interval(self.update_face_hint, 0.25)
+
     def load_complete_step(self):
         """Load verification complete step"""
         # Success message
@@ -437,12 +452,17 @@ class VerificationScreen(Screen):
         self.verification_start_time = datetime.now()
         self.status_label.text = 'Scanning for RFID card...'
         self.action_btn.disabled = True
-        Clock.schedule_interval(self.check_rfid, 0.5)
+        self.rfid_subscription = self.devices.read_card_async(
+            self.on_rfid_card_detected)
+
+    def stop_rfid_verification(self):
+        if self.rfid_subscription:
+            self.rfid_subscription.cancel()
+            self.rfid_subscription = None
 
-    def check_rfid(self, dt):
-        """Check for RFID card"""
-        uid = self.rfid_reader.read_card()
-        # uid = "46OCMOC7"
+    def check_rfid(self, uid):
+        """Look up the card that was read"""
+        self.rfid_subscription = None
         if uid:
             self.status_label.text = f'Card detected: {uid}'
             self.verified_user = self.find_user_by_uid(uid)
@@ -452,126 +472,162 @@ class VerificationScreen(Screen):
                     "User not found", "This RFID card is not registered. Please register first.")
                 self.status_label.text = 'Card not registered'
                 self.action_btn.disabled = False
-                return False
+                return
+
+            # Reject voters who already voted before any biometric work
+            if self.verified_user.get('has_voted', False):
+                self.show_error_popup(
+                    "Already Voted", "This card has already been used to vote.")
+                self.status_label.text = 'Card already voted'
+                self.verified_user = None
+                self.action_btn.disabled = False
+                return
 
             # Move to next step
             self.current_step += 1
             Clock.schedule_once(lambda dt: self.load_step(), 1.0)
-            return False  # Stop scheduling
-        return True  # Continue checking
 
     def start_fingerprint_verification(self):
-        """Start fingerprint verification"""
+        """Start fingerprint verification on the biometric worker"""
         self.fp_status_label.text = 'Place your finger on the sensor...'
         self.action_btn.disabled = True
 
-        def verify_fingerprint(dt):
-            fid, confidence = self.fingerprint_reader.search_finger()
-            expected_id = self.verified_user.get('fingerprint_id')
+        self.fingerprint_job = self.fingerprint.submit(
+            'verify_voter', self.verified_user,
+            on_result=self.on_fingerprint_verified,
+            on_error=self.on_fingerprint_error)
 
-            if fid is not None and str(fid) == str(expected_id):
-                self.fp_status_label.text = f'Fingerprint verified! (Confidence: {confidence})'
-                # Move to next step
-                self.current_step += 1
-                Clock.schedule_once(lambda dt: self.load_step(), 1.5)
-            else:
-                self.show_error_popup(
-                    "Fingerprint Mismatch", "Fingerprint verification failed. Please try again.")
-                self.fp_status_label.text = 'Fingerprint mismatch - try again'
-                self.action_btn.disabled = False
+    def on_fingerprint_verified(self, result):
+        """Fingerprint verification result (called on the main thread)"""
+        matched, confidence = result
+        if matched:
+            self.fp_status_label.text = f'Fingerprint verified! (Confidence: {confidence})'
+            # Move to next step
+            self.current_step += 1
+            Clock.schedule_once(lambda dt: self.load_step(), 1.5)
+        else:
+            self.show_error_popup(
+                "Fingerprint Mismatch", "Fingerprint verification failed. Please try again.")
+            self.fp_status_label.text = 'Fingerprint mismatch - try again'
+            self.action_btn.disabled = False
 
-        Clock.schedule_once(verify_fingerprint, 0.1)
+    def on_fingerprint_error(self, error):
+        print(f"Fingerprint verification error: {error}")
+        self.fp_status_label.text = 'Fingerprint sensor error - try again'
+        self.action_btn.disabled = False
+
+    def cancel_fingerprint_verification(self):
+        """Cancel a running fingerprint verification"""
+        if self.fingerprint_job:
+            self.fingerprint_job.cancel()
+            self.fingerprint_job = None
 
     def start_face_verification(self):
-        """Start face verification"""
+        """Start face verification on the biometric worker"""
         if not FACE_RECOGNITION_AVAILABLE:
             self.show_error_popup(
                 "Face Recognition Unavailable", "Face recognition library not installed.")
             return
 
+        # Faces are keyed by card uid; faces stored before that were
+        # keyed by name
+        known_encodings = (
+            self.camera_handler.get_face_encodings(self.verified_user['uid'])
+            or self.camera_handler.get_face_encodings(
+                self.verified_user.get('name')))
+        if not known_encodings:
+            self.show_error_popup(
+                "No Face Data", "No face data found for this user. Please re-register.")
+            self.face_status_label.text = 'No face data found'
+            return
+
         self.face_status_label.text = 'Analyzing face... Please look at camera'
         self.action_btn.disabled = True
+        deadline = time.monotonic() + self.FACE_WAIT
 
         def verify_face(dt):
-            frame = self.camera_handler.frame
-            if frame is None:
+            if self.camera_handler.frame is None:
                 self.show_error_popup(
                     "Camera Error", "Unable to access camera. Please try again.")
                 self.face_status_label.text = 'Camera error - try again'
                 self.action_btn.disabled = False
                 return
 
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            face_locations = face_recognition.face_locations(rgb_frame)
-            face_encodings = face_recognition.face_encodings(
-                rgb_frame, face_locations)
-
-            if not face_encodings:
-                self.show_error_popup(
-                    "No Face Detected", "No face detected in camera. Please position yourself properly.")
-                self.face_status_label.text = 'No face detected - try again'
+            # Only encode a frame that passed the quality checks; wait a
+            # little for one if the voter is still settling
+            frame, quality, _ = self.camera_handler.get_best_still()
+            if frame is None:
+                if time.monotonic() < deadline:
+                    self.face_status_label.text = self.camera_handler.alignment_hint()
+                    Clock.schedule_once(verify_face, 0.1)
+                    return
+                self.face_status_label.text = f'{self.camera_handler.quality_hint()} - try again'
                 self.action_btn.disabled = False
                 return
 
-            known_encoding = self.camera_handler.face_encodings_db.get(
-                self.verified_user['name'], {}).get('encodings')
-
-            if known_encoding:
-                results = face_recognition.compare_faces(
-                    known_encoding, face_encodings[0])
-                if results[0]:
-                    self.face_status_label.text = 'Face verified successfully!'
-                    # Move to final step
-                    self.current_step += 1
-                    Clock.schedule_once(lambda dt: self.load_step(), 1.5)
-                else:
-                    self.show_error_popup(
-                        "Face Mismatch", "Face verification failed. This doesn't match your registered face.")
-                    self.face_status_label.text = 'Face mismatch - try again'
-                    self.action_btn.disabled = False
-            else:
-                self.show_error_popup(
-                    "No Face Data", "No face data found for this user. Please re-register.")
-                self.face_status_label.text = 'No face data found'
-                self.action_btn.disabled = False
+            # The preview tracker already knows where the face is; the
+            # encoder gets the full-resolution still
+            self.face_job = self.face_pipeline.submit(
+                frame, known_encodings, face_box=quality['face_box'],
+                on_result=self.on_face_verified,
+                on_error=self.on_face_error)
 
-        Clock.schedule_once(verify_face, 1.0)
+        verify_face(0)
 
-    def on_rfid_card_detected(self, card_id):
-        """Callback when RFID card is detected"""
-        if self.rfid_scanning and self.steps[self.current_step] == 'rfid':
-            # Use Clock.schedule_once to update UI from main thread
-            Clock.schedule_once(
-                lambda dt: self.handle_rfid_detection(card_id), 0)
+    def update_face_hint(self, dt):
+        """Show the tracker's alignment hint while waiting on the voter"""
+        if self.verification_steps[self.current_step] != 'face':
+            return False  # Left the face step, stop the interval
+        if not self.action_btn.disabled and self.face_job is None:
+            self.face_status_label.text = self.camera_handler.alignment_hint()
 
-    def find_user_by_uid(self, uid):
-        """Find user by RFID UID - Enhanced with better debugging"""
-        if not os.path.exists('data/voters.json'):
-            print("voters.json file not found!")
-            return None
+    def on_face_verified(self, result):
+        """Face pipeline result (called on the main thread)"""
+        self.face_job = None
+        print(f"Face verification: {format_timings(result['timings'])}")
 
-        try:
-            with open('data/voters.json', 'r') as f:
-                voters = json.load(f)
+        if result['encoding'] is None:
+            self.show_error_popup(
+                "No Face Detected", "No face detected in camera. Please position yourself properly.")
+            self.face_status_label.text = 'No face detected - try again'
+            self.action_btn.disabled = False
+        elif result['matched']:
+            self.face_status_label.text = 'Face verified successfully!'
+            # Move to final step
+            self.current_step += 1
+            Clock.schedule_once(lambda dt: self.load_step(), 1.5)
+        else:
+            self.show_error_popup(
+                "Face Mismatch", "Face verification failed. This doesn't match your registered face.")
+            self.face_status_label.text = 'Face mismatch - try again'
+            self.action_btn.disabled = False
 
-            print(f"Looking for UID: {uid}")
-            print(f"Total voters in database: {len(voters)}")
+    def on_face_error(self, error):
+        self.face_job = None
+        print(f"Face verification error: {error}")
+        self.face_status_label.text = 'Face verification error - try again'
+        self.action_btn.disabled = False
 
-            for voter in voters:
-                stored_uid = voter.get('uid')
-                print(
-                    f"Checking voter: {voter.get('name', 'Unknown')} with UID: {stored_uid}")
+    def cancel_face_verification(self):
+        """Drop a running face verification"""
+        if self.face_job:
+            self.face_job.cancel()
+            self.face_job = None
 
-                if stored_uid == uid:
-                    print(f"Match found! Voter: {voter.get('name')}")
-                    return voter
+    def on_rfid_card_detected(self, card_id):
+        """Callback when RFID card is detected (reader thread)"""
+        if self.verification_steps[self.current_step] == 'rfid':
+            # Use Clock.schedule_once to update UI from main thread
+            Clock.schedule_once(lambda dt: self.check_rfid(card_id), 0)
 
+    def find_user_by_uid(self, uid):
+        """Find user by RFID UID in the voter status index"""
+        voter = self.voter_index.get(uid)
+        if voter:
+            print(f"Match found! Voter: {voter.get('name')}")
+        else:
             print(f"No match found for UID: {uid}")
-
-        except Exception as e:
-            print(f"Error loading voter data: {e}")
-
-        return None
+        return voter
 
     def go_to_voting(self):
         """Navigate to voting screen"""
@@ -597,6 +653,10 @@ class VerificationScreen(Screen):
 
     def reset_verification(self):
         """Reset verification state"""
+        self.stop_rfid_verification()
+        self.cancel_fingerprint_verification()
+        self.cancel_face_verification()
+        Clock.unschedule(self.update_face_hint)
         self.current_step = 0
         self.verified_user = None
         self.verification_start_time = None
@@ -604,7 +664,7 @@ class VerificationScreen(Screen):
         # Clean up camera if initialized
         if self.camera_handler:
             try:
-                self.camera_handler.release()
+                self.camera_handler.release(self)
                 self.camera_handler = None
             except:
                 pass
@@ -642,6 +702,7 @@ class VerificationScreen(Screen):
         ok_button.bind(on_press=popup.dismiss)
         popup.open()
 
+    @mainthread
     def update_status(self, message):
         """Update status message - called by hardware components"""
         if hasattr(self, 'status_label'):
@@ -663,13 +724,16 @@ class VerificationScreen(Screen):
 
     def on_leave(self):
         """Called when screen is left"""
-        # Stop any running clocks
-        Clock.unschedule(self.check_rfid)
+        # Stop any running scans
+        self.stop_rfid_verification()
+        self.cancel_fingerprint_verification()
+        self.cancel_face_verification()
+        Clock.unschedule(self.update_face_hint)
 
         # Clean up resources
         if self.camera_handler:
             try:
-                self.camera_handler.release()
+                self.camera_handler.release(self)
                 self.camera_handler = None
             except:
                 pass